@@ -59,6 +59,41 @@ const PostBox = ({ post, poster, isUserEditable }) => {
   //   }
   // }, [post.author, post.contentType, post.id, post.visibility]);
 
+  // Lists and feeds send the /image/ url of image posts instead of the image, fetch the small variant with the JWT
+  const isImageLink =
+    post.contentType?.startsWith('image/') && /^https?:\/\//.test(post.content || '');
+  const [linkedImageUrl, setLinkedImageUrl] = useState(null);
+
+  useEffect(() => {
+    if (!isImageLink) return undefined;
+
+    let objectUrl = null;
+    let cancelled = false;
+    const params = post.thumbnail
+      ? Object.fromEntries(new URL(post.thumbnail).searchParams)
+      : {};
+    getPostImageUrl(
+      post.author.id.split('/')[5],
+      post.id.split('/').filter(Boolean).pop(),
+      params
+    )
+      .then((url) => {
+        objectUrl = url;
+        if (cancelled) URL.revokeObjectURL(url);
+        else setLinkedImageUrl(url);
+      })
+      .catch((error) => console.error('Error fetching post image:', error));
+
+    return () => {
+      cancelled = true;
+      if (objectUrl) URL.revokeObjectURL(objectUrl);
+    };
+  }, [isImageLink, post.author, post.id, post.thumbnail]);
+
+  const postImageSrc = isImageLink
+    ? linkedImageUrl
+    : `${post.content?.startsWith('data:') ? '' : `data:${post.contentType},`}${post.content}`;
+
   // Fetch post have visibility of SHARED it will take the original posts info
   useEffect(() => {
     const fetchSharedPostDetails = async () => {
@@ -169,18 +204,25 @@ const PostBox = ({ post, poster, isUserEditable }) => {
         {post.contentType?.startsWith('image/') &&
           (originalPost && post.visibility === 'SHARED' ? (
             <img
-            src={`${post.content.startsWith('data:') ? '' : `data:${post.contentType},`}${post.content}`}
+              src={postImageSrc}
               alt="post share"
+              loading="lazy"
             />
           ) : (
             <img
-              src={`${post.content.startsWith('data:') ? '' : `data:${post.contentType},`}${post.content}`}
+              src={postImageSrc}
               alt="post"
+              loading="lazy"
             />
           ))}
         {post.contentType === 'text/markdown' && (
           <div dangerouslySetInnerHTML={getMarkdownText(post.content)} />
         )}
+        {post.content_truncated && (
+          <Link to={`/post/${post.id.split('/').filter(Boolean).pop()}`}>
+            Read more
+          </Link>
+        )}
       </div>
 
       <div className="post-footer">
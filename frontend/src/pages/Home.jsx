@@ -19,7 +19,10 @@ const Home = () => {
   const [results, setResults] = useState([]);
   const [authorizedAuthors, setAuthorizedAuthors] = useState([]);
   const [followingStatus, setFollowingStatus] = useState({});
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const hasRun = useRef(false);
+  const loadMoreRef = useRef(null);
 
   useEffect(() => {
     if (hasRun.current) {
@@ -41,88 +44,117 @@ const Home = () => {
     setSelectedFilter(filter);
   };
 
-  useEffect(() => {
-    const fetchPosts = async () => {
-      try {
-        const response = await api.get('posts/'); // Using axios instance to fetch posts
-        const data = response.data; // Accessing data directly from the response
-
-        // Set posts directly from the response structure
-        setPosts(data.posts);
-
-        // Set authorized authors
-        setAuthorizedAuthors(data.authorized_authors_per_post); // Set authorized authors data
-
-        // Fetch author profiles based on the retrieved posts
-        const profiles = await Promise.all(
-          data.posts.map(async (post) => {
-            try {
-              const profile = await getAuthorProfile(
-                post.author.id.split('/')[5]
-              );
-              return {
-                authorId: post.author.id.split('/')[5],
-                displayName: profile.displayName,
-                profileImage: profile.profileImage,
-              };
-            } catch (profileError) {
-              console.error(
-                `Error fetching profile for author ${post.author.id.split('/')[5]}:`,
-                profileError
-              );
-              return {
-                id: post.id, // ID url
-                authorId: post.author.id.split('/')[5],
-                displayName: null,
-                profileImage: null,
-              };
-            }
-          })
-        );
-
-        const profileMap = profiles.reduce(
-          (acc, { authorId, displayName, profileImage }) => {
-            acc[authorId] = { displayName, profileImage };
-            return acc;
-          },
-          {}
-        );
-        setAuthorProfiles(profileMap);
-
-        const currentUserId = Cookies.get('author_id');
-        const followingPromises = data.posts.map((post) =>
-          checkIfFollowing(post.author.id.split('/')[5], currentUserId)
-        );
-
-        const followingResponses = await Promise.all(followingPromises);
-        const followingStatusMap = {};
-
-        followingResponses.forEach((response, index) => {
-          if (response && response.data && response.data.status) {
-            followingStatusMap[data.posts[index].author.id.split('/')[5]] =
-              response.data.status === 'Following';
+  // Fetch a page of the stream, pass the cursor from the previous page to get the next one
+  const fetchPosts = async (cursor = null) => {
+    try {
+      const response = await api.get('posts/', {
+        params: cursor ? { cursor } : {},
+      }); // Using axios instance to fetch posts
+      const data = response.data; // Accessing data directly from the response
+
+      // The first page replaces the posts, later pages are appended
+      setPosts((prevPosts) =>
+        cursor ? [...prevPosts, ...data.posts] : data.posts
+      );
+      setNextCursor(data.next);
+
+      // Set authorized authors
+      setAuthorizedAuthors((prevAuthorized) =>
+        cursor
+          ? [...prevAuthorized, ...data.authorized_authors_per_post]
+          : data.authorized_authors_per_post
+      ); // Set authorized authors data
+
+      // Fetch author profiles based on the retrieved posts
+      const profiles = await Promise.all(
+        data.posts.map(async (post) => {
+          try {
+            const profile = await getAuthorProfile(
+              post.author.id.split('/')[5]
+            );
+            return {
+              authorId: post.author.id.split('/')[5],
+              displayName: profile.displayName,
+              profileImage: profile.profileImage,
+            };
+          } catch (profileError) {
+            console.error(
+              `Error fetching profile for author ${post.author.id.split('/')[5]}:`,
+              profileError
+            );
+            return {
+              id: post.id, // ID url
+              authorId: post.author.id.split('/')[5],
+              displayName: null,
+              profileImage: null,
+            };
           }
-        });
-
-        setFollowingStatus(followingStatusMap);
-      } catch (err) {
-        if (
-          err.response &&
-          err.response.data &&
-          err.response.data.status === 'Follow request not found'
-        ) {
-          console.log('Follow request not found');
-        } else {
-          setError(err.message);
+        })
+      );
+
+      const profileMap = profiles.reduce(
+        (acc, { authorId, displayName, profileImage }) => {
+          acc[authorId] = { displayName, profileImage };
+          return acc;
+        },
+        {}
+      );
+      setAuthorProfiles((prevProfiles) => ({ ...prevProfiles, ...profileMap }));
+
+      const currentUserId = Cookies.get('author_id');
+      const followingPromises = data.posts.map((post) =>
+        checkIfFollowing(post.author.id.split('/')[5], currentUserId)
+      );
+
+      const followingResponses = await Promise.all(followingPromises);
+      const followingStatusMap = {};
+
+      followingResponses.forEach((response, index) => {
+        if (response && response.data && response.data.status) {
+          followingStatusMap[data.posts[index].author.id.split('/')[5]] =
+            response.data.status === 'Following';
         }
-      } finally {
-        setLoading(false);
+      });
+
+      setFollowingStatus((prevStatus) => ({
+        ...prevStatus,
+        ...followingStatusMap,
+      }));
+    } catch (err) {
+      if (
+        err.response &&
+        err.response.data &&
+        err.response.data.status === 'Follow request not found'
+      ) {
+        console.log('Follow request not found');
+      } else {
+        setError(err.message);
       }
-    };
+    } finally {
+      setLoading(false);
+      setLoadingMore(false);
+    }
+  };
 
+  useEffect(() => {
     fetchPosts();
   }, []);
 
+  // Infinite scroll: fetch the next page when the bottom of the list comes into view
+  useEffect(() => {
+    if (!nextCursor || !loadMoreRef.current) {
+      return;
+    }
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting && !loadingMore) {
+        setLoadingMore(true);
+        fetchPosts(nextCursor);
+      }
+    });
+    observer.observe(loadMoreRef.current);
+    return () => observer.disconnect();
+  }, [nextCursor, loadingMore]);
+
   if (loading) {
     return <p>Loading...</p>;
   }
@@ -227,6 +259,9 @@ const Home = () => {
           ) : (
             <p>No posts available.</p>
           )}
+          {nextCursor && (
+            <div ref={loadMoreRef}>{loadingMore && <p>Loading...</p>}</div>
+          )}
         </div>
       </div>
       <div className="follow-request-container">
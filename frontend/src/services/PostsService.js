@@ -71,11 +71,12 @@ export const createPost = async (authorSerial, postData) => {
 };
 
 // URL: ://service/api/authors/{AUTHOR_SERIAL}/posts/{POST_SERIAL}/image
-export const getPostImageUrl = async (authorSerial, postSerial) => {
+// params: optional { w, fmt, v } to get a resized variant (e.g. the query string of post.thumbnail)
+export const getPostImageUrl = async (authorSerial, postSerial, params = {}) => {
   try {
     const response = await api.get(
       `authors/${authorSerial}/posts/${postSerial}/image/`,
-      { responseType: 'blob' }
+      { responseType: 'blob', params }
     );
 
     const imageUrl = URL.createObjectURL(response.data);
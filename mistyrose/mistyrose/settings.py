@@ -113,6 +113,21 @@ else:
             "NAME": BASE_DIR / "db.sqlite3",
         }
     }
+
+# Cache shared by every process (web and workers) when REDIS_URL is set, per process otherwise
+if os.environ.get("REDIS_URL") != None:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
       
 
 # Password validation
@@ -156,10 +171,29 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    # images of image posts, stored once per sha256 of their bytes (see posts/blobs.py)
+    # - swap the backend for any Django storage (S3, GCS, ...) in production
+    'blobs': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': MEDIA_ROOT / 'blobs',
+            'base_url': MEDIA_URL + 'blobs/',
+            'allow_overwrite': True,  # same name means same bytes
+        },
+    },
+}
+
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.AuthorJWTAuthentication',  # JWT, also sets request.author
         'node.authentication.NodeAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
@@ -183,4 +217,64 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 APPEND_SLASH = True
 
 # Imgur API
-IMGUR_CLIENT_ID = 'd205e7a60257aba'
\ No newline at end of file
+IMGUR_CLIENT_ID = 'd205e7a60257aba'
+
+# Federation outbox, delivered by `python manage.py deliver_outbox` (see node/utils.py)
+OUTBOX_WORKERS = 8  # concurrent deliveries per worker process
+OUTBOX_MAX_PER_NODE = 2  # concurrent deliveries to the same remote node
+OUTBOX_CLAIM_TIMEOUT = 300  # seconds before a message claimed by a dead worker is sent again
+OUTBOX_MAX_ATTEMPTS = 8  # failed deliveries before a message is moved to the dead letters
+OUTBOX_RETRY_BASE_DELAY = 30  # seconds, doubled after every failed attempt
+OUTBOX_RETRY_MAX_DELAY = 6 * 60 * 60  # seconds
+OUTBOX_BATCH_SIZE = 50  # messages per request to nodes with a batch inbox (Node.supports_batch_inbox)
+
+# Outbound HTTP to remote nodes (see node/client.py)
+NODE_HTTP_POOL_SIZE = 10  # keep-alive connections kept per node
+NODE_HTTP_CONNECT_TIMEOUT = 3.05  # seconds
+NODE_HTTP_READ_TIMEOUT = 10  # seconds
+
+# Circuit breaker per remote node (see node/health.py)
+NODE_BREAKER_WINDOW = 50  # recent calls used for the error rate and latency percentiles
+NODE_BREAKER_MIN_CALLS = 10  # don't open the breaker before seeing this many calls
+NODE_BREAKER_ERROR_RATE = 0.5  # open the breaker when at least this share of recent calls failed
+NODE_BREAKER_COOLDOWN = 60  # seconds an open breaker fails fast before letting a probe call through
+NODE_HEALTH_CACHE_TIMEOUT = 5  # seconds a process trusts the breaker state it last read, calls to a healthy node don't query it
+NODE_HEALTH_FLUSH_EVERY = 20  # successful calls a process keeps before writing them to NodeHealth, failures are written right away
+
+# Resized/re-encoded variants of images, ?w=<width>&fmt=<webp|jpeg|png> (see posts/images.py)
+IMAGE_WIDTHS = [64, 160, 320, 640, 1280]  # requested widths are rounded up to one of these
+IMAGE_THUMBNAIL_WIDTH = 320  # variant referenced by the feed
+IMAGE_DERIVATIVE_DIR = MEDIA_ROOT / 'derivatives'
+IMAGE_DERIVATIVE_CACHE_SIZE = 256 * 1024 * 1024  # bytes, least recently used variants are deleted past this
+IMAGE_CACHE_EVICT_EVERY = 100  # files written to an image cache directory between two evictions (walking it isn't free)
+PROFILE_IMAGE_HOSTS = ['i.imgur.com', 'imgur.com', 'cdn.pixabay.com']  # profile image urls redirected to, with our own and our nodes' hosts
+
+# Feeds and lists of posts (PostListSerializer) cut text longer than this, image posts link to /image/ instead
+POST_LIST_CONTENT_LENGTH = 2000  # characters
+
+# Images of remote markdown posts, proxied and cached by /api/posts/images/proxy/ (see posts/remote_images.py)
+REMOTE_IMAGE_WORKERS = 4  # background fetches at the same time
+REMOTE_IMAGE_CACHE_DIR = MEDIA_ROOT / 'remote_images'
+REMOTE_IMAGE_CACHE_SIZE = 256 * 1024 * 1024  # bytes, least recently used images are deleted past this
+REMOTE_IMAGE_WAIT = 0.5  # seconds the proxy waits for an image that isn't cached yet, then answers 503 (keep it short, it holds a worker)
+REMOTE_IMAGE_MAX_BYTES = 10 * 1024 * 1024  # bigger remote images aren't downloaded
+REMOTE_IMAGE_RETRY_DELAY = 300  # seconds before an image that failed to download is tried again
+
+# Remote author directories, synced by `python manage.py sync_remote_authors` (see users/utils.py)
+REMOTE_AUTHORS_SYNC_WORKERS = 4  # nodes synced at the same time, a slow node doesn't hold up the others
+
+# FQID -> primary key lookups (users.utils.resolve_fqid)
+FQID_CACHE_TIMEOUT = 24 * 60 * 60  # seconds in the shared cache, deletes invalidate it
+FQID_LOCAL_CACHE_SIZE = 10000  # entries kept in each process
+FQID_LOCAL_CACHE_TIMEOUT = 60  # seconds, how long a process may miss a delete made by another process
+
+# Node Basic auth (node/authentication.py): validated credentials are cached, saving or deleting a Node clears them
+NODE_AUTH_CACHE_TIMEOUT = 60  # seconds
+
+# Inbox activities from nodes are queued and applied by `python manage.py process_inbox` (see stream/inbox.py)
+INBOX_SEEN_TIMEOUT = 24 * 60 * 60  # seconds an applied activity is remembered, the same activity sent again is dropped
+INBOX_CLAIM_TIMEOUT = 300  # seconds before an activity claimed by a dead worker is applied again
+INBOX_MAX_ATTEMPTS = 5  # failed attempts before an activity is left FAILED
+INBOX_RETRY_BASE_DELAY = 10  # seconds, doubled after every failed attempt
+INBOX_BATCH_MAX_SIZE = 100  # activities accepted in one POST to /api/authors/inbox/batch/
+INBOX_MAX_RECIPIENTS = 500  # recipients accepted for one shared inbox activity
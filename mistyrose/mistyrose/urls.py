@@ -23,6 +23,7 @@ from drf_yasg import openapi
 from rest_framework import permissions
 from django.conf import settings
 from posts.views import CommentedView, LikedView, LikesView
+from stream.views import InboxBatchView, SharedInboxView
 from django.views.generic import TemplateView
 
 
@@ -45,6 +46,8 @@ urlpatterns = [
     path('api/comment/', include('posts.comment_urls')), #api/comment urls
     path('api/commented/', include('posts.comment_urls')), #TODO: asked if there is an error in the project description, is this supposed to be the same one as the comments/comment_fqid?  
     path('api/node/', include('node.urls')),
+    path('api/inbox/', SharedInboxView.as_view(), name='shared-inbox'), # node level inbox, one activity for many authors
+    path('api/authors/inbox/batch/', InboxBatchView.as_view(), name='inbox-batch'), # before the inbox of <path:author_id>
     path('api/authors/<path:author_id>/inbox/', include('stream.urls')),
     path('api/authors/<path:author_id>/inbox', include('stream.urls')),
     path('api/authors/', include('posts.authors_urls')), #api/authors/ urls for posts, likes, comments
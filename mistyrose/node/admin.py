@@ -1,4 +1,61 @@
 from django.contrib import admin
-from .models import Node
+from .models import DeadLetter, Node, NodeHealth, OutboxMessage
 
-admin.site.register(Node)
+
+class NodeHealthInline(admin.StackedInline):
+    model = NodeHealth
+    readonly_fields = ('state', 'opened_at', 'error_rate', 'p50_latency', 'p95_latency', 'last_error', 'updated_at')
+    exclude = ('recent_calls',)
+    extra = 0
+    max_num = 0  # created by the breaker, deleting it resets the breaker
+
+    def error_rate(self, health):
+        return f"{health.error_rate():.0%} of last {len(health.recent_calls)} calls"
+
+    def p50_latency(self, health):
+        return f"{health.latency_percentile(50)} ms" if health and health.recent_calls else '-'
+
+    def p95_latency(self, health):
+        return f"{health.latency_percentile(95)} ms" if health and health.recent_calls else '-'
+
+
+@admin.register(Node)
+class NodeAdmin(admin.ModelAdmin):
+    list_display = ('remote_node_url', 'is_whitelisted', 'supports_batch_inbox', 'supports_shared_inbox', 'breaker_state', 'error_rate', 'p95_latency')
+    inlines = [NodeHealthInline]
+
+    def get_queryset(self, request):
+        # the breaker columns read node.health on every row
+        return super().get_queryset(request).select_related('health')
+
+    def get_health(self, node):
+        try:
+            return node.health
+        except NodeHealth.DoesNotExist:
+            return None
+
+    @admin.display(description='breaker')
+    def breaker_state(self, node):
+        health = self.get_health(node)
+        return health.state if health else 'CLOSED'
+
+    def error_rate(self, node):
+        health = self.get_health(node)
+        return f"{health.error_rate():.0%}" if health else '-'
+
+    @admin.display(description='p95 latency')
+    def p95_latency(self, node):
+        health = self.get_health(node)
+        return f"{health.latency_percentile(95)} ms" if health and health.recent_calls else '-'
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('inbox_url', 'status', 'attempts', 'next_attempt_at', 'delivered_at', 'last_error')
+    list_filter = ('status', 'node')
+
+
+@admin.register(DeadLetter)
+class DeadLetterAdmin(admin.ModelAdmin):
+    list_display = ('inbox_url', 'attempts', 'died_at', 'last_error')
+    list_filter = ('node',)
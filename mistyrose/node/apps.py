@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class NodeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'node'
+
+    def ready(self):
+        from .authentication import invalidate_node_auth
+        Node = self.get_model('Node')
+        post_save.connect(invalidate_node_auth, sender=Node, dispatch_uid='invalidate_node_auth_on_save')
+        post_delete.connect(invalidate_node_auth, sender=Node, dispatch_uid='invalidate_node_auth_on_delete')
@@ -3,6 +3,32 @@ from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from node.models import Node  # Import your Node model
 import base64
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+
+# bumped every time a Node is saved or deleted (see node/apps.py), which orphans every cached credential
+NODE_AUTH_GENERATION_KEY = 'node_auth:generation'
+
+def get_node_auth_generation():
+    return cache.get_or_set(NODE_AUTH_GENERATION_KEY, 0, None)
+
+def invalidate_node_auth(update_fields=None, **kwargs):
+    """
+    post_save/post_delete receiver for Node, forgets every validated credential.
+    """
+    # bookkeeping saves don't change who can log in
+    if update_fields and set(update_fields) <= {'authors_synced_at'}:
+        return
+    try:
+        cache.incr(NODE_AUTH_GENERATION_KEY)
+    except ValueError:
+        cache.set(NODE_AUTH_GENERATION_KEY, 1, None)
+
+def get_node_auth_cache_key(auth_header):
+    # only a hash of the header is kept, never the credentials
+    digest = hashlib.sha256(auth_header.encode()).hexdigest()
+    return f"node_auth:{get_node_auth_generation()}:{digest}"
 
 class NodeAuthentication(BaseAuthentication):
     def authenticate(self, request):
@@ -15,6 +41,12 @@ class NodeAuthentication(BaseAuthentication):
         # credentials given, but not Basic
         if not auth_header.startswith('Basic '):
             return None
+
+        # credentials validated in the last NODE_AUTH_CACHE_TIMEOUT seconds, no query and no hashing
+        cache_key = get_node_auth_cache_key(auth_header)
+        node = cache.get(cache_key)
+        if node is not None:
+            return (node, None)
         
         try:
             # decode the base64 encoded string
@@ -26,16 +58,15 @@ class NodeAuthentication(BaseAuthentication):
         except:
             raise AuthenticationFailed('You did not write the auth header properly; fix and try again, cutie.')
         
-        try:
-            # get the Node object that matches the username and password
-            node = Node.objects.get(
-                local_username=username, 
-                local_password=password, 
-                is_whitelisted=True,
-                )
-        except Node.DoesNotExist:
+        # get the whitelisted Node with that username whose (hashed) password matches
+        node = next(
+            (node for node in Node.objects.filter(local_username=username, is_whitelisted=True) if node.check_local_password(password)),
+            None,
+        )
+        if node is None:
             raise AuthenticationFailed('I could not find a live node that matches. Wrong username/password? Or maybe I just blocked you. Who knows?')
 
+        cache.set(cache_key, node, settings.NODE_AUTH_CACHE_TIMEOUT)
         return (node, None)
     
     def authenticate_header(self, request):
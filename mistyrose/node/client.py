@@ -0,0 +1,70 @@
+import base64
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .health import before_node_call, record_node_call
+
+# one pooled keep-alive session per remote node, shared by every thread of the process
+# - remote_node_url -> (credentials, session)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_node_auth_headers(node):
+    """
+    Basic auth header with the credentials WE use to access THEM.
+    """
+    credentials = f"{node.remote_username}:{node.remote_password}"
+    base64_credentials = base64.b64encode(credentials.encode()).decode("utf-8")
+    return {"Authorization": f"Basic {base64_credentials}"}
+
+def get_node_session(node):
+    """
+    Get the shared session for a node, creating it the first time (or when the node's credentials changed).
+    """
+    credentials = (node.remote_username, node.remote_password)
+    with _sessions_lock:
+        cached = _sessions.get(node.remote_node_url)
+        if cached and cached[0] == credentials:
+            return cached[1]
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.NODE_HTTP_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update(get_node_auth_headers(node))
+
+        _sessions[node.remote_node_url] = (credentials, session)
+        if cached:
+            cached[1].close()
+        return session
+
+def node_request(node, method, url, **kwargs):
+    """
+    Make a request to a remote node through its pooled session, with connect/read timeouts.
+    Raises NodeUnavailable (a RequestException) without calling the node if its circuit breaker is open.
+    """
+    probe = before_node_call(node)
+    kwargs.setdefault('timeout', (settings.NODE_HTTP_CONNECT_TIMEOUT, settings.NODE_HTTP_READ_TIMEOUT))
+
+    start = time.monotonic()
+    try:
+        response = get_node_session(node).request(method, url, **kwargs)
+    except requests.RequestException as e:
+        record_node_call(node, False, (time.monotonic() - start) * 1000, str(e), probe)
+        raise
+
+    # 4xx means the node is up and answering, only server errors count against it
+    ok = response.status_code < 500
+    record_node_call(node, ok, (time.monotonic() - start) * 1000, '' if ok else f"HTTP {response.status_code}", probe)
+    return response
+
+def node_get(node, url, **kwargs):
+    return node_request(node, 'GET', url, **kwargs)
+
+def node_post(node, url, **kwargs):
+    return node_request(node, 'POST', url, **kwargs)
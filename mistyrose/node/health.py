@@ -0,0 +1,111 @@
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import NodeHealth
+
+# successful calls through a closed breaker not written to NodeHealth yet, per node
+_buffered_calls = {}
+_buffer_lock = threading.Lock()
+# node pk -> (state, opened_at, time.monotonic() it was read), trusted for NODE_HEALTH_CACHE_TIMEOUT seconds
+_health_states = {}
+
+class NodeUnavailable(requests.RequestException):
+    """
+    Raised instead of calling a node whose circuit breaker is open.
+    """
+    def __init__(self, node, retry_at):
+        super().__init__(f"{node.remote_node_url} is unavailable (circuit open) until {retry_at:%H:%M:%S}")
+        self.retry_at = retry_at
+
+
+def remember_health_state(node, state, opened_at):
+    _health_states[node.pk] = (state, opened_at, time.monotonic())
+
+def get_health_state(node):
+    """
+    (state, opened_at) of a node's breaker, read from NodeHealth at most once every NODE_HEALTH_CACHE_TIMEOUT seconds
+    per process. Breakers opened by other processes are seen that much later.
+    """
+    cached = _health_states.get(node.pk)
+    if cached is not None and time.monotonic() - cached[2] < settings.NODE_HEALTH_CACHE_TIMEOUT:
+        return cached[0], cached[1]
+
+    state, opened_at = NodeHealth.objects.filter(node=node).values_list('state', 'opened_at').first() or ('CLOSED', None)
+    remember_health_state(node, state, opened_at)
+    return state, opened_at
+
+def before_node_call(node):
+    """
+    Check the breaker of a node before calling it, raises NodeUnavailable if the call must not be made.
+    After the cooldown a single caller gets to probe the node (HALF_OPEN), the others keep failing fast.
+    Returns True for that caller.
+    """
+    state, opened_at = get_health_state(node)
+    if state == 'CLOSED':
+        return False
+
+    now = timezone.now()
+    retry_at = opened_at + timedelta(seconds=settings.NODE_BREAKER_COOLDOWN)
+    if now < retry_at:
+        raise NodeUnavailable(node, retry_at)
+
+    # cooldown is over (or the last probe never reported back), try to become the probe
+    probing = NodeHealth.objects.filter(node=node, state=state, opened_at=opened_at).update(
+        state='HALF_OPEN', opened_at=now
+    )
+    if not probing:
+        # someone else is probing, read the state again next time
+        _health_states.pop(node.pk, None)
+        raise NodeUnavailable(node, now + timedelta(seconds=settings.NODE_BREAKER_COOLDOWN))
+    remember_health_state(node, 'HALF_OPEN', now)
+    return True
+
+def record_node_call(node, ok, latency_ms, error='', probe=False):
+    """
+    Record the outcome of a call to a node and move its breaker between CLOSED, OPEN and HALF_OPEN.
+    Successes don't move a closed breaker, they're kept in the process and written NODE_HEALTH_FLUSH_EVERY at a time
+    (or with the next failure), so calls to a healthy node don't all wait on its NodeHealth row lock.
+    Failures and probes (probe=True) are written right away.
+    """
+    with _buffer_lock:
+        calls = _buffered_calls.pop(node.pk, []) + [[ok, round(latency_ms)]]
+        if ok and not probe and len(calls) < settings.NODE_HEALTH_FLUSH_EVERY:
+            _buffered_calls[node.pk] = calls
+            return
+    write_node_calls(node, calls, error)
+
+def write_node_calls(node, calls, error=''):
+    """
+    Add calls ([ok, latency in ms], oldest first) to the health of a node, the last one decides a HALF_OPEN breaker.
+    """
+    ok = calls[-1][0]
+    with transaction.atomic():
+        health, created = NodeHealth.objects.select_for_update().get_or_create(node=node)
+
+        health.recent_calls = (health.recent_calls + calls)[-settings.NODE_BREAKER_WINDOW:]
+        if error:
+            health.last_error = error
+
+        if health.state == 'HALF_OPEN':
+            # the probe decides
+            if ok:
+                health.state = 'CLOSED'
+                health.opened_at = None
+                health.recent_calls = calls[-1:]
+            else:
+                health.state = 'OPEN'
+                health.opened_at = timezone.now()
+        elif health.state == 'CLOSED' and not ok:
+            if len(health.recent_calls) >= settings.NODE_BREAKER_MIN_CALLS and health.error_rate() >= settings.NODE_BREAKER_ERROR_RATE:
+                print(f"Opening circuit breaker for {node.remote_node_url} ({health.error_rate():.0%} errors)")
+                health.state = 'OPEN'
+                health.opened_at = timezone.now()
+
+        health.save()
+    remember_health_state(node, health.state, health.opened_at)
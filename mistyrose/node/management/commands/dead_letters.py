@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from node.models import DeadLetter, OutboxMessage
+
+
+class Command(BaseCommand):
+    help = "Inspect, requeue or purge outbox messages that ran out of delivery attempts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['list', 'requeue', 'purge'])
+        parser.add_argument('ids', nargs='*', help="Only these dead letter ids (default: all of them)")
+        parser.add_argument('--node', help="Only dead letters for this remote_node_url")
+
+    def handle(self, *args, **options):
+        dead_letters = DeadLetter.objects.select_related('node')
+        if options['ids']:
+            dead_letters = dead_letters.filter(id__in=options['ids'])
+        if options['node']:
+            dead_letters = dead_letters.filter(node__remote_node_url=options['node'].rstrip('/'))
+
+        action = options['action']
+        if action == 'list':
+            for dead_letter in dead_letters:
+                self.stdout.write(
+                    f"{dead_letter.id} {dead_letter.died_at:%Y-%m-%d %H:%M} {dead_letter.payload.get('type')} "
+                    f"-> {dead_letter.inbox_url} ({dead_letter.attempts} attempts): {dead_letter.last_error}"
+                )
+            return
+
+        with transaction.atomic():
+            dead_letters = list(dead_letters.select_for_update(of=('self',)))
+            if action == 'requeue':
+                # a fresh set of attempts, sent by the next deliver_outbox round
+                OutboxMessage.objects.bulk_create([
+                    OutboxMessage(
+                        id=dead_letter.id,
+                        node=dead_letter.node,
+                        inbox_url=dead_letter.inbox_url,
+                        payload=dead_letter.payload,
+                        recipients=dead_letter.recipients,
+                        last_error=dead_letter.last_error,
+                        next_attempt_at=timezone.now(),
+                    )
+                    for dead_letter in dead_letters
+                ])
+            DeadLetter.objects.filter(id__in=[dead_letter.id for dead_letter in dead_letters]).delete()
+
+        verb = "Requeued" if action == 'requeue' else "Purged"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(dead_letters)} dead letter(s)"))
@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from node.utils import claim_outbox_messages, deliver_outbox_messages
+
+
+class Command(BaseCommand):
+    help = "Deliver queued inbox messages (posts, comments, likes, ...) to remote nodes. Runs forever unless --once is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Deliver what is queued right now and exit")
+        parser.add_argument('--batch-size', type=int, default=100, help="Messages claimed per round")
+        parser.add_argument('--workers', type=int, default=settings.OUTBOX_WORKERS, help="Concurrent deliveries")
+        parser.add_argument('--max-per-node', type=int, default=settings.OUTBOX_MAX_PER_NODE, help="Concurrent deliveries to the same node")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+
+    def handle(self, *args, **options):
+        max_per_node = max(1, options['max_per_node'])
+
+        while True:
+            messages = claim_outbox_messages(options['batch_size'])
+            if messages:
+                delivered = deliver_outbox_messages(messages, options['workers'], max_per_node)
+                self.stdout.write(f"Delivered {delivered}/{len(messages)} message(s)")
+
+            if options['once'] and len(messages) < options['batch_size']:
+                break
+            if not messages:
+                time.sleep(options['poll_interval'])
@@ -1,6 +1,9 @@
 import uuid
 from django.db import models
-from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.auth.hashers import make_password, check_password, identify_hasher
+from django.utils.crypto import constant_time_compare
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 class Node(models.Model):
     # url of the remote node
@@ -14,18 +17,136 @@ class Node(models.Model):
     # username and password for the local node
     # - this is what THEY use to access US
     # - this is what WE have to check in NodeAuthentication
+    # - local_password is stored hashed (like User.password), save() hashes a plaintext one
     local_username = models.CharField(max_length=100, default="RemoteToTavern")
-    local_password = models.CharField(max_length=100, default="Remote-->Tavern")
+    local_password = models.CharField(max_length=128, default="Remote-->Tavern")
     
     # boolean to check if the remote node is whitelisted
     # - True --> WE can access THEM, THEY can access US
     # - False --> WE can't access THEM, THEY can't access US
     # - (Note: username and password still have to be sent for every request, this is just a preliminary check)
     is_whitelisted = models.BooleanField(default=False)
+
+    # the remote node takes many inbox activities in one POST to /api/authors/inbox/batch/, `deliver_outbox` batches them
+    supports_batch_inbox = models.BooleanField(default=False)
+    # the remote node has a shared inbox at /api/inbox/, an activity for many of its authors is sent there once with the list of them
+    supports_shared_inbox = models.BooleanField(default=False)
+
+    # last time `manage.py sync_remote_authors` finished syncing this node's authors
+    authors_synced_at = models.DateTimeField(null=True, blank=True)
     
     @property
     def is_authenticated(self):
         return self.is_whitelisted
+
+    def save(self, *args, **kwargs):
+        if not self.has_hashed_local_password():
+            self.local_password = make_password(self.local_password)
+        super().save(*args, **kwargs)
+
+    def has_hashed_local_password(self):
+        try:
+            identify_hasher(self.local_password)
+        except ValueError:
+            return False
+        return True
+
+    def check_local_password(self, password):
+        """
+        Check the password a node sent us, upgrading a plaintext local_password from before they were hashed.
+        """
+        if self.has_hashed_local_password():
+            return check_password(password, self.local_password)
+
+        if not constant_time_compare(password, self.local_password):
+            return False
+        self.local_password = make_password(password)
+        Node.objects.filter(pk=self.pk).update(local_password=self.local_password)
+        return True
     
     def __str__(self):
-        return f"{self.remote_username} {self.remote_node_url}"
\ No newline at end of file
+        return f"{self.remote_username} {self.remote_node_url}"
+
+# OutboxMessage is one activity (post, comment, like, ...) waiting to be POSTed to a remote author's inbox.
+# Views only insert rows (in the same transaction as the change they describe), the `deliver_outbox` worker sends them.
+class OutboxMessage(models.Model):
+    STATUS_CHOICES = [
+      ('PENDING', 'Pending'),
+      ('SENDING', 'Sending'),
+      ('DELIVERED', 'Delivered'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name='outbox_messages')
+    inbox_url = models.URLField(max_length=2000)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    recipients = models.JSONField(default=list, blank=True) # FQIDs of the authors it's for when inbox_url is the node's shared inbox
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True) # when a worker started sending it, used to recover from crashed workers
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    # failed deliveries go back to PENDING with a backed off next_attempt_at, and to DeadLetter after OUTBOX_MAX_ATTEMPTS
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+            models.Index(fields=['inbox_url', 'status'], name='outbox_inbox_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} {self.payload.get('type')} to {self.inbox_url}"
+
+# DeadLetter keeps the outbox messages we gave up on, so they can be inspected and requeued (`manage.py dead_letters`).
+class DeadLetter(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False) # same id as the OutboxMessage it came from
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name='dead_letters')
+    inbox_url = models.URLField(max_length=2000)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    recipients = models.JSONField(default=list, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField() # when the message was first queued
+    died_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-died_at']
+
+    def __str__(self):
+        return f"{self.payload.get('type')} to {self.inbox_url} ({self.attempts} attempts)"
+
+# NodeHealth is the circuit breaker state of a remote node, kept in the DB so every web and worker process shares it.
+# - CLOSED: calls go through, OPEN: calls fail fast until the cooldown is over, HALF_OPEN: one probe call decides
+class NodeHealth(models.Model):
+    STATE_CHOICES = [
+      ('CLOSED', 'Closed'),
+      ('OPEN', 'Open'),
+      ('HALF_OPEN', 'Half open'),
+    ]
+
+    node = models.OneToOneField(Node, on_delete=models.CASCADE, primary_key=True, related_name='health')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default='CLOSED')
+    opened_at = models.DateTimeField(null=True, blank=True) # when the breaker last opened (or the half open probe started)
+    # last NODE_BREAKER_WINDOW calls as [ok, latency in ms], oldest first
+    recent_calls = models.JSONField(default=list, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def error_rate(self):
+        if not self.recent_calls:
+            return 0.0
+        return sum(1 for ok, _ in self.recent_calls if not ok) / len(self.recent_calls)
+
+    def latency_percentile(self, percentile):
+        latencies = sorted(latency for _, latency in self.recent_calls)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        return latencies[index]
+
+    def __str__(self):
+        return f"{self.node_id} {self.state}"
@@ -2,10 +2,26 @@ from unittest.mock import patch, Mock
 from django.test import TestCase
 from rest_framework.test import APIClient
 from rest_framework import status
-from node.models import Node
+from node.models import DeadLetter, Node, NodeHealth, OutboxMessage
+from node.health import NodeUnavailable, _buffered_calls, _health_states
+from datetime import timedelta
+from django.test import override_settings
+from django.utils import timezone
+from node.client import get_node_session, node_get
+from users.models import Author, Follows
+from django.core.management import call_command
+from io import StringIO
+import requests
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+from node.authentication import NodeAuthentication
+import base64
 
 # User Story #56 Test: As a node admin, I want to be able to connect to remote nodes by entering only the URL of the remote node, a username, and a password.
 # User Story #60 Test: As a node admin, I can prevent nodes from connecting to my node if they don't have a valid username and password.
@@ -231,3 +247,322 @@ class NodeAPITest(TestCase):
         retrieved_node = Node.objects.get(remote_node_url=self.node_data_1["remote_node_url"])
         self.assertEqual(retrieved_node.remote_node_url, self.node_data_1["remote_node_url"])
 
+
+
+class OutboxDeliveryTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="poster", password="testpassword")
+        self.author = Author.objects.create(user=self.user, display_name="Poster", host="http://localhost")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refresh.access_token}")
+
+        self.node = Node.objects.create(
+            remote_node_url="http://remote-node.com",
+            remote_username="us",
+            remote_password="secret",
+            is_whitelisted=True,
+        )
+        self.remote_authors = [
+            Author.objects.create(display_name=f"Remote {i}", host="http://remote-node.com") for i in range(3)
+        ]
+        for remote_author in self.remote_authors:
+            Follows.objects.create(local_follower_id=remote_author, followed_id=self.author, status="ACCEPTED", is_remote=True)
+
+    def create_post(self):
+        data = {"title": "Hello", "content": "world", "contentType": "text/plain", "visibility": "PUBLIC"}
+        return self.client.post(f"/api/authors/{self.author.id}/posts/", data, format="json")
+
+    @patch("node.utils.node_post")
+    def test_creating_post_only_queues_deliveries(self, mock_post):
+        response = self.create_post()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mock_post.assert_not_called()
+        self.assertEqual(OutboxMessage.objects.filter(status="PENDING").count(), 3)
+        message = OutboxMessage.objects.first()
+        self.assertEqual(message.node, self.node)
+        self.assertEqual(message.payload["title"], "Hello")
+        self.assertIn(message.inbox_url, [f"{author.url.rstrip('/')}/inbox/" for author in self.remote_authors])
+
+    @patch("node.utils.node_post")
+    def test_worker_delivers_queued_messages(self, mock_post):
+        self.create_post()
+        mock_post.side_effect = [Mock(status_code=201), Mock(status_code=500), requests.ConnectionError("down")]
+
+        call_command("deliver_outbox", "--once", "--workers", "1", stdout=StringIO())
+
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(mock_post.call_args[0][0], self.node)
+        self.assertEqual(OutboxMessage.objects.filter(status="DELIVERED").count(), 1)
+
+        # failures are retried later, not right away
+        failed = OutboxMessage.objects.exclude(status="DELIVERED")
+        self.assertEqual(failed.count(), 2)
+        for message in failed:
+            self.assertEqual(message.status, "PENDING")
+            self.assertEqual(message.attempts, 1)
+            self.assertGreater(message.next_attempt_at, timezone.now())
+        mock_post.reset_mock()
+        call_command("deliver_outbox", "--once", "--workers", "1", stdout=StringIO())
+        mock_post.assert_not_called()
+
+    @patch("node.utils.node_post")
+    def test_worker_batches_messages_for_nodes_with_batch_inbox(self, mock_post):
+        self.node.supports_batch_inbox = True
+        self.node.save()
+        self.create_post()
+        mock_post.return_value = Mock(status_code=202)
+        mock_post.return_value.json.return_value = {"results": [{"status": 202}, {"status": 404, "error": "gone"}, {"status": 200}]}
+
+        call_command("deliver_outbox", "--once", "--workers", "1", "--max-per-node", "1", stdout=StringIO())
+
+        mock_post.assert_called_once()
+        self.assertEqual(mock_post.call_args[0][1], "http://remote-node.com/api/authors/inbox/batch/")
+        batch = mock_post.call_args[1]["json"]
+        self.assertEqual(
+            sorted(item["recipient"] for item in batch), sorted(author.url.rstrip('/') for author in self.remote_authors)
+        )
+        self.assertEqual(batch[0]["activity"]["title"], "Hello")
+        self.assertEqual(OutboxMessage.objects.filter(status="DELIVERED").count(), 2)
+        self.assertEqual(OutboxMessage.objects.get(status="PENDING").last_error, "HTTP 404: gone")
+
+    @patch("node.utils.node_post")
+    def test_worker_sends_once_to_shared_inbox(self, mock_post):
+        self.node.supports_shared_inbox = True
+        self.node.save()
+        self.create_post()
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.inbox_url, "http://remote-node.com/api/inbox/")
+        self.assertEqual(sorted(message.recipients), sorted(author.url for author in self.remote_authors))
+
+        mock_post.return_value = Mock(status_code=202)
+        call_command("deliver_outbox", "--once", "--workers", "1", stdout=StringIO())
+
+        mock_post.assert_called_once()
+        body = mock_post.call_args[1]["json"]
+        self.assertEqual(body["recipients"], message.recipients)
+        self.assertEqual(body["activity"]["title"], "Hello")
+        self.assertEqual(OutboxMessage.objects.get().status, "DELIVERED")
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=3)
+    @patch("node.utils.node_post")
+    def test_gives_up_into_dead_letters(self, mock_post):
+        self.create_post()
+        mock_post.return_value = Mock(status_code=503)
+
+        for attempt in range(3):
+            OutboxMessage.objects.update(next_attempt_at=timezone.now())
+            call_command("deliver_outbox", "--once", "--workers", "1", stdout=StringIO())
+
+        self.assertEqual(mock_post.call_count, 9)
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(DeadLetter.objects.count(), 3)
+        self.assertEqual(DeadLetter.objects.first().attempts, 3)
+        self.assertEqual(DeadLetter.objects.first().last_error, "HTTP 503")
+
+        call_command("dead_letters", "requeue", str(DeadLetter.objects.first().id), stdout=StringIO())
+        self.assertEqual(DeadLetter.objects.count(), 2)
+        self.assertEqual(OutboxMessage.objects.filter(status="PENDING", attempts=0).count(), 1)
+
+        call_command("dead_letters", "purge", stdout=StringIO())
+        self.assertFalse(DeadLetter.objects.exists())
+
+
+class NodeClientTest(TestCase):
+    def setUp(self):
+        self.node = Node.objects.create(
+            remote_node_url="http://pooled-node.com",
+            remote_username="us",
+            remote_password="secret",
+            is_whitelisted=True,
+        )
+
+    def test_session_is_shared_per_node(self):
+        session = get_node_session(self.node)
+        self.assertIs(get_node_session(Node.objects.get(pk=self.node.pk)), session)
+        self.assertEqual(session.headers["Authorization"], "Basic dXM6c2VjcmV0")
+
+        # new credentials get a new session
+        self.node.remote_password = "changed"
+        self.node.save()
+        self.assertIsNot(get_node_session(self.node), session)
+
+    @patch("requests.Session.request")
+    def test_requests_have_timeouts(self, mock_request):
+        mock_request.return_value = Mock(status_code=200)
+        node_get(self.node, "http://pooled-node.com/api/authors/")
+
+        args, kwargs = mock_request.call_args
+        self.assertEqual(args, ("GET", "http://pooled-node.com/api/authors/"))
+        self.assertIsInstance(kwargs["timeout"], tuple)
+
+
+@override_settings(NODE_BREAKER_MIN_CALLS=4, NODE_BREAKER_ERROR_RATE=0.5, NODE_BREAKER_COOLDOWN=60)
+class NodeCircuitBreakerTest(TestCase):
+    def setUp(self):
+        _buffered_calls.clear()
+        _health_states.clear()
+        self.node = Node.objects.create(remote_node_url="http://flaky-node.com", is_whitelisted=True)
+        self.url = "http://flaky-node.com/api/authors/"
+
+    @patch("requests.Session.request")
+    def test_breaker_opens_and_fails_fast(self, mock_request):
+        mock_request.side_effect = requests.ConnectTimeout("timed out")
+        for i in range(4):
+            with self.assertRaises(requests.ConnectTimeout):
+                node_get(self.node, self.url)
+
+        health = NodeHealth.objects.get(node=self.node)
+        self.assertEqual(health.state, "OPEN")
+        self.assertEqual(health.error_rate(), 1.0)
+
+        # no more calls to the node while the breaker is open
+        with self.assertRaises(NodeUnavailable):
+            node_get(self.node, self.url)
+        self.assertEqual(mock_request.call_count, 4)
+
+    @patch("requests.Session.request")
+    def test_half_open_probe_closes_breaker(self, mock_request):
+        NodeHealth.objects.create(node=self.node, state="OPEN", opened_at=timezone.now() - timedelta(seconds=61), recent_calls=[[False, 3000]] * 4)
+        mock_request.return_value = Mock(status_code=200)
+
+        node_get(self.node, self.url)
+
+        health = NodeHealth.objects.get(node=self.node)
+        self.assertEqual(health.state, "CLOSED")
+        self.assertEqual(health.error_rate(), 0.0)
+
+    @patch("requests.Session.request")
+    def test_failed_probe_reopens_breaker(self, mock_request):
+        NodeHealth.objects.create(node=self.node, state="OPEN", opened_at=timezone.now() - timedelta(seconds=61))
+        mock_request.return_value = Mock(status_code=502)
+
+        node_get(self.node, self.url)
+
+        health = NodeHealth.objects.get(node=self.node)
+        self.assertEqual(health.state, "OPEN")
+        self.assertGreater(health.opened_at, timezone.now() - timedelta(seconds=5))
+
+    @override_settings(NODE_HEALTH_FLUSH_EVERY=3)
+    @patch("requests.Session.request")
+    def test_successes_are_written_in_batches(self, mock_request):
+        mock_request.return_value = Mock(status_code=200)
+        for i in range(2):
+            node_get(self.node, self.url)
+        self.assertFalse(NodeHealth.objects.filter(node=self.node).exists())
+
+        node_get(self.node, self.url)
+        self.assertEqual(len(NodeHealth.objects.get(node=self.node).recent_calls), 3)
+
+        # a failure is written right away, with the successes before it
+        mock_request.return_value = Mock(status_code=502)
+        node_get(self.node, self.url)
+        node_get(self.node, self.url)
+        mock_request.return_value = Mock(status_code=200)
+        node_get(self.node, self.url)
+        self.assertEqual(NodeHealth.objects.get(node=self.node).recent_calls[-2:], [[False, 0], [False, 0]])
+
+    @patch("requests.Session.request")
+    def test_closed_breaker_is_not_read_on_every_call(self, mock_request):
+        mock_request.return_value = Mock(status_code=200)
+        node_get(self.node, self.url)
+        with self.assertNumQueries(0):
+            for i in range(5):
+                node_get(self.node, self.url)
+
+    @patch("requests.Session.request")
+    def test_outbox_defers_messages_for_open_node(self, mock_request):
+        NodeHealth.objects.create(node=self.node, state="OPEN", opened_at=timezone.now())
+        OutboxMessage.objects.create(node=self.node, inbox_url="http://flaky-node.com/api/authors/1/inbox/", payload={"type": "post"})
+
+        call_command("deliver_outbox", "--once", "--workers", "1", stdout=StringIO())
+
+        mock_request.assert_not_called()
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.status, "PENDING")
+        self.assertEqual(message.attempts, 0)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+
+class NodeAdminTest(TestCase):
+    def setUp(self):
+        admin_user = User.objects.create_superuser(username="nodeadmin", password="pass")
+        self.client.force_login(admin_user)
+
+    def add_nodes(self, count):
+        for i in range(count):
+            node = Node.objects.create(remote_node_url=f"http://node-{Node.objects.count()}.com")
+            NodeHealth.objects.create(node=node, recent_calls=[[True, 20]])
+
+    def test_changelist_reads_health_in_the_same_query(self):
+        self.add_nodes(2)
+        with CaptureQueriesContext(connection) as few:
+            self.assertEqual(self.client.get(reverse("admin:node_node_changelist")).status_code, 200)
+        self.add_nodes(5)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse("admin:node_node_changelist"))
+        self.assertEqual(len(few), len(many))
+
+
+class NodeAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.node = Node.objects.create(
+            remote_node_url="http://peer-node.com", local_username="peer", local_password="peer-secret", is_whitelisted=True,
+        )
+
+    def authenticate(self, username, password):
+        credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
+        request = RequestFactory().get('/api/authors/', HTTP_AUTHORIZATION=f"Basic {credentials}")
+        return NodeAuthentication().authenticate(request)
+
+    def test_local_password_is_hashed(self):
+        self.node.refresh_from_db()
+        self.assertNotEqual(self.node.local_password, "peer-secret")
+        self.assertTrue(self.node.local_password.startswith("pbkdf2_"))
+        self.assertTrue(self.node.check_local_password("peer-secret"))
+        self.assertFalse(self.node.check_local_password("wrong"))
+
+        # saving again doesn't hash the hash
+        hashed = self.node.local_password
+        self.node.save()
+        self.assertEqual(self.node.local_password, hashed)
+
+    def test_validated_credentials_are_cached(self):
+        node, _ = self.authenticate("peer", "peer-secret")
+        self.assertEqual(node.remote_node_url, self.node.remote_node_url)
+
+        with self.assertNumQueries(0), patch("node.models.check_password") as check:
+            node, _ = self.authenticate("peer", "peer-secret")
+        check.assert_not_called()
+        self.assertEqual(node.remote_node_url, self.node.remote_node_url)
+
+    def test_wrong_credentials(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate("peer", "wrong")
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate("nobody", "peer-secret")
+
+    def test_saving_a_node_invalidates_the_cache(self):
+        self.authenticate("peer", "peer-secret")
+
+        self.node.local_password = "new-secret"
+        self.node.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate("peer", "peer-secret")
+        self.authenticate("peer", "new-secret")
+
+        self.node.is_whitelisted = False
+        self.node.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate("peer", "new-secret")
+
+    def test_plaintext_password_is_upgraded(self):
+        # a row saved before passwords were hashed
+        Node.objects.filter(pk=self.node.pk).update(local_password="old-plaintext")
+
+        self.authenticate("peer", "old-plaintext")
+        self.node.refresh_from_db()
+        self.assertTrue(self.node.has_hashed_local_password())
+        self.assertTrue(self.node.check_local_password("old-plaintext"))
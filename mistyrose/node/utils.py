@@ -0,0 +1,247 @@
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .client import node_post
+from .health import NodeUnavailable
+from .models import DeadLetter, Node, OutboxMessage
+
+
+def get_node_for_author(author):
+    """
+    Get the node a remote author lives on, or None if we don't know it.
+    """
+    return Node.objects.filter(remote_node_url=author.host.removesuffix('/api/')).first()
+
+def get_author_inbox_url(author):
+    """
+    Inbox endpoint of a remote author.
+    """
+    inbox_url = f"{author.url.rstrip('/')}/inbox/"
+    if '-crimson-' in inbox_url:
+        inbox_url = inbox_url.rstrip('/')  # crimson doesn't accept the trailing /
+    return inbox_url
+
+def get_node_shared_inbox_url(node):
+    return f"{node.remote_node_url.rstrip('/')}/api/inbox/"
+
+def enqueue_inbox_messages(remote_authors, payload):
+    """
+    Queue payload for delivery to the inbox of every remote author whose node we know.
+    Nodes with a shared inbox get a single message listing their authors, the others one message per author.
+    The rows are written in the caller's transaction, so nothing is sent for a change that gets rolled back.
+    """
+    nodes = {}
+    shared_recipients = {}  # remote_node_url -> FQIDs of its authors
+    messages = []
+    for remote_author in remote_authors:
+        host = remote_author.host.removesuffix('/api/')
+        if host not in nodes:
+            nodes[host] = get_node_for_author(remote_author)
+        node = nodes[host]
+        if not node:
+            print(f"No node for remote author {remote_author.url}, not sending")
+            continue
+        if node.supports_shared_inbox:
+            shared_recipients.setdefault(node.remote_node_url, []).append(remote_author.url)
+            continue
+        messages.append(OutboxMessage(node=node, inbox_url=get_author_inbox_url(remote_author), payload=payload))
+
+    for node in nodes.values():
+        if node and node.remote_node_url in shared_recipients:
+            messages.append(OutboxMessage(
+                node=node, inbox_url=get_node_shared_inbox_url(node), payload=payload,
+                recipients=shared_recipients.pop(node.remote_node_url),
+            ))
+
+    OutboxMessage.objects.bulk_create(messages)
+    return messages
+
+def get_delivered_body(message):
+    """
+    What is POSTed for a message: the activity itself, wrapped with its recipients for a shared inbox.
+    """
+    if message.recipients:
+        return {"recipients": message.recipients, "activity": message.payload}
+    return message.payload
+
+def claim_outbox_messages(batch_size):
+    """
+    Mark up to batch_size pending messages that are due as SENDING and return them.
+    Messages stuck in SENDING for longer than OUTBOX_CLAIM_TIMEOUT (crashed worker) are picked up again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.OUTBOX_CLAIM_TIMEOUT)
+
+    with transaction.atomic():
+        # skip_locked lets several workers claim from the table at the same time (no-op on sqlite)
+        ids = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='PENDING', next_attempt_at__lte=now) | Q(status='SENDING', claimed_at__lt=stale))
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        OutboxMessage.objects.filter(id__in=ids).update(status='SENDING', claimed_at=now)
+
+    return list(OutboxMessage.objects.filter(id__in=ids).select_related('node'))
+
+def deliver_outbox_message(message):
+    """
+    POST one message to its remote inbox and record the result.
+    """
+    error = ''
+    try:
+        response = node_post(message.node, message.inbox_url, json=get_delivered_body(message))
+        if response.status_code not in (200, 201, 202):
+            error = f"HTTP {response.status_code}"
+    except NodeUnavailable as e:
+        # the node is known to be down, wait for its breaker instead of using up an attempt
+        OutboxMessage.objects.filter(id=message.id).update(status='PENDING', next_attempt_at=e.retry_at, last_error=str(e))
+        return False
+    except requests.RequestException as e:
+        error = str(e)
+
+    if error:
+        print(f"Could not post to remote author inbox {message.inbox_url}: {error}")
+        record_failed_delivery(message, error)
+        return False
+
+    OutboxMessage.objects.filter(id=message.id).update(status='DELIVERED', delivered_at=timezone.now(), last_error='')
+    return True
+
+def get_retry_delay(attempts):
+    """
+    Seconds to wait before the next attempt: exponential in the number of failed attempts, capped,
+    with random jitter so messages that failed together don't all come back at the same time.
+    """
+    delay = min(settings.OUTBOX_RETRY_MAX_DELAY, settings.OUTBOX_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+def record_failed_delivery(message, error):
+    """
+    Schedule the next attempt of a failed message, or move it to DeadLetter once it ran out of attempts.
+    """
+    attempts = message.attempts + 1
+
+    if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        with transaction.atomic():
+            DeadLetter.objects.create(
+                id=message.id,
+                node=message.node,
+                inbox_url=message.inbox_url,
+                payload=message.payload,
+                recipients=message.recipients,
+                attempts=attempts,
+                last_error=error,
+                created_at=message.created_at,
+            )
+            OutboxMessage.objects.filter(id=message.id).delete()
+        print(f"Gave up on {message.inbox_url} after {attempts} attempts")
+        return
+
+    retry_at = timezone.now() + timedelta(seconds=get_retry_delay(attempts))
+    with transaction.atomic():
+        OutboxMessage.objects.filter(id=message.id).update(
+            status='PENDING', attempts=attempts, next_attempt_at=retry_at, last_error=error
+        )
+        # the inbox is failing, hold back the other messages queued for it too instead of hammering it
+        OutboxMessage.objects.filter(
+            inbox_url=message.inbox_url, status='PENDING', next_attempt_at__lt=retry_at
+        ).update(next_attempt_at=retry_at)
+
+def get_node_batch_inbox_url(node):
+    return f"{node.remote_node_url.rstrip('/')}/api/authors/inbox/batch/"
+
+def get_inbox_recipient(inbox_url):
+    """
+    FQID of the author an inbox url belongs to.
+    """
+    return inbox_url.rstrip('/').removesuffix('/inbox')
+
+def deliver_outbox_batch(messages):
+    """
+    POST messages that all go to the same node in one request to its batch inbox and record the result of each.
+    Returns the number of delivered messages.
+    """
+    node = messages[0].node
+    batch = [
+        {"recipients": message.recipients, "activity": message.payload} if message.recipients
+        else {"recipient": get_inbox_recipient(message.inbox_url), "activity": message.payload}
+        for message in messages
+    ]
+
+    error = ''
+    try:
+        response = node_post(node, get_node_batch_inbox_url(node), json=batch)
+        if response.status_code not in (200, 201, 202):
+            error = f"HTTP {response.status_code}"
+        else:
+            results = response.json()["results"]
+            if len(results) != len(messages):
+                error = f"got {len(results)} results for {len(messages)} activities"
+    except NodeUnavailable as e:
+        OutboxMessage.objects.filter(id__in=[message.id for message in messages]).update(
+            status='PENDING', next_attempt_at=e.retry_at, last_error=str(e)
+        )
+        return 0
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        error = str(e)
+
+    if error:
+        print(f"Could not post to the batch inbox of {node.remote_node_url}: {error}")
+        for message in messages:
+            record_failed_delivery(message, error)
+        return 0
+
+    delivered = []
+    for message, result in zip(messages, results):
+        if result.get("status") in (200, 201, 202):
+            delivered.append(message.id)
+        else:
+            record_failed_delivery(message, f"HTTP {result.get('status')}: {result.get('error', '')}")
+
+    OutboxMessage.objects.filter(id__in=delivered).update(status='DELIVERED', delivered_at=timezone.now(), last_error='')
+    return len(delivered)
+
+def deliver_lane(messages):
+    """
+    Deliver messages one after another, OUTBOX_BATCH_SIZE per request to nodes with a batch inbox.
+    """
+    if messages and messages[0].node.supports_batch_inbox:
+        size = settings.OUTBOX_BATCH_SIZE
+        return sum(deliver_outbox_batch(messages[i:i + size]) for i in range(0, len(messages), size))
+    return sum(deliver_outbox_message(message) for message in messages)
+
+def deliver_lane_in_thread(messages):
+    try:
+        return deliver_lane(messages)
+    finally:
+        # every thread gets its own DB connection, don't leak them
+        connection.close()
+
+def deliver_outbox_messages(messages, workers, max_per_node):
+    """
+    Deliver messages concurrently, with at most max_per_node requests in flight to the same node
+    so one batch can't flood a single remote node. Returns the number of delivered messages.
+    """
+    messages_per_node = {}
+    for message in messages:
+        messages_per_node.setdefault(message.node_id, []).append(message)
+
+    # split each node's messages into up to max_per_node lanes, each lane sends sequentially
+    lanes = []
+    for node_messages in messages_per_node.values():
+        lane_count = min(max_per_node, len(node_messages))
+        lanes.extend(node_messages[i::lane_count] for i in range(lane_count))
+
+    if workers <= 1 or len(lanes) <= 1:
+        return sum(map(deliver_lane, lanes))
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(lanes))) as executor:
+        return sum(executor.map(deliver_lane_in_thread, lanes))
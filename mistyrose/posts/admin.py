@@ -1,6 +1,6 @@
 from django.contrib import admin
 from .models import Post, Comment, Like
-from .models import Post, Like, Comment
+from .models import Post, Like, Comment, ImageBlob
 
 class PostAdmin(admin.ModelAdmin):
     #show url in django admin
@@ -14,7 +14,12 @@ class LikeAdmin(admin.ModelAdmin):
     #show url in django admin
     readonly_fields = ('url',)
 
+class ImageBlobAdmin(admin.ModelAdmin):
+    list_display = ('sha256', 'content_type', 'size', 'created_at')
+    readonly_fields = ('sha256', 'content_type', 'size', 'created_at')
+
 # Register your models here.
 admin.site.register(Post, PostAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Like, LikeAdmin)
+admin.site.register(ImageBlob, ImageBlobAdmin)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class PostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'posts'
+
+    def ready(self):
+        from users.utils import forget_fqid
+        for model_name in ('Post', 'Comment', 'Like'):
+            post_delete.connect(forget_fqid, sender=self.get_model(model_name), dispatch_uid=f'forget_{model_name.lower()}_fqid')
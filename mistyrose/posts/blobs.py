@@ -0,0 +1,134 @@
+import base64
+import hashlib
+import io
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import patch_vary_headers
+from PIL import Image, UnidentifiedImageError
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_blob_storage():
+    """
+    Storage holding image blobs, configured by STORAGES['blobs'] (filesystem by default).
+    """
+    return storages['blobs']
+
+def get_blob_name(sha256):
+    # fan out into subdirectories so no single directory gets huge
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def decode_base64_image(content):
+    """
+    Decode the base64 content of an image post, with or without a data: URL header, whitespace or padding.
+    Raises ValueError if content isn't base64 or doesn't decode to an image Pillow recognizes.
+    """
+    if content.startswith('data:') and ',' in content:
+        content = content.split(',', 1)[1]
+    content = re.sub(r"\s+", "", content)
+    content += '=' * (-len(content) % 4)
+    data = base64.b64decode(content, validate=True)
+
+    # only reads the header, enough to tell an image from text that happens to be valid base64
+    try:
+        with Image.open(io.BytesIO(data)):
+            pass
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise ValueError(f"not an image: {e}")
+    return data
+
+def save_blob(data):
+    """
+    Write data to the blob storage under its sha256 (once, identical data is stored a single time) and return the hash.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    storage = get_blob_storage()
+    name = get_blob_name(sha256)
+    if not storage.exists(name):
+        storage.save(name, ContentFile(data))
+    return sha256
+
+def open_blob(sha256):
+    return get_blob_storage().open(get_blob_name(sha256), 'rb')
+
+def read_blob(sha256):
+    with open_blob(sha256) as blob:
+        return blob.read()
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header matches etag (weak comparison, as the RFC asks for If-None-Match).
+    """
+    if if_none_match.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in tags or f"W/{etag}" in tags
+
+def parse_byte_range(range_header, size):
+    """
+    (start, end) of a single "bytes=" range, end included.
+    None when the header should be ignored (multiple ranges, other units, garbage), ValueError when unsatisfiable.
+    """
+    match = RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range, the last <end> bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"range {range_header} outside of {size} bytes")
+    return start, end
+
+def file_response(request, tag, open_file, content_type, size, cache_control):
+    """
+    Serve a file that never changes under tag as a strong ETag: 304 when the client already has it, 206 for a byte range.
+    open_file() opens the file for reading, it's only called when bytes are actually sent.
+    """
+    etag = f'"{tag}"'
+    headers = {'ETag': etag, 'Cache-Control': cache_control, 'Accept-Ranges': 'bytes'}
+
+    if etag_matches(request.headers.get('If-None-Match', ''), etag):
+        response = HttpResponse(status=304, headers=headers)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    byte_range = None
+    range_header = request.headers.get('Range')
+    # If-Range: only send the range if the client has this version, the whole thing otherwise
+    if range_header and request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416, headers={**headers, 'Content-Range': f"bytes */{size}"})
+            patch_vary_headers(response, ['Authorization'])
+            return response
+
+    if byte_range is None:
+        response = FileResponse(open_file(), content_type=content_type, headers=headers)
+    else:
+        start, end = byte_range
+        with open_file() as file:
+            file.seek(start)
+            data = file.read(end - start + 1)
+        response = HttpResponse(data, status=206, content_type=content_type, headers={
+            **headers, 'Content-Range': f"bytes {start}-{end}/{size}",
+        })
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+def blob_response(request, sha256, content_type, size, cache_control):
+    return file_response(request, sha256, lambda: open_blob(sha256), content_type, size, cache_control)
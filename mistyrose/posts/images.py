@@ -0,0 +1,149 @@
+import io
+import os
+import threading
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .blobs import file_response
+
+# ?fmt= -> (Pillow format, content type), not ?format= which DRF keeps for picking a renderer
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+
+_evict_lock = threading.Lock()
+_writes_since_eviction = {}  # cache directory -> files written to it since it was last evicted
+
+
+def get_width_bucket(width):
+    """
+    Smallest configured width that is at least width, so only a few sizes of every image are ever rendered.
+    """
+    for bucket in settings.IMAGE_WIDTHS:
+        if bucket >= width:
+            return bucket
+    return settings.IMAGE_WIDTHS[-1]
+
+def get_derivative_format(content_type):
+    # variants keep the format of the original unless asked otherwise
+    return 'jpeg' if content_type == 'image/jpeg' else 'png'
+
+def get_derivative_path(key, width, fmt):
+    return os.path.join(settings.IMAGE_DERIVATIVE_DIR, key[:2], f"{key}-{width or 'full'}.{fmt}")
+
+def render_derivative(data, width, fmt):
+    """
+    Resize image bytes down to width (None keeps the original size, images are never upscaled) and encode them as fmt.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if width and image.width > width:
+            image.thumbnail((width, image.height), Image.LANCZOS)
+
+        pillow_format = DERIVATIVE_FORMATS[fmt][0]
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        if pillow_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        if pillow_format == 'PNG':
+            image.save(output, pillow_format, optimize=True)
+        else:
+            image.save(output, pillow_format, quality=80)
+        return output.getvalue()
+
+def get_derivative(key, load_data, width, fmt):
+    """
+    Path of a variant of the image identified by key, rendered the first time it's asked for.
+    load_data() returns the original image bytes, it's only called when the variant isn't cached.
+    """
+    path = get_derivative_path(key, width, fmt)
+    try:
+        # mark as recently used, eviction goes by mtime
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+
+    data = render_derivative(load_data(), width, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write then rename, so a concurrent request never serves a half written file
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, 'wb') as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+
+    evict_after_writes(settings.IMAGE_DERIVATIVE_DIR, settings.IMAGE_DERIVATIVE_CACHE_SIZE)
+    return path
+
+def evict_after_writes(directory, max_size):
+    """
+    Count a file written to a cache directory, and evict it every IMAGE_CACHE_EVICT_EVERY writes.
+    The directory can go over max_size by that many files in between.
+    """
+    with _evict_lock:
+        writes = _writes_since_eviction.get(directory, 0) + 1
+        _writes_since_eviction[directory] = 0 if writes >= settings.IMAGE_CACHE_EVICT_EVERY else writes
+    if writes >= settings.IMAGE_CACHE_EVICT_EVERY:
+        evict_least_recently_used(directory, max_size)
+
+def evict_derivatives():
+    """
+    Delete the least recently used variants until the cache fits in IMAGE_DERIVATIVE_CACHE_SIZE.
+    """
+    evict_least_recently_used(settings.IMAGE_DERIVATIVE_DIR, settings.IMAGE_DERIVATIVE_CACHE_SIZE)
+
+def evict_least_recently_used(directory, max_size):
+    """
+    Delete the files of a cache directory with the oldest mtime until it holds at most max_size bytes.
+    """
+    with _evict_lock:
+        files = []
+        for path_directory, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(path_directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def derivative_response(request, key, load_data, content_type, cache_control):
+    """
+    Serve the ?w=<width>&fmt=<webp|jpeg|png> variant of an image.
+    Raises ValueError if the parameters or the image are invalid.
+    """
+    width = request.query_params.get('w')
+    if width is not None:
+        width = int(width)
+        if width <= 0:
+            raise ValueError(f"invalid width {width}")
+        width = get_width_bucket(width)
+
+    fmt = request.query_params.get('fmt') or get_derivative_format(content_type)
+    if fmt not in DERIVATIVE_FORMATS:
+        raise ValueError(f"unsupported format {fmt}, use one of {', '.join(DERIVATIVE_FORMATS)}")
+
+    try:
+        path = get_derivative(key, load_data, width, fmt)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ValueError(f"could not render the image: {e}")
+
+    return file_response(
+        request, os.path.basename(path), lambda: open(path, 'rb'), DERIVATIVE_FORMATS[fmt][1],
+        os.path.getsize(path), cache_control,
+    )
@@ -0,0 +1,34 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from posts.models import Post, Comment, Like
+
+
+def count_subquery(queryset, field):
+    """
+    Count the rows of queryset grouped by field, as a subquery that can be used in an update().
+    """
+    counts = queryset.values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized likes_count/comments_count columns of posts and comments from the actual rows."
+
+    def handle(self, *args, **options):
+        post_type = ContentType.objects.get_for_model(Post)
+        comment_type = ContentType.objects.get_for_model(Comment)
+
+        with transaction.atomic():
+            posts = Post.objects.update(
+                likes_count=count_subquery(Like.objects.filter(content_type=post_type, object_id=OuterRef('pk')), 'object_id'),
+                comments_count=count_subquery(Comment.objects.filter(post_id=OuterRef('pk')), 'post_id'),
+            )
+            comments = Comment.objects.update(
+                likes_count=count_subquery(Like.objects.filter(content_type=comment_type, object_id=OuterRef('pk')), 'object_id'),
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Recounted {posts} post(s) and {comments} comment(s)"))
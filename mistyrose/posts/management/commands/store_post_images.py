@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Move the base64 content of existing image posts into the blob storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help="Posts loaded at a time")
+
+    def handle(self, *args, **options):
+        posts = Post.objects.filter(content_type__startswith='image/', image_blob__isnull=True).exclude(Q(content='') | Q(content__isnull=True))
+
+        stored = failed = 0
+        for post in posts.iterator(chunk_size=options['batch_size']):
+            post.store_image()
+            if post.image_blob_id:
+                post.save(update_fields=['image_blob', 'content'])
+                stored += 1
+            else:
+                failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Stored the images of {stored} post(s), {failed} could not be decoded"))
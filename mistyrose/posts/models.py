@@ -1,13 +1,105 @@
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Greatest
 import uuid
 from django.contrib.contenttypes.fields import GenericRelation, GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError # Remove this!
+import base64
+from urllib.parse import urlencode
+
+from .blobs import decode_base64_image, save_blob, read_blob
 
 def get_upload_path(instance, filename):
     return f'posts/{instance.author_id}/{instance.id}/{filename}'
 
+def skip_counter_fields(instance, update_fields, counter_fields):
+    """
+    Counters are only changed with F() updates, so saving an existing row must not write back a stale in-memory value.
+    """
+    if instance._state.adding or update_fields is not None:
+        return update_fields
+    return [field.name for field in instance._meta.concrete_fields if not field.primary_key and field.name not in counter_fields]
+
+class PostQuerySet(models.QuerySet):
+    def visible_to(self, author):
+        """
+        Posts that author is allowed to read, as a single query:
+        - PUBLIC posts, from anyone
+        - UNLISTED and SHARED posts from authors they follow
+        - FRIENDS posts from authors they follow who follow them back
+        - all of their own posts
+        """
+        from users.models import Follows
+
+        following_ids = Follows.objects.filter(local_follower_id=author, status='ACCEPTED').values('followed_id')
+        followers_ids = Follows.objects.filter(followed_id=author, status='ACCEPTED').values('local_follower_id')
+
+        is_following = models.Q(author_id__in=following_ids)
+        is_friend = is_following & models.Q(author_id__in=followers_ids)
+
+        return self.filter(
+            models.Q(author_id=author) |
+            models.Q(visibility='PUBLIC') |
+            (models.Q(visibility__in=['UNLISTED', 'SHARED']) & is_following) |
+            (models.Q(visibility='FRIENDS') & is_friend)
+        )
+
+    def in_stream_of(self, author):
+        """
+        Posts that belong in author's home stream (stream/timeline.py): the ones visible_to them,
+        except PUBLIC posts of remote authors they don't follow.
+        """
+        from users.models import Follows
+
+        following_ids = Follows.objects.filter(local_follower_id=author, status='ACCEPTED').values('followed_id')
+        return self.visible_to(author).filter(
+            ~models.Q(visibility='PUBLIC') | models.Q(author_id__user__isnull=False) | models.Q(author_id__in=following_ids)
+        )
+
+    def readable_by(self, author):
+        """
+        Posts author can open by their id: the ones visible_to them, and UNLISTED posts (anyone with the link).
+        author None (a user without an author) only gets PUBLIC and UNLISTED posts.
+        """
+        readable = models.Q(visibility__in=['PUBLIC', 'UNLISTED'])
+        if author is not None:
+            readable |= models.Q(pk__in=Post.objects.visible_to(author).values('pk'))
+        return self.filter(readable)
+
+    def with_related(self):
+        """
+        Load everything PostSerializer needs up front (author, comments with their authors and likes, likes with
+        their authors) so serializing a page of posts takes a constant number of queries.
+        Counts come from the likes_count/comments_count columns.
+        """
+        comment_likes = Like.objects.select_related('author_id').order_by('-published')
+        comments = Comment.objects.select_related('author_id').prefetch_related(
+            models.Prefetch('likes', queryset=comment_likes)
+        )
+        return self.select_related('author_id').prefetch_related(
+            models.Prefetch('comments', queryset=comments),
+            models.Prefetch('likes', queryset=Like.objects.select_related('author_id')),
+        )
+
+class ImageBlob(models.Model):
+    """
+    An image stored in the blob storage under the sha256 of its bytes, shared by every post with the same image.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    content_type = models.CharField(max_length=50)
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def store(cls, data, content_type):
+        sha256 = save_blob(data)
+        blob, created = cls.objects.get_or_create(sha256=sha256, defaults={'content_type': content_type, 'size': len(data)})
+        return blob
+
+    def __str__(self):
+        return self.sha256
+
 # Create your models here.
 class Post(models.Model):
     TYPE_CHOICES = [('post', 'Post')]
@@ -39,16 +131,75 @@ class Post(models.Model):
     published = models.DateTimeField(auto_now=True)
     visibility = models.CharField(max_length=10, choices=VISIBILITY_CHOICES, default='PUBLIC')
     original_url = models.JSONField(blank=True, null=True)
+    # image posts keep their image here instead of base64 in content (decoded once, in save())
+    image_blob = models.ForeignKey(ImageBlob, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name='posts')
+
+    # denormalized counters, kept up to date by Like/Comment save() and delete() (repair with `manage.py recount_posts`)
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
 
     # generic relation for reverse lookup for 'Like' objects on the post - because we are using generic foreign key in the like
     likes = GenericRelation('Like')
 
+    objects = PostQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         # create url using the author's url and post id 
         if not self.url:
             self.url = f"{self.author_id.url.rstrip('/')}/posts/{self.id}/"
+        self.store_image()
+        kwargs['update_fields'] = skip_counter_fields(self, kwargs.get('update_fields'), ['likes_count', 'comments_count'])
         super().save(*args, **kwargs)
 
+    def store_image(self):
+        """
+        Move the base64 content of an image post into the blob storage, leaving content empty.
+        Content that isn't a base64 image (a url, text) is left as it is.
+        """
+        if not self.content_type.startswith('image/'):
+            self.image_blob = None
+            return
+        if not self.content:
+            return
+
+        try:
+            data = decode_base64_image(self.content)
+        except ValueError as e:
+            print(f"Could not decode the image of post {self.id}, keeping it as text: {e}")
+            return
+        self.image_blob = ImageBlob.store(data, self.content_type.split(';')[0])
+        self.content = ''
+
+    def get_image_data(self):
+        """
+        Bytes of the image of an image post, None if it has no blob.
+        """
+        if not self.image_blob_id:
+            return None
+        return read_blob(self.image_blob_id)
+
+    def get_image_url(self, width=None, fmt=None):
+        """
+        Versioned url of the image of an image post (or of one of its variants), cacheable forever.
+        """
+        if not self.image_blob_id:
+            return None
+        params = {}
+        if width:
+            params['w'] = width
+        if fmt:
+            params['fmt'] = fmt
+        params['v'] = self.image_blob_id
+        return f"{self.url.rstrip('/')}/image/?{urlencode(params)}"
+
+    def get_content(self):
+        """
+        Content as sent over the API, image posts get their image back as base64.
+        """
+        if self.image_blob_id:
+            return base64.b64encode(self.get_image_data()).decode('ascii')
+        return self.content
+
     def __str__(self):
         return self.title
     
@@ -61,6 +212,10 @@ class Post(models.Model):
       
     class Meta:
         ordering = ['-published']
+        indexes = [
+            # an author's posts of one visibility, newest first (profiles)
+            models.Index(fields=['author_id', 'visibility', '-published'], name='post_author_visibility_idx'),
+        ]
       
 class Like(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -80,10 +235,41 @@ class Like(models.Model):
         # create url using the author's url and like id 
         if not self.url:
             self.url = f"{self.author_id.url.rstrip('/')}/liked/{self.id}/"
-        super().save(*args, **kwargs)
+
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                self.update_likes_count(1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.update_likes_count(-1)
+        return result
+
+    def update_likes_count(self, delta):
+        """
+        Add delta to the likes_count of the liked post or comment.
+        """
+        if not self.content_type_id or not self.object_id:
+            return
+
+        model = ContentType.objects.get_for_id(self.content_type_id).model_class()
+        if model in (Post, Comment):
+            # never below 0, the counter can't go negative even if it was behind the rows
+            model.objects.filter(pk=self.object_id).update(likes_count=Greatest(models.F('likes_count') + delta, 0))
 
     def __str__(self):
       return f'{self.author_id} like'
+
+    class Meta:
+        indexes = [
+            # likes of a post or comment
+            models.Index(fields=['content_type', 'object_id'], name='like_object_idx'),
+            # has this author already liked this object
+            models.Index(fields=['author_id', 'object_url'], name='like_author_object_url_idx'),
+        ]
     
 class Comment(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -95,6 +281,9 @@ class Comment(models.Model):
     content_type = models.CharField(max_length=50, blank=True, null=True, default='text/plain')
     page = models.URLField(blank=True, null=True)
 
+    # denormalized counter, kept up to date by Like save() and delete()
+    likes_count = models.PositiveIntegerField(default=0, editable=False)
+
     # generic relation for reverse lookup for 'Like' objects on the post - because we are using generic foreign key in the like
     likes = GenericRelation('Like')
 
@@ -102,7 +291,19 @@ class Comment(models.Model):
         # create url using the author's url and comment id 
         if not self.url:
             self.url = f"{self.author_id.url.rstrip('/')}/commented/{self.id}/"
-        super().save(*args, **kwargs)
+        kwargs['update_fields'] = skip_counter_fields(self, kwargs.get('update_fields'), ['likes_count'])
+
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                Post.objects.filter(pk=self.post_id_id).update(comments_count=models.F('comments_count') + 1)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Post.objects.filter(pk=self.post_id_id).update(comments_count=Greatest(models.F('comments_count') - 1, 0))
+        return result
     
     def __str__(self):
       return f'{self.author_id} commented on {self.post_id}'
@@ -1,4 +1,10 @@
 # asked chatGPT how to paginate a list of objects with ListAPIView 2024-10-31
+import base64
+import json
+import uuid
+from datetime import datetime
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import PageNumberPagination
 
 class LikesPagination(PageNumberPagination):
@@ -18,4 +24,60 @@ class CustomPostsPagination(PageNumberPagination):
             "size": self.page.paginator.per_page,
             "count": self.page.paginator.count,
             "src": data,
-        }
\ No newline at end of file
+        }
+
+class StreamCursorPagination:
+    """
+    Keyset pagination for the home stream.
+
+    The cursor is an opaque token holding the (published, post id) of the last row sent, the next page is
+    everything strictly after it in the stream order. Unlike page numbers this reads the same number of
+    index rows for page 100 as for page 1.
+    """
+    default_limit = 20
+    max_limit = 100
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    # fields of the paginated model that make up the stream order (newest first)
+    published_field = 'published'
+    id_field = 'post_id'
+
+    def paginate_queryset(self, queryset, request):
+        self.limit = self.get_limit(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            published, object_id = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(**{f'{self.published_field}__lt': published}) |
+                Q(**{self.published_field: published, f'{self.id_field}__lt': object_id})
+            )
+
+        # fetch one extra row to know if there is a next page
+        rows = list(queryset.order_by(f'-{self.published_field}', f'-{self.id_field}')[:self.limit + 1])
+        self.has_next = len(rows) > self.limit
+        rows = rows[:self.limit]
+
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params.get(self.limit_query_param, self.default_limit))
+        except ValueError:
+            return self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def encode_cursor(self, row):
+        position = {
+            'published': getattr(row, self.published_field).isoformat(),
+            'id': str(getattr(row, self.id_field)),
+        }
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(position['published']), uuid.UUID(position['id'])
+        except (ValueError, TypeError, KeyError):
+            raise ValidationError({"cursor": "Invalid cursor"})
@@ -0,0 +1,181 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse
+
+import requests
+from django.conf import settings
+from django.db import connection
+from django.utils.crypto import constant_time_compare, salted_hmac
+from PIL import Image, UnidentifiedImageError
+
+from node.client import node_get
+from node.models import Node
+from .blobs import decode_base64_image
+from .images import evict_after_writes
+
+# ![alt](http://...) in markdown
+MARKDOWN_IMAGE_RE = re.compile(r"(!\[[^\]]*\]\()\s*(https?://[^)\s]+)([^)]*\))")
+
+# formats we agree to serve, anything else a node sends back is dropped
+REMOTE_IMAGE_FORMATS = ['png', 'jpeg', 'gif', 'webp']
+
+# fetches run in the background so feed requests never wait for a remote node
+remote_images_executor = ThreadPoolExecutor(max_workers=settings.REMOTE_IMAGE_WORKERS, thread_name_prefix='remote-images')
+# url -> Future of the fetch in progress, so an image is only fetched once however many feeds show it
+_fetching = {}
+# url -> time of the last failed fetch, not retried before REMOTE_IMAGE_RETRY_DELAY
+_failed = {}
+_fetching_lock = threading.Lock()
+
+
+def get_remote_image_key(url):
+    return hashlib.sha256(url.encode()).hexdigest()
+
+def get_cached_remote_image(url):
+    """
+    (path, content type) of the cached copy of a remote image, None if it isn't cached.
+    """
+    key = get_remote_image_key(url)
+    for fmt in REMOTE_IMAGE_FORMATS:
+        path = os.path.join(settings.REMOTE_IMAGE_CACHE_DIR, key[:2], f"{key}.{fmt}")
+        try:
+            # mark as recently used, eviction goes by mtime
+            os.utime(path)
+        except FileNotFoundError:
+            continue
+        return path, f"image/{fmt}"
+    return None
+
+def get_image_node(url, nodes=None):
+    """
+    Whitelisted node serving url, None if the url isn't on one of our nodes (we're not an open proxy).
+    nodes maps remote_node_url -> Node, pass it when looking up many urls.
+    """
+    parsed_url = urlparse(url)
+    node_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+    if nodes is not None:
+        return nodes.get(node_url)
+    return Node.objects.filter(remote_node_url=node_url, is_whitelisted=True).first()
+
+def read_response_body(response, url):
+    """
+    Body of a streamed response, raises ValueError as soon as it's known to be over REMOTE_IMAGE_MAX_BYTES.
+    """
+    max_bytes = settings.REMOTE_IMAGE_MAX_BYTES
+    content_length = response.headers.get('Content-Length')
+    if content_length and int(content_length) > max_bytes:
+        raise ValueError(f"{url} is too big ({content_length} bytes)")
+
+    body = bytearray()
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        body += chunk
+        if len(body) > max_bytes:
+            raise ValueError(f"{url} is too big (over {max_bytes} bytes)")
+    return bytes(body)
+
+def fetch_remote_image(node, url):
+    """
+    Download an image from a node into the cache and return its (path, content type).
+    Nodes answer with the image itself, or with a JSON data: url of it, REMOTE_IMAGE_MAX_BYTES at most.
+    """
+    response = node_get(node, url, stream=True)
+    try:
+        response.raise_for_status()
+        body = read_response_body(response, url)
+    finally:
+        response.close()
+
+    if response.headers.get('Content-Type', '').startswith('application/json'):
+        data_url = json.loads(body)
+        if not isinstance(data_url, str) or not data_url.startswith('data:image'):
+            raise ValueError(f"{url} didn't return an image")
+        data = decode_base64_image(data_url)
+    else:
+        data = body
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            fmt = (image.format or '').lower()
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        raise ValueError(f"{url} didn't return an image")
+    if fmt not in REMOTE_IMAGE_FORMATS:
+        raise ValueError(f"{url} returned an unsupported {fmt} image")
+
+    key = get_remote_image_key(url)
+    path = os.path.join(settings.REMOTE_IMAGE_CACHE_DIR, key[:2], f"{key}.{fmt}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, 'wb') as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+
+    evict_after_writes(settings.REMOTE_IMAGE_CACHE_DIR, settings.REMOTE_IMAGE_CACHE_SIZE)
+    return path, f"image/{fmt}"
+
+def fetch_remote_image_in_thread(node, url):
+    try:
+        return fetch_remote_image(node, url)
+    except (requests.RequestException, ValueError, OSError) as e:
+        print(f"Could not fetch remote image {url}: {e}")
+        with _fetching_lock:
+            now = time.monotonic()
+            # forget the failures that can be retried already, so _failed doesn't keep every url that ever failed
+            for failed_url, failed_at in list(_failed.items()):
+                if now - failed_at >= settings.REMOTE_IMAGE_RETRY_DELAY:
+                    del _failed[failed_url]
+            _failed[url] = now
+        return None
+    finally:
+        with _fetching_lock:
+            _fetching.pop(url, None)
+        connection.close()
+
+def fetch_remote_image_in_background(node, url):
+    """
+    Start fetching a remote image unless it's cached, already being fetched or failed recently.
+    Returns the Future of the fetch, None if there's nothing to fetch.
+    """
+    if get_cached_remote_image(url):
+        return None
+    with _fetching_lock:
+        if url in _fetching:
+            return _fetching[url]
+        failed_at = _failed.get(url)
+        if failed_at is not None and time.monotonic() - failed_at < settings.REMOTE_IMAGE_RETRY_DELAY:
+            return None
+        _failed.pop(url, None)
+        future = _fetching[url] = remote_images_executor.submit(fetch_remote_image_in_thread, node, url)
+        return future
+
+def get_remote_image_signature(url):
+    return salted_hmac('posts.remote_images.proxy', url).hexdigest()
+
+def check_remote_image_signature(url, signature):
+    """
+    True if signature was made by get_remote_image_signature for url, so the proxy only serves urls we put in posts.
+    """
+    return constant_time_compare(get_remote_image_signature(url), signature or '')
+
+def get_remote_image_proxy_url(url):
+    return f"/api/posts/images/proxy/?{urlencode({'url': url, 'sig': get_remote_image_signature(url)})}"
+
+def proxy_markdown_images(content, nodes):
+    """
+    Point the images of a markdown post that live on remote nodes at our proxy, and start caching them.
+    nodes maps remote_node_url -> Node for the whitelisted nodes.
+    """
+    def replace(match):
+        prefix, url, suffix = match.groups()
+        node = get_image_node(url, nodes)
+        if node is None:
+            return match.group(0)
+        fetch_remote_image_in_background(node, url)
+        return f"{prefix}{get_remote_image_proxy_url(url)}{suffix}"
+
+    return MARKDOWN_IMAGE_RE.sub(replace, content)
@@ -4,6 +4,7 @@ from rest_framework import serializers
 from .models import Post, Comment, Like
 import importlib
 from django.urls import reverse
+from django.conf import settings
 
 #region Comment Serializers        
 class CommentSerializer(serializers.ModelSerializer):
@@ -39,7 +40,11 @@ class CommentSerializer(serializers.ModelSerializer):
         return f"{post_author_host}/authors/{post_author_id}/posts/{post_id}" #"http://nodebbbb/api/authors/222/posts/249"
     
     def get_likes(self, comment_object):
-        likes = comment_object.likes.all().order_by('-published')
+        # likes prefetched by Post.objects.with_related() are already ordered, don't re-query them
+        if 'likes' in getattr(comment_object, '_prefetched_objects_cache', {}):
+            likes = list(comment_object.likes.all())
+        else:
+            likes = list(comment_object.likes.all().order_by('-published'))
 
         serializer = LikeSerializer(likes, many=True)
         
@@ -49,8 +54,8 @@ class CommentSerializer(serializers.ModelSerializer):
             "page": f"{host}/authors/{comment_object.author_id.id}/commented/{comment_object.id}/likes",
             "id": f"{host}/authors/{comment_object.author_id.id}/commented/{comment_object.id}/likes",
             "page_number": 1,
-            "size": comment_object.likes.count(),
-            "count": comment_object.likes.count(),
+            "size": len(likes),
+            "count": comment_object.likes_count,
             "src": serializer.data,  # List of serialized like data
         }
         
@@ -93,6 +98,7 @@ class PostSerializer(serializers.ModelSerializer):
     contentType = serializers.CharField(source='content_type', default='text/plain')
     #original_url = serializers.ListField(child=serializers.CharField(), allow_null=True, required=False)
     description = serializers.CharField(required=False, default='No Description', allow_null=True, allow_blank=True)
+    thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
@@ -103,6 +109,7 @@ class PostSerializer(serializers.ModelSerializer):
             'description',
             'contentType',
             'content',
+            'thumbnail',
             'author',
             'comments',
             'likes',
@@ -114,21 +121,28 @@ class PostSerializer(serializers.ModelSerializer):
        
         # Method to get likes count for a post
     def get_likes_count(self, post):
-        return Like.objects.filter(object_id=post.id).count()
+        return post.likes_count
+
+    def get_thumbnail(self, post):
+        # small variant of image posts for feed cards, gifs stay as they are so they keep their animation
+        if post.content_type.startswith('image/gif'):
+            return post.get_image_url()
+        return post.get_image_url(settings.IMAGE_THUMBNAIL_WIDTH, 'webp')
 
     # Method to get comments count for a post
     def get_comments_count(self, post):
-        return Comment.objects.filter(post_id=post.id).count()
+        return post.comments_count
     
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         
-        representation['author'] = AuthorSerializer(instance.author_id).data
         if representation['description'] is None:
             representation['description'] = 'No Description' 
         
         # if instance.content_type.startswith('image/'):
         #     representation['content'] = f"data:{instance.content_type};base64,{instance.content}"
+        if instance.image_blob_id:
+            representation['content'] = self.get_image_content(instance)
         
         # get id for post
         representation['id'] = self.get_id(instance)
@@ -138,6 +152,34 @@ class PostSerializer(serializers.ModelSerializer):
     def get_id(self, post_object): #get is for turning into JSON response
         author_host = post_object.author_id.host.rstrip('/')
         return f"{author_host}/authors/{post_object.author_id.id}/posts/{post_object.id}"
+
+    def get_image_content(self, post):
+        return post.get_content()
+
+def get_list_content(post):
+    """
+    (content, content_truncated) of a post in a list: the /image/ url instead of the image, long text cut short.
+    The full content is only returned by the post's own endpoint.
+    """
+    if post.content_type.startswith('image/'):
+        return post.get_image_url() or f"{post.url.rstrip('/')}/image/", False
+    content = post.content or ''
+    if len(content) > settings.POST_LIST_CONTENT_LENGTH:
+        return content[:settings.POST_LIST_CONTENT_LENGTH], True
+    return content, False
+
+class PostListSerializer(PostSerializer):
+    """
+    Compact PostSerializer for feeds and lists, a few KB per post whatever the size of its content.
+    """
+    def get_image_content(self, post):
+        # don't read and encode the image, it's replaced by its url
+        return None
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        representation['content'], representation['content_truncated'] = get_list_content(instance)
+        return representation
     
 #endregion
     
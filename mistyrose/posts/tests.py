@@ -6,6 +6,7 @@ from users.models import Author, Follows
 from posts.models import Comment, Like, Post
 import urllib.parse
 import json
+import time
 import uuid
 from django.contrib.contenttypes.models import ContentType
 from unittest.mock import patch
@@ -14,6 +15,36 @@ from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 from urllib.parse import urlparse
 import re
+from stream.timeline import fan_out_post
+from posts.serializers import PostSerializer, PostListSerializer
+from django.core.management import call_command
+from io import StringIO, BytesIO
+import base64
+import hashlib
+import tempfile
+from django.conf import settings
+from django.test import override_settings, tag
+from django.db import connection
+from django.utils import timezone
+from datetime import timedelta
+from stream.models import TimelineEntry
+from posts.models import ImageBlob
+from posts.blobs import get_blob_storage, get_blob_name
+from posts.images import get_derivative, evict_derivatives
+from posts.remote_images import fetch_remote_image, fetch_remote_image_in_thread, get_cached_remote_image, proxy_markdown_images, get_remote_image_proxy_url
+from node.models import Node
+from unittest.mock import Mock
+from PIL import Image
+import os
+
+# keep the images written by the tests out of MEDIA_ROOT
+TEST_STORAGES = {
+    **settings.STORAGES,
+    'blobs': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': tempfile.mkdtemp(), 'allow_overwrite': True},
+    },
+}
 
 #Basic test class, used for login settings
 class BaseTestCase(APITestCase):
@@ -76,6 +107,27 @@ class PostDetailsTestCase(BaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
 
+    def test_friends_post_details_are_only_for_friends(self):
+        poster = Author.objects.create(user=User.objects.create_user(username='poster', password='pass'), display_name='Poster')
+        post = Post.objects.create(author_id=poster, title='Friends only', content='hi', visibility='FRIENDS')
+        urls = [reverse('post-detail', args=[poster.id, post.id]), reverse('post-detail-fqid', args=[post.url])]
+
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        Follows.objects.create(local_follower_id=self.author, followed_id=poster, status='ACCEPTED')
+        Follows.objects.create(local_follower_id=poster, followed_id=self.author, status='ACCEPTED')
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['title'], 'Friends only')
+
+    def test_unlisted_post_details_are_for_anyone_with_the_link(self):
+        poster = Author.objects.create(display_name='Poster')
+        post = Post.objects.create(author_id=poster, title='Unlisted', content='hi', visibility='UNLISTED')
+        response = self.client.get(reverse('post-detail', args=[poster.id, post.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
 class AuthorPostsViewTestCase(BaseTestCase):
     def setUp(self):
         super().setUp()
@@ -134,11 +186,118 @@ class PublicPostsViewTestCase(BaseTestCase):
             content='This is another public post.',
             visibility='PUBLIC'
         )
+        # posts made through the ORM skip the views, add them to the streams directly
+        fan_out_post(self.post1)
+        fan_out_post(self.post2)
 
     def test_get_public_posts(self):
         response = self.client.get('/api/posts/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)  # should return two posts
+        self.assertEqual(len(response.data['posts']), 2)  # should return two posts
+        self.assertIsNone(response.data['next'])
+
+    def test_get_public_posts_cursor_pagination(self):
+        for i in range(3):
+            fan_out_post(Post.objects.create(author_id=self.author2, title=f'Extra Post {i}', content='more', visibility='PUBLIC'))
+
+        titles = []
+        cursor = None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/api/posts/', params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['posts']), 2)
+            titles += [post['title'] for post in response.data['posts']]
+            cursor = response.data['next']
+            if not cursor:
+                break
+
+        # every post exactly once, newest first
+        expected = list(Post.objects.order_by('-published', '-id').values_list('title', flat=True))
+        self.assertEqual(titles, expected)
+
+    def test_get_public_posts_invalid_cursor(self):
+        response = self.client.get('/api/posts/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class PostSerializerQueryCountTest(TestCase):
+    def setUp(self):
+        self.author = Author.objects.create(display_name='Poster', host='http://localhost:8000')
+        self.readers = [Author.objects.create(display_name=f'Reader {i}', host='http://localhost:8000') for i in range(3)]
+        self.post_type = ContentType.objects.get_for_model(Post)
+        self.comment_type = ContentType.objects.get_for_model(Comment)
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(author_id=self.author, title=f'Post {i}', content='content', visibility='PUBLIC')
+            for reader in self.readers:
+                comment = Comment.objects.create(author_id=reader, post_id=post, comment='nice')
+                Like.objects.create(author_id=reader, content_type=self.post_type, object_id=post.id, object_url=post.url)
+                Like.objects.create(author_id=reader, content_type=self.comment_type, object_id=comment.id, object_url=comment.url)
+
+    def serialize_all(self):
+        return PostSerializer(Post.objects.with_related(), many=True).data
+
+    def test_constant_queries_for_any_number_of_posts(self):
+        # posts (with authors and counts), comments, likes on comments, likes on posts
+        self.create_posts(2)
+        with self.assertNumQueries(4):
+            data = self.serialize_all()
+        self.assertEqual(len(data), 2)
+
+        self.create_posts(10)
+        with self.assertNumQueries(4):
+            data = self.serialize_all()
+        self.assertEqual(len(data), 12)
+        self.assertEqual(len(data[0]['comments']), 3)
+        self.assertEqual(len(data[0]['likes']), 3)
+        self.assertEqual(data[0]['comments'][0]['likes']['count'], 1)
+
+    def test_counters_follow_likes_and_comments(self):
+        self.create_posts(1)
+        post = Post.objects.get()
+        comment = post.comments.first()
+        self.assertEqual(post.likes_count, 3)
+        self.assertEqual(post.comments_count, 3)
+        self.assertEqual(comment.likes_count, 1)
+
+        # saving a stale instance must not overwrite the counters
+        post.likes_count = 0
+        post.title = 'Edited'
+        post.save()
+        post.likes.first().delete()
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.title, 'Edited')
+        self.assertEqual(post.likes_count, 2)
+        self.assertEqual(post.comments_count, 2)
+
+    def test_counters_never_go_below_zero(self):
+        self.create_posts(1)
+        post = Post.objects.get()
+        comment = post.comments.first()
+        # counters behind the rows, e.g. before recount_posts was run
+        Post.objects.update(likes_count=0, comments_count=0)
+
+        post.likes.first().delete()
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.likes_count, 0)
+        self.assertEqual(post.comments_count, 0)
+
+    def test_recount_posts_command(self):
+        self.create_posts(2)
+        Post.objects.update(likes_count=0, comments_count=10)
+        Comment.objects.update(likes_count=5)
+
+        call_command('recount_posts', stdout=StringIO())
+
+        for post in Post.objects.all():
+            self.assertEqual(post.likes_count, 3)
+            self.assertEqual(post.comments_count, 3)
+        self.assertFalse(Comment.objects.exclude(likes_count=1).exists())
 
 #region Comments Tests
 #asked chatGPT to assist with writing test cases for comments endpoints 2024-11-04
@@ -961,6 +1120,7 @@ class PlainTextPostTest(APITestCase):
         self.assertEqual(get_response.data['contentType'], "text/plain")
 
 # User Story #14 Test: As an author, posts I create can be images, so that I can share pictures and drawings.
+@override_settings(STORAGES=TEST_STORAGES)
 class ImagePostTest(APITestCase):
     def setUp(self):
         # Create test users and authors
@@ -1298,4 +1458,478 @@ class DeletePostResendTestCase(APITestCase):
         self.assertEqual(called_args[2].get("visibility"), "DELETED")
         self.assertEqual(actual_id, expected_id)
 
+@override_settings(STORAGES=TEST_STORAGES)
+class ImageBlobStorageTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='blobuser', password='blobpass')
+        self.author = Author.objects.create(user=self.user, display_name="Blob Author")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.image = make_png(64, 32)
+        self.encoded_image = base64.b64encode(self.image).decode()
+        self.sha256 = hashlib.sha256(self.image).hexdigest()
+
+    def create_image_post(self, content):
+        return Post.objects.create(author_id=self.author, title='Image', content_type='image/png;base64', content=content)
+
+    def test_image_is_stored_once_and_content_is_emptied(self):
+        post1 = self.create_image_post(self.encoded_image)
+        post2 = self.create_image_post(f"data:image/png;base64,{self.encoded_image}")
+
+        self.assertEqual(ImageBlob.objects.count(), 1)
+        blob = ImageBlob.objects.get()
+        self.assertEqual(blob.sha256, self.sha256)
+        self.assertEqual(blob.content_type, 'image/png')
+        self.assertEqual(blob.size, len(self.image))
+        self.assertTrue(get_blob_storage().exists(get_blob_name(self.sha256)))
+
+        for post in (post1, post2):
+            post.refresh_from_db()
+            self.assertEqual(post.image_blob_id, self.sha256)
+            self.assertEqual(post.content, '')
+
+    def test_content_that_is_not_an_image_is_kept(self):
+        # a url, and valid base64 that isn't an image
+        for content in ('https://example.com/img.png', base64.b64encode(b'just some text').decode()):
+            post = self.create_image_post(content)
+            post.refresh_from_db()
+            self.assertEqual(post.content, content)
+            self.assertIsNone(post.image_blob_id)
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_api_still_returns_base64(self):
+        post = self.create_image_post(self.encoded_image)
+
+        response = self.client.get(f"/api/authors/{self.author.id}/posts/{post.id}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['content'], self.encoded_image)
+        self.assertEqual(PostSerializer(post).data['content'], self.encoded_image)
+
+    def test_image_view_serves_blob(self):
+        post = self.create_image_post(self.encoded_image)
+
+        response = self.client.get(f"/api/authors/{self.author.id}/posts/{post.id}/image/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['ETag'], f'"{self.sha256}"')
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        self.assertEqual(b''.join(response.streaming_content), self.image)
+
+    def test_image_view_not_modified(self):
+        post = self.create_image_post(self.encoded_image)
+        url = f"/api/authors/{self.author.id}/posts/{post.id}/image/"
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"other", "{self.sha256}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], f'"{self.sha256}"')
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_image_view_versioned_url_is_immutable(self):
+        post = self.create_image_post(self.encoded_image)
+
+        response = self.client.get(f"/api/authors/{self.author.id}/posts/{post.id}/image/?v={self.sha256}")
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_image_view_byte_ranges(self):
+        post = self.create_image_post(self.encoded_image)
+        url = f"/api/authors/{self.author.id}/posts/{post.id}/image/"
+        size = len(self.image)
+
+        response = self.client.get(url, HTTP_RANGE='bytes=8-15')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f"bytes 8-15/{size}")
+        self.assertEqual(response.content, self.image[8:16])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, self.image[-4:])
+
+        response = self.client.get(url, HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f"bytes */{size}")
+
+        # stale If-Range gets the whole image
+        response = self.client.get(url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_switching_to_text_drops_blob(self):
+        post = self.create_image_post(self.encoded_image)
+
+        post.content_type = 'text/plain'
+        post.content = 'just text now'
+        post.save()
+        post.refresh_from_db()
+        self.assertIsNone(post.image_blob_id)
+        self.assertEqual(post.get_content(), 'just text now')
+
+    def test_store_post_images_command(self):
+        post = self.create_image_post('')
+        # a post saved before blobs existed
+        Post.objects.filter(pk=post.pk).update(content=self.encoded_image)
+
+        out = StringIO()
+        call_command('store_post_images', stdout=out)
+        post.refresh_from_db()
+        self.assertEqual(post.image_blob_id, self.sha256)
+        self.assertEqual(post.content, '')
+        self.assertIn('Stored the images of 1 post(s)', out.getvalue())
+
+def make_png(width, height):
+    output = BytesIO()
+    Image.new('RGB', (width, height), (200, 30, 90)).save(output, 'PNG')
+    return output.getvalue()
+
+@override_settings(STORAGES=TEST_STORAGES)
+class ImageDerivativeTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='thumbuser', password='thumbpass')
+        self.author = Author.objects.create(user=self.user, display_name="Thumb Author")
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
 
+        derivative_dir = tempfile.mkdtemp()
+        override = override_settings(IMAGE_DERIVATIVE_DIR=derivative_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.image = make_png(800, 400)
+        self.post = Post.objects.create(
+            author_id=self.author, title='Big', content_type='image/png;base64', content=base64.b64encode(self.image).decode()
+        )
+        self.image_url = f"/api/authors/{self.author.id}/posts/{self.post.id}/image/"
+
+    def test_resized_webp_variant(self):
+        response = self.client.get(self.image_url, {'w': 300, 'fmt': 'webp'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+
+        # 300 is rounded up to the 320 bucket, aspect ratio is kept
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (320, 160))
+
+    def test_variant_is_rendered_once(self):
+        self.client.get(self.image_url, {'w': 160})
+        with patch('posts.images.render_derivative') as render:
+            response = self.client.get(self.image_url, {'w': 160})
+        render.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_never_upscales(self):
+        response = self.client.get(self.image_url, {'w': 5000})
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (800, 400))
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(self.image_url, {'w': 'big'}).status_code, 400)
+        self.assertEqual(self.client.get(self.image_url, {'fmt': 'bmp'}).status_code, 400)
+
+    def test_least_recently_used_variants_are_evicted(self):
+        load = lambda: self.image
+        oldest = get_derivative('a' * 64, load, 64, 'png')
+        newest = get_derivative('b' * 64, load, 64, 'png')
+        os.utime(oldest, (1, 1))
+
+        with override_settings(IMAGE_DERIVATIVE_CACHE_SIZE=os.path.getsize(newest)):
+            evict_derivatives()
+        self.assertFalse(os.path.exists(oldest))
+        self.assertTrue(os.path.exists(newest))
+
+    @override_settings(IMAGE_CACHE_EVICT_EVERY=3)
+    def test_cache_is_evicted_every_few_writes(self):
+        load = lambda: self.image
+        with patch('posts.images.evict_least_recently_used') as evict:
+            for width in (64, 160):
+                get_derivative('c' * 64, load, width, 'png')
+            evict.assert_not_called()
+            get_derivative('c' * 64, load, 320, 'png')
+            evict.assert_called_once()
+
+    def test_decompression_bomb_is_rejected(self):
+        with patch('PIL.Image.MAX_IMAGE_PIXELS', 100):
+            response = self.client.get(self.image_url, {'w': 64})
+        self.assertEqual(response.status_code, 400)
+
+    def test_serializer_references_thumbnail(self):
+        thumbnail = PostSerializer(self.post).data['thumbnail']
+        self.assertIn(f"/posts/{self.post.id}/image/?w=320&fmt=webp&v={self.post.image_blob_id}", thumbnail)
+
+        text_post = Post.objects.create(author_id=self.author, title='Text', content='hello')
+        self.assertIsNone(PostSerializer(text_post).data['thumbnail'])
+
+@override_settings(STORAGES=TEST_STORAGES, POST_LIST_CONTENT_LENGTH=100)
+class PostListSerializerTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='listuser', password='listpass')
+        self.author = Author.objects.create(user=self.user, display_name="List Author", host='http://localhost:8000/api/')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.encoded_image = base64.b64encode(make_png(40, 20)).decode()
+        self.image_post = Post.objects.create(author_id=self.author, title='Image', content_type='image/png;base64', content=self.encoded_image)
+        self.long_post = Post.objects.create(author_id=self.author, title='Long', content='x' * 500)
+        self.short_post = Post.objects.create(author_id=self.author, title='Short', content='short')
+        for post in (self.image_post, self.long_post, self.short_post):
+            fan_out_post(post)
+
+    def test_list_representation_is_compact(self):
+        with patch('posts.models.read_blob') as read_blob:
+            data = {post['title']: post for post in PostListSerializer([self.image_post, self.long_post, self.short_post], many=True).data}
+        # the image is never read for a list
+        read_blob.assert_not_called()
+
+        self.assertEqual(data['Image']['content'], self.image_post.get_image_url())
+        self.assertFalse(data['Image']['content_truncated'])
+        self.assertEqual(data['Long']['content'], 'x' * 100)
+        self.assertTrue(data['Long']['content_truncated'])
+        self.assertEqual(data['Short']['content'], 'short')
+        self.assertFalse(data['Short']['content_truncated'])
+
+    def test_feed_and_author_posts_are_compact(self):
+        feed = self.client.get('/api/posts/')
+        author_posts = self.client.get(f'/api/authors/{self.author.id}/posts/')
+
+        for response in (feed, author_posts):
+            self.assertEqual(response.status_code, 200)
+            body = response.content.decode()
+            self.assertNotIn(self.encoded_image, body)
+            self.assertNotIn('x' * 101, body)
+
+    def test_author_posts_are_complete_for_nodes(self):
+        Node.objects.create(remote_node_url="http://peer-node.com", local_username="peer", local_password="peer-secret", is_whitelisted=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Basic {base64.b64encode(b'peer:peer-secret').decode()}")
+        response = self.client.get(f'/api/authors/{self.author.id}/posts/')
+        self.assertEqual(response.status_code, 200)
+
+        data = {post['title']: post for post in response.data['src']}
+        self.assertEqual(data['Image']['content'], self.encoded_image)
+        self.assertEqual(data['Long']['content'], 'x' * 500)
+        self.assertNotIn('content_truncated', data['Long'])
+
+    def test_details_return_full_content(self):
+        response = self.client.get(f'/api/authors/{self.author.id}/posts/{self.long_post.id}/')
+        self.assertEqual(response.data['content'], 'x' * 500)
+
+        response = self.client.get(f'/api/authors/{self.author.id}/posts/{self.image_post.id}/')
+        self.assertEqual(response.data['content'], self.encoded_image)
+
+class RemoteImageProxyTest(APITestCase):
+    def setUp(self):
+        override = override_settings(REMOTE_IMAGE_CACHE_DIR=tempfile.mkdtemp())
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user(username='proxyuser', password='proxypass')
+        self.author = Author.objects.create(user=self.user, display_name="Proxy Author", host='http://localhost:8000/api/')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.node = Node.objects.create(
+            remote_node_url='http://remote-node.com', remote_username='u', remote_password='p', is_whitelisted=True
+        )
+        self.image = make_png(10, 10)
+        self.image_url = 'http://remote-node.com/api/authors/1/posts/2/image'
+
+    def image_response(self, body=None, content_type='image/png'):
+        body = self.image if body is None else body
+        response = Mock(status_code=200, headers={'Content-Type': content_type, 'Content-Length': str(len(body))})
+        response.iter_content.return_value = [body]
+        return response
+
+    def test_markdown_images_on_nodes_are_proxied(self):
+        content = f"hi ![cat]({self.image_url}) and ![dog](http://elsewhere.com/dog.png)"
+        with patch('posts.remote_images.fetch_remote_image_in_background') as fetch:
+            proxied = proxy_markdown_images(content, {self.node.remote_node_url: self.node})
+
+        fetch.assert_called_once_with(self.node, self.image_url)
+        self.assertIn(f"![cat]({get_remote_image_proxy_url(self.image_url)})", proxied)
+        self.assertIn("![dog](http://elsewhere.com/dog.png)", proxied)
+
+    def test_feed_does_not_fetch_or_save(self):
+        remote_author = Author.objects.create(display_name='Remote', host='http://remote-node.com/api/')
+        Follows.objects.create(local_follower_id=self.author, followed_id=remote_author, status='ACCEPTED')
+        content = f"![cat]({self.image_url})"
+        post = Post.objects.create(author_id=remote_author, title='Remote', content_type='text/markdown', content=content)
+        fan_out_post(post)
+
+        with patch('posts.remote_images.fetch_remote_image_in_background') as fetch, \
+                patch('posts.remote_images.node_get') as node_get:
+            response = self.client.get('/api/posts/')
+
+        self.assertEqual(response.status_code, 200)
+        node_get.assert_not_called()
+        fetch.assert_called_once()
+        self.assertEqual(response.data['posts'][0]['content'], f"![cat]({get_remote_image_proxy_url(self.image_url)})")
+        post.refresh_from_db()
+        self.assertEqual(post.content, content)
+
+    def test_image_is_fetched_once_and_served(self):
+        with patch('posts.remote_images.node_get', return_value=self.image_response()) as node_get:
+            response = self.client.get(get_remote_image_proxy_url(self.image_url))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertTrue(response['Cache-Control'].startswith('private'))
+            self.assertEqual(b''.join(response.streaming_content), self.image)
+
+            response = self.client.get(get_remote_image_proxy_url(self.image_url))
+            self.assertEqual(response.status_code, 200)
+        node_get.assert_called_once()
+
+    def test_data_url_responses(self):
+        data_url = f"data:image/png;base64,{base64.b64encode(self.image).decode()}"
+        response = self.image_response(json.dumps(data_url).encode(), 'application/json')
+        with patch('posts.remote_images.node_get', return_value=response):
+            path, content_type = fetch_remote_image(self.node, self.image_url)
+
+        self.assertEqual(content_type, 'image/png')
+        self.assertEqual(get_cached_remote_image(self.image_url), (path, 'image/png'))
+
+    def test_oversized_images_are_not_downloaded(self):
+        with override_settings(REMOTE_IMAGE_MAX_BYTES=len(self.image) - 1):
+            # announced too big, the body isn't read
+            response = self.image_response()
+            with patch('posts.remote_images.node_get', return_value=response):
+                with self.assertRaises(ValueError):
+                    fetch_remote_image(self.node, self.image_url)
+            response.iter_content.assert_not_called()
+
+            # no Content-Length, cut off while streaming
+            response = self.image_response()
+            del response.headers['Content-Length']
+            with patch('posts.remote_images.node_get', return_value=response) as node_get:
+                with self.assertRaises(ValueError):
+                    fetch_remote_image(self.node, self.image_url)
+            self.assertTrue(node_get.call_args.kwargs['stream'])
+            response.close.assert_called_once()
+        self.assertIsNone(get_cached_remote_image(self.image_url))
+
+    def test_old_failures_are_forgotten(self):
+        with patch('posts.remote_images._failed', {'http://remote-node.com/old': time.monotonic() - 3600}) as failed, \
+                patch('posts.remote_images.fetch_remote_image', side_effect=ValueError('broken')), \
+                patch('posts.remote_images.connection'):
+            fetch_remote_image_in_thread(self.node, self.image_url)
+        self.assertEqual(list(failed), [self.image_url])
+
+    def test_only_node_images_are_proxied(self):
+        response = self.client.get(get_remote_image_proxy_url('http://elsewhere.com/dog.png'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_only_signed_urls_are_proxied(self):
+        with patch('posts.remote_images.node_get') as node_get:
+            response = self.client.get('/api/posts/images/proxy/', {'url': self.image_url})
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get('/api/posts/images/proxy/', {'url': self.image_url, 'sig': 'forged'})
+            self.assertEqual(response.status_code, 403)
+        node_get.assert_not_called()
+
+    def test_cache_is_capped(self):
+        with patch('posts.remote_images.node_get', return_value=self.image_response()):
+            first, _ = fetch_remote_image(self.node, self.image_url)
+            os.utime(first, (1, 1))
+            with override_settings(REMOTE_IMAGE_CACHE_SIZE=len(self.image), IMAGE_CACHE_EVICT_EVERY=1):
+                fetch_remote_image(self.node, self.image_url + '2')
+
+        self.assertIsNone(get_cached_remote_image(self.image_url))
+        self.assertIsNotNone(get_cached_remote_image(self.image_url + '2'))
+
+@tag('benchmark')
+class QueryIndexBenchmarkTest(TestCase):
+    """
+    Seeds a large dataset and checks the hot queries are answered from their composite index.
+    Works on SQLite and Postgres, skip it with `manage.py test --exclude-tag benchmark`.
+    """
+    AUTHORS = 200
+    FOLLOWS_PER_AUTHOR = 20
+    POSTS_PER_AUTHOR = 50
+    LIKES = 10000
+
+    @classmethod
+    def setUpTestData(cls):
+        host = 'http://localhost:8000/api/'
+        authors = [Author(display_name=f'Author {i}', host=host) for i in range(cls.AUTHORS)]
+        for author in authors:
+            author.normalize()
+        Author.objects.bulk_create(authors)
+        cls.author = authors[0]
+
+        Follows.objects.bulk_create([
+            Follows(local_follower_id=author, followed_id=authors[(i + j + 1) % cls.AUTHORS], status='ACCEPTED' if j % 4 else 'PENDING')
+            for i, author in enumerate(authors) for j in range(cls.FOLLOWS_PER_AUTHOR)
+        ], batch_size=500)
+
+        visibilities = ['PUBLIC', 'FRIENDS', 'UNLISTED', 'DELETED']
+        posts = []
+        for author in authors:
+            for i in range(cls.POSTS_PER_AUTHOR):
+                post_id = uuid.uuid4()
+                posts.append(Post(
+                    id=post_id, author_id=author, title=f'Post {i}', content='content', visibility=visibilities[i % 4],
+                    url=f"{author.url}posts/{post_id}/",
+                ))
+        Post.objects.bulk_create(posts, batch_size=500)
+        cls.post = posts[0]
+
+        now = timezone.now()
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(author=cls.author, post=post, published=now - timedelta(minutes=i))
+            for i, post in enumerate(posts[:2000])
+        ], batch_size=500)
+
+        post_type = ContentType.objects.get_for_model(Post)
+        likes = []
+        for i in range(cls.LIKES):
+            post = posts[i % len(posts)]
+            like_id = uuid.uuid4()
+            likes.append(Like(
+                id=like_id, author_id=authors[i % cls.AUTHORS], content_type=post_type, object_id=post.id,
+                object_url=post.url, url=f"{authors[i % cls.AUTHORS].url}liked/{like_id}/",
+            ))
+        Like.objects.bulk_create(likes, batch_size=500)
+
+        # let the planner see the real table sizes
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        # SQLite: "SEARCH ... USING INDEX <name>", Postgres: "Index Scan using <name>" / "Bitmap Index Scan on <name>"
+        self.assertIn(index_name, plan, plan)
+        self.assertNotIn('Seq Scan', plan, plan)
+        return plan
+
+    def test_friends_view_follows(self):
+        self.assertUsesIndex(
+            Follows.objects.filter(local_follower_id=self.author, status='ACCEPTED').values_list('followed_id', flat=True),
+            'follows_follower_status_idx',
+        )
+        self.assertUsesIndex(
+            Follows.objects.filter(followed_id=self.author, status='ACCEPTED').values_list('local_follower_id', flat=True),
+            'follows_followed_status_idx',
+        )
+
+    def test_author_profile_posts(self):
+        plan = self.assertUsesIndex(
+            Post.objects.filter(author_id=self.author, visibility='PUBLIC').order_by('-published'),
+            'post_author_visibility_idx',
+        )
+        # the index hands the rows over already sorted
+        self.assertNotIn('TEMP B-TREE', plan, plan)
+
+    def test_likes_view(self):
+        post_type = ContentType.objects.get_for_model(Post)
+        self.assertUsesIndex(Like.objects.filter(content_type=post_type, object_id=self.post.id), 'like_object_idx')
+        self.assertUsesIndex(
+            Like.objects.filter(author_id=self.author, object_url=self.post.url), 'like_author_object_url_idx'
+        )
+
+    def test_feed(self):
+        plan = self.assertUsesIndex(
+            TimelineEntry.objects.filter(author=self.author).order_by('-published', '-post_id')[:20],
+            'timeline_author_published_idx',
+        )
+        self.assertNotIn('TEMP B-TREE', plan, plan)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import AuthorPostsView, GitHubEventsView, PostDetailsByFqidView, PostImageView, CommentsByFQIDView, PublicPostsView, LikesViewByFQIDView
+from .views import AuthorPostsView, GitHubEventsView, PostDetailsByFqidView, PostImageView, CommentsByFQIDView, PublicPostsView, LikesViewByFQIDView, RemoteImageProxyView
 urlpatterns = [
     # Comment URLs
     path('<path:post_fqid>/comments/', CommentsByFQIDView.as_view(), name='get_comments_fqid'),
@@ -10,6 +10,7 @@ urlpatterns = [
     # Post URLs
     path('github/events/<str:username>/', GitHubEventsView.as_view(), name='github-events'),
     path('', PublicPostsView.as_view(), name='public-posts'),
+    path('images/proxy/', RemoteImageProxyView.as_view(), name='remote-image-proxy'),
     path('<path:post_fqid>', PostDetailsByFqidView.as_view(), name='post-detail-fqid'),
     
 ]
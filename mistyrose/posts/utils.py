@@ -4,6 +4,7 @@ import base64
 
 from users.models import Author
 from node.models import Node
+from node.utils import enqueue_inbox_messages
 from users.models import Follows
 
 
@@ -52,53 +53,14 @@ def get_remote_friends(author):
 
 def post_to_remote_inboxes(request, remote_authors, post_data):
     """
-    Post data to the inboxes of remote authors.
+    Queue post data for delivery to the inboxes of remote authors.
+    Nothing is sent here, the `deliver_outbox` worker sends the messages once the caller's transaction commits.
     """
-    
-    failed_authors_urls = []
-    success_inbox_post_counter = 0
-    
     try:
-        for remote_author in remote_authors:
-            print(f"THIS IS THE REMOTE URL: {remote_author.host.removesuffix('/api/')}")
-            node = Node.objects.filter(remote_node_url=remote_author.host.removesuffix('/api/')).first()
-            print(f"ABLE TO GET NODE {node}")
-            if node:
-                author_inbox_remote_endpoint = f"{remote_author.url.rstrip('/')}/inbox/"
-                if '-crimson-' in author_inbox_remote_endpoint:
-                    author_inbox_remote_endpoint = author_inbox_remote_endpoint.rstrip('/')  # Remove trailing /
-                print(f"author_inbox_remote_endpoint : {author_inbox_remote_endpoint}")
-                # my local node's host with scheme
-                parsed_url = urlparse(request.build_absolute_uri())
-                host_with_scheme = f"{parsed_url.scheme}://{parsed_url.netloc}"
-                
-                # credentials to access remote node (encoded in base64)
-                credentials = f"{node.remote_username}:{node.remote_password}"
-                base64_credentials = base64.b64encode(credentials.encode()).decode("utf-8")
-                
-                # make the request
-                response = requests.post(
-                    author_inbox_remote_endpoint,
-                    # params={"host": host_with_scheme},
-                    headers={"Authorization": f"Basic {base64_credentials}"},
-                    json=post_data,
-                )
-                
-                # check for errors
-                if response.status_code != 200 and response.status_code != 201:
-                    failed_authors_urls.append([remote_author.url, response.status_code])
-                    print(f"Could not post to remote author inbox: {remote_author.url}\nresponse: {response}")
-                else:
-                    success_inbox_post_counter += 1
-                
-        
-        print(f"Posted to {success_inbox_post_counter} remote author inboxes successfully")
-        
-        # show failed authors
-        if failed_authors_urls:
-            print(f"Could not post to these remote author inboxes: {failed_authors_urls}")
+        messages = enqueue_inbox_messages(remote_authors, post_data)
+        print(f"Queued {len(messages)} remote author inbox deliveries")
     except Exception as e:
-        print(f"Could not post to remote author inboxes {e}")
+        print(f"Could not queue remote author inbox deliveries {e}")
         raise Exception(f"Could not post to remote author inboxes: {e}")
     
 def get_remote_followers_you(author):
@@ -1,34 +1,43 @@
-import base64
-import re
+import os
 import uuid
 from django.shortcuts import render
 import requests
 
-from users.utils import is_fqid
+from users.utils import resolve_fqid
+from users.authentication import get_request_author
 from .utils import get_remote_friends, post_to_remote_inboxes, get_remote_followers_you
 from users.models import Author
 from rest_framework import status
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticatedOrReadOnly, AllowAny
 from rest_framework.response import Response
 from .models import Post, Comment, Like
-from .serializers import PostSerializer, CommentSerializer, LikeSerializer
+from .blobs import blob_response, decode_base64_image, file_response, read_blob
+from .images import derivative_response
+from .remote_images import proxy_markdown_images, get_image_node, get_cached_remote_image, fetch_remote_image_in_background, check_remote_image_signature
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from .serializers import PostSerializer, PostListSerializer, CommentSerializer, LikeSerializer, get_list_content
 from django.shortcuts import get_object_or_404
 from django.contrib.contenttypes.models import ContentType
 from .models import Post
 from users.models import Author, Follows  
 from node.models import Node
-from .pagination import LikesPagination, CustomPostsPagination
+from .pagination import LikesPagination, CustomPostsPagination, StreamCursorPagination
 import urllib.parse  # asked chatGPT how to decode the URL-encoded FQID 2024-11-02
-from django.http import FileResponse
+from django.http import HttpResponse
+from django.db.models import Prefetch
+from django.conf import settings
 import requests
 from requests.auth import HTTPBasicAuth #basic auth
 from django.db import transaction #transaction requests so that if something happens in the middle, it'll be rolled back
 from urllib.parse import unquote, urlparse
 from node.authentication import NodeAuthentication
 from rest_framework_simplejwt.authentication import JWTAuthentication  
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import ListAPIView  
 from rest_framework.pagination import PageNumberPagination
+from stream.models import TimelineEntry
+from stream.timeline import fan_out_post
 
 
 
@@ -67,6 +76,14 @@ def handle_remote_inboxes(post, request, object_data, author):
 
 #region Post Views
 
+def get_readable_posts(request):
+    """
+    Posts the requester can open by id. Nodes read any post, they filter for their own authors.
+    """
+    if isinstance(request.user, Node):
+        return Post.objects.all()
+    return Post.objects.readable_by(get_request_author(request))
+
 class PostDetailsView(APIView):
     """
     Retrieve, update or delete a post instance by author ID & post ID.
@@ -79,17 +96,9 @@ class PostDetailsView(APIView):
         try:
             # check if author_serial is a URL (FQID) or a uuid (SERIAL)
             # check if post_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_serial):
-                author_serial = urllib.parse.unquote(author_serial)
-                if not author_serial.endswith("/"):
-                    author_serial += "/"
-                author_serial = Author.objects.get(url=author_serial).id
-            if is_fqid(post_serial):
-                post_serial = urllib.parse.unquote(post_serial)
-                if not post_serial.endswith("/"):
-                    post_serial += "/"
-                post_serial = Post.objects.get(url=post_serial).id
-            post = Post.objects.get(id=post_serial, author_id=author_serial)
+            author_serial = resolve_fqid(Author, author_serial)
+            post_serial = resolve_fqid(Post, post_serial)
+            post = get_readable_posts(request).get(id=post_serial, author_id=author_serial)
         except:
             return Response(status=status.HTTP_404_NOT_FOUND)
         
@@ -107,7 +116,7 @@ class PostDetailsView(APIView):
             "id": post.url,
             "description": post.description,
             "contentType": post.content_type,
-            "content": post.content,
+            "content": post.get_content(),
             "author": {
                 "type": "author",
                 "id": author.url,
@@ -123,7 +132,7 @@ class PostDetailsView(APIView):
                 "id": post.url + "/comments",  # Custom URL for comments
                 "page_number": 1,
                 "size": len(comments),
-                "count": post.comments.count(),
+                "count": post.comments_count,
                 "src": []
             },
             "likes": {
@@ -132,7 +141,7 @@ class PostDetailsView(APIView):
                 "id": post.url + "/likes",  # Custom URL for likes
                 "page_number": 1,
                 "size": len(likes),
-                "count": post.likes.count(),
+                "count": post.likes_count,
                 "src": []
             },
             "published": post.published.isoformat(),
@@ -191,16 +200,8 @@ class PostDetailsView(APIView):
             try:
                 # check if author_serial is a URL (FQID) or a uuid (SERIAL)
                 # check if post_serial is a URL (FQID) or a uuid (SERIAL)
-                if is_fqid(author_serial):
-                    author_serial = urllib.parse.unquote(author_serial)
-                    if not author_serial.endswith("/"):
-                        author_serial += "/"
-                    author_serial = Author.objects.get(url=author_serial).id
-                if is_fqid(post_serial):
-                    post_serial = urllib.parse.unquote(post_serial)
-                    if not post_serial.endswith("/"):
-                        post_serial += "/"
-                    post_serial = Post.objects.get(url=post_serial).id
+                author_serial = resolve_fqid(Author, author_serial)
+                post_serial = resolve_fqid(Post, post_serial)
             except:
                 print("In PostDetailsView - PUT - You didn't give me a valid FQID or SERIAL, babe.")
                 return Response({"error": "PostDetailsView - PUT - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
@@ -224,6 +225,8 @@ class PostDetailsView(APIView):
             if serializer.is_valid():
                 updated_post = serializer.save(author_id=author)
                 updated_post_data = PostSerializer(updated_post).data
+                # visibility may have changed, update the streams the post shows up in
+                fan_out_post(updated_post)
             else:
                 return Response({"error": f"Couldn't update the post locally or remotely, babe. Your request was messed up: {serializer.errors}"}, status=status.HTTP_400_BAD_REQUEST)
             
@@ -258,7 +261,7 @@ class PostDetailsByFqidView(APIView):
 
     def get(self, request, post_fqid):
         try:
-            post = Post.objects.get(url=post_fqid)
+            post = get_readable_posts(request).get(url=post_fqid)
         except Post.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
         
@@ -276,7 +279,7 @@ class PostDetailsByFqidView(APIView):
             "id": post.url,
             "description": post.description,
             "contentType": post.content_type,
-            "content": post.content,
+            "content": post.get_content(),
             "author": {
                 "type": "author",
                 "id": author.url,
@@ -292,7 +295,7 @@ class PostDetailsByFqidView(APIView):
                 "id": post.url + "/comments",  # Custom URL for comments
                 "page_number": 1,
                 "size": len(comments),
-                "count": post.comments.count(),
+                "count": post.comments_count,
                 "src": []
             },
             "likes": {
@@ -301,7 +304,7 @@ class PostDetailsByFqidView(APIView):
                 "id": post.url + "/likes",  # Custom URL for likes
                 "page_number": 1,
                 "size": len(likes),
-                "count": post.likes.count(),
+                "count": post.likes_count,
                 "src": []
             },
             "published": post.published.isoformat(),
@@ -378,7 +381,7 @@ class PostDetailsByFqidView(APIView):
             "id": post.url,
             "description": post.description,
             "contentType": post.content_type,
-            "content": post.content,
+            "content": post.get_content(),
             "author": {
                 "type": "author",
                 "id": author.url,
@@ -394,7 +397,7 @@ class PostDetailsByFqidView(APIView):
                 "id": post.url + "/comments",  # Custom URL for comments
                 "page_number": 1,
                 "size": len(comments),
-                "count": post.comments.count(),
+                "count": post.comments_count,
                 "src": []
             },
             "likes": {
@@ -403,7 +406,7 @@ class PostDetailsByFqidView(APIView):
                 "id": post.url + "/likes",  # Custom URL for likes
                 "page_number": 1,
                 "size": len(likes),
-                "count": post.likes.count(),
+                "count": post.likes_count,
                 "src": []
             },
             "published": post.published.isoformat(),
@@ -464,15 +467,12 @@ class AuthorPostsView(APIView):
 
         try:
             # check if author_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_serial):
-                author_serial = urllib.parse.unquote(author_serial)
-                if not author_serial.endswith("/"):
-                    author_serial += "/"
-                author_serial = Author.objects.get(url=author_serial).id
+            author_serial = resolve_fqid(Author, author_serial)
         except:
             return Response({"error": "AuthorPostsView - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
-        posts = Post.objects.filter(author_id=author_serial)
+        posts = Post.objects.filter(author_id=author_serial).with_related()
+        compact = not isinstance(request.user, Node)
 
         all_post_data = []
 
@@ -480,6 +480,11 @@ class AuthorPostsView(APIView):
         for post in posts:
             comments = post.comments.all()
             likes = post.likes.all()
+            # nodes read this to mirror our posts and get them in full, our own users get the compact list form
+            if compact:
+                content, content_truncated = get_list_content(post)
+            else:
+                content = post.get_content()
 
             # Prepare the post data with dynamic links from the database
             post_data = {
@@ -488,7 +493,7 @@ class AuthorPostsView(APIView):
                 "id": post.url,
                 "description": post.description,
                 "contentType": post.content_type,
-                "content": post.content,
+                "content": content,
                 "author": {
                     "type": "author",
                     "id": post.author_id.url,
@@ -504,7 +509,7 @@ class AuthorPostsView(APIView):
                     "id": post.url + "/comments",  # Custom URL for comments
                     "page_number": 1,
                     "size": len(comments),
-                    "count": post.comments.count(),
+                    "count": post.comments_count,
                     "src": []
                 },
                 "likes": {
@@ -513,12 +518,14 @@ class AuthorPostsView(APIView):
                     "id": post.url + "/likes",  # Custom URL for likes
                     "page_number": 1,
                     "size": len(likes),
-                    "count": post.likes.count(),
+                    "count": post.likes_count,
                     "src": []
                 },
                 "published": post.published.isoformat(),
                 "visibility": post.visibility
             }
+            if compact:
+                post_data["content_truncated"] = content_truncated
 
             # Collect comments data
             for comment in comments:
@@ -583,11 +590,7 @@ class AuthorPostsView(APIView):
         with transaction.atomic(): #a lot of datbase operations, better to do transaction so that if something fails, we can rollback instead of half updates
             try:
                 # check if author_serial is a URL (FQID) or a uuid (SERIAL)
-                if is_fqid(author_serial):
-                    author_serial = urllib.parse.unquote(author_serial)
-                    if not author_serial.endswith("/"):
-                        author_serial += "/"
-                    author_serial = Author.objects.get(url=author_serial).id
+                author_serial = resolve_fqid(Author, author_serial)
             except:
                 return Response({"error": "AuthorPostsView - POST - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
             
@@ -601,6 +604,8 @@ class AuthorPostsView(APIView):
             # create post locally
             if serializer.is_valid():
                 post = serializer.save(author_id=author)  # Associate the post with the author
+                # add the post to the streams of local authors allowed to see it
+                fan_out_post(post)
             else:
                 return Response({"error": f"Couldn't create the post locally or remotely, babe. Your request was messed up: {serializer.errors}"}, status=status.HTTP_400_BAD_REQUEST)
             
@@ -643,170 +648,128 @@ class PostImageView(APIView):
         try:
             # check if author_serial is a URL (FQID) or a uuid (SERIAL)
             # check if post_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_serial):
-                author_serial = urllib.parse.unquote(author_serial)
-                if not author_serial.endswith("/"):
-                    author_serial += "/"
-                author_serial = Author.objects.get(url=author_serial).id
-            if is_fqid(post_serial):
-                post_serial = urllib.parse.unquote(post_serial)
-                if not post_serial.endswith("/"):
-                    post_serial += "/"
-                post_serial = Post.objects.get(url=post_serial).id
+            author_serial = resolve_fqid(Author, author_serial)
+            post_serial = resolve_fqid(Post, post_serial)
         except:
             return Response({"error": "PostImageView - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
         author = get_object_or_404(Author, id=author_serial)
-        post = get_object_or_404(Post, author_id=author, id=post_serial)
+        post = get_object_or_404(Post.objects.select_related('image_blob'), author_id=author, id=post_serial)
 
         if not post.content_type.startswith('image/'):
             return Response({'detail': 'No image available for this post'}, status=status.HTTP_404_NOT_FOUND)
 
+        if post.image_blob_id:
+            if request.query_params.get('v') == post.image_blob_id:
+                # versioned url, what it points to can never change
+                cache_control = 'max-age=31536000, immutable'
+            else:
+                # the post can be edited to another image, so revalidate (cheap, it's a 304 most of the time)
+                cache_control = 'no-cache'
+            cache_control = f"{'public' if post.visibility == 'PUBLIC' else 'private'}, {cache_control}"
+            blob = post.image_blob
+            # resized/webp variants, gifs are always served as they are so they stay animated
+            if ('w' in request.query_params or 'fmt' in request.query_params) and blob.content_type != 'image/gif':
+                try:
+                    return derivative_response(request, blob.sha256, lambda: read_blob(blob.sha256), blob.content_type, cache_control)
+                except ValueError as e:
+                    return Response({"error": f"PostImageView - GET - {e}, babe."}, status=status.HTTP_400_BAD_REQUEST)
+            return blob_response(request, blob.sha256, blob.content_type, blob.size, cache_control)
+
+        # image that couldn't be decoded when it was saved
         try:
-            encoded_image = post.content
-            # if ';base64,' in post.content:
-            #     header, encoded_image = post.content.split(';base64,')
-            # else:
-            #     encoded_image = post.content
-
-            missing_padding = len(encoded_image) % 4
-            if missing_padding:
-                encoded_image += '=' * (4 - missing_padding)
-            encoded_image = re.sub(r"\s+", "", encoded_image)
-            binary_image = base64.b64decode(encoded_image)
-
-            # return Response(binary_image, content_type=post.content_type)
-            return FileResponse(binary_image, content_type=post.content_type)
-        except Exception as e:
+            binary_image = decode_base64_image(post.content or '')
+        except ValueError as e:
             print(f"Error decoding image: {e}")
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return HttpResponse(binary_image, content_type=post.content_type.split(';')[0])
 
 class PublicPostsView(APIView):
     # To view all of the public posts in the home page
     permission_classes = [IsAuthenticatedOrReadOnly] 
+    pagination_class = StreamCursorPagination
 
     def get(self, request):
         if not request.user.is_authenticated:
             return Response({"detail": "Authentication credentials were not provided to get public posts."}, status=status.HTTP_403_FORBIDDEN)
 
-        current_author = get_object_or_404(Author, user=request.user)
-
-        # posts = Post.objects.exclude(author_id=current_author.id)
-        posts = Post.objects.all()
+        current_author = get_request_author(request)
+        if current_author is None:
+            raise NotFound("No Author matches the given query.")
 
-        serializer = PostSerializer(posts, many=True)
+        # the stream is materialized in TimelineEntry when posts are created and follows change (see stream.timeline),
+        # so every post read here is already visible to the current author
+        # - ?limit=<n> sets the page size, ?cursor=<next> from the previous response gets the next page
+        paginator = self.pagination_class()
+        entries = paginator.paginate_queryset(
+            TimelineEntry.objects.filter(author=current_author).prefetch_related(
+                Prefetch('post', queryset=Post.objects.with_related())
+            ),
+            request,
+        )
+        posts = [entry.post for entry in entries]
 
-        # all_authors = list(Author.objects.exclude(id=current_author.id).values_list('id', flat=True))
-        all_authors = list(Author.objects.all().values_list('id', flat=True))
+        serializer = PostListSerializer(posts, many=True)
 
         authorized_authors_per_post = []
-
-        # - following_ids: set of IDs of authors that the current author follows
-        # - followers_ids: set of IDs of authors that follow the current author
-        following_ids = set(Follows.objects.filter(local_follower_id=current_author, status='ACCEPTED').values_list('followed_id', flat=True))
-        followers_ids = set(Follows.objects.filter(followed_id=current_author, status='ACCEPTED').values_list('local_follower_id', flat=True))  
-        mutual_friend_ids = following_ids.intersection(followers_ids)
-
-        posts_to_remove = []
-        filtered_posts = []
+        nodes = None
         for post_data in serializer.data:
-            # TODO: TEST THIS MORE THOROUGHLY
-            # if markdown contains image, try to get the image
+            # images of remote markdown posts go through our proxy, which caches them in the background
             if post_data.get('contentType').endswith('markdown') and '![' in post_data['content']:
-                try:
-                    # find node by host
-                    author_host = urlparse(post_data['author']['host'])
-                    host_with_scheme = f"{author_host.scheme}://{author_host.netloc}"
-                    print(f"HOST WITH SCHEME {host_with_scheme}")
-                    node = Node.objects.get(remote_node_url=host_with_scheme)
-                    image_url = post_data['content'].split('](')[1].split(')')[0]
-                    print(f"IMAGE URL {image_url}")
-                    credentials = f"{node.remote_username}:{node.remote_password}"
-                    base64_credentials = base64.b64encode(credentials.encode()).decode("utf-8")
-                    
-                    response = requests.get(image_url, headers={'Authorization': f'Basic {base64_credentials}'})
-                    if response.status_code == 200:
-                        print(f"RESPONSE TO GET IMG {response.json()}")
-                        # check if response.json() is a base64 encoded image
-                        if response.json().startswith('data:image'):
-                            # base64 encoded image is returned
-                            # replace the image url with the base64 encoded image
-                            post_data['content'] = post_data['content'].replace(image_url, f"{response.json()}")
-                            # save the post data
-                            post = Post.objects.get(url=post_data['id'].rstrip('/') + '/')
-                            post.content = post_data['content']
-                            post.save()
-                except:
-                    pass
-                    
-            
-            post_visibility = post_data.get('visibility')
-            post_author_id = uuid.UUID(post_data.get('author').get('id').rstrip('/').split('/authors/')[-1])
-            authorized_authors = set()
-
-            if post_visibility == 'PUBLIC':
-                post_author_url = post_data.get('author').get('id')
-                parsed_url = urlparse(post_author_url)
-                author_host = f"{parsed_url.scheme}://{parsed_url.hostname}"
-
-                current_host = request.get_host().rstrip('/')
-                current_host_full = f"{request.scheme}://{current_host}"
-
-                print(f"PUBLIC POSTS AUTHOR_HOST {author_host} AND CURRENT HOST {current_host_full}")
-                if author_host == current_host_full: #its a local author
-                    authorized_authors.add(current_author.id)
-                else:  
-                    print(f"REMOTE THEREFORE FOLLOWING IDS {following_ids} WITH {post_author_id}")
-                    if post_author_id in following_ids:
-                        authorized_authors.add(current_author.id)
-                    
-            elif post_visibility == 'UNLISTED':
-                accepted_following_ids = Follows.objects.filter(
-                local_follower_id=current_author, 
-                status='ACCEPTED'
-                ).values_list('followed_id', flat=True)
-                # Show the unlisted post if the post's author is someone the current author follows
-                if post_author_id in accepted_following_ids or post_author_id == current_author.id:
-                    authorized_authors.add(current_author.id)
-
-            elif post_visibility == 'FRIENDS':
-                # Only show FRIENDS posts if the post's author is a mutual friend
-                if post_author_id in mutual_friend_ids or post_author_id == current_author.id:
-                    authorized_authors.add(current_author.id)
-
-            elif post_visibility == 'SHARED':
-                #original_url = post_data.get('original_url')  
-                #if original_url:
-                #    original_author_id = original_url[0]  
-                 #   authorized_authors.add(original_author_id) 
-                #post_author_id = post_data.get('author_id')  # Get the author_id from post data
-                #authorized_authors.add(post_author_id)
-                if post_author_id in following_ids or post_author_id == current_author.id:
-                  authorized_authors.add(current_author.id) 
-
-
-            # Include visibility_type in the authorized_authors_per_post dictionary
-            print(f"AUTHORIZED AUTHORS FOR STREAM {authorized_authors}")
-            if authorized_authors: #if list is not empty
-                authorized_authors_per_post.append({
-                    'post_id': post_data['id'], 
-                    'authorized_authors': list(authorized_authors),
-                    'visibility_type': post_visibility  # Add visibility_type here
-                })
-            else:
-                posts_to_remove.append(post_data['id'])
+                if nodes is None:
+                    nodes = {node.remote_node_url: node for node in Node.objects.filter(is_whitelisted=True)}
+                post_data['content'] = proxy_markdown_images(post_data['content'], nodes)
 
-            filtered_posts = [post for post in serializer.data if post['id'] not in posts_to_remove]
-
-        print(f"BIG DICTIONARY {authorized_authors_per_post}")
+            # every post in the stream is visible to the current author
+            authorized_authors_per_post.append({
+                'post_id': post_data['id'], 
+                'authorized_authors': [current_author.id],
+                'visibility_type': post_data.get('visibility')
+            })
 
         # Create response data with posts and their respective authorized authors
         response_data = {
-            'posts': filtered_posts,  
-            'authorized_authors_per_post': authorized_authors_per_post
+            'posts': serializer.data,  
+            'authorized_authors_per_post': authorized_authors_per_post,
+            'next': paginator.next_cursor,  # None on the last page
         }        
         return Response(response_data, status=status.HTTP_200_OK)
     
+class RemoteImageProxyView(APIView):
+    """
+    Image of a remote node, cached here so showing remote markdown posts doesn't depend on the remote node.
+    Only urls signed by proxy_markdown_images (?sig=) on whitelisted nodes are proxied.
+    """
+    # <img> tags in rendered markdown can't send the JWT, the signature stands in for it
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        url = request.query_params.get('url', '')
+        if not check_remote_image_signature(url, request.query_params.get('sig')):
+            return Response({"error": "RemoteImageProxyView - GET - I didn't sign that url, babe."}, status=status.HTTP_403_FORBIDDEN)
+        node = get_image_node(url)
+        if node is None:
+            return Response({"error": "RemoteImageProxyView - GET - That image isn't on one of our nodes, babe."}, status=status.HTTP_400_BAD_REQUEST)
+
+        cached = get_cached_remote_image(url)
+        if cached is None:
+            future = fetch_remote_image_in_background(node, url)
+            try:
+                cached = future.result(timeout=settings.REMOTE_IMAGE_WAIT) if future else None
+            except FutureTimeoutError:
+                cached = None
+        if cached is None:
+            return Response(
+                {"error": "RemoteImageProxyView - GET - Couldn't get that image yet, babe."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '30'},
+            )
+
+        path, content_type = cached
+        return file_response(
+            request, os.path.basename(path), lambda: open(path, 'rb'), content_type, os.path.getsize(path),
+            'private, max-age=86400',  # it may be an image only some of our authors are allowed to see
+        )
+
 #endregion
 
 #region Comment Views
@@ -820,11 +783,7 @@ class CommentedView(APIView):
         """
         try:
             # check if author_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_serial):
-                author_serial = urllib.parse.unquote(author_serial)
-                if not author_serial.endswith("/"):
-                    author_serial += "/"
-                author_serial = Author.objects.get(url=author_serial).id
+            author_serial = resolve_fqid(Author, author_serial)
         except:
             return Response({"error": "CommentedView - POST - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -888,11 +847,7 @@ class CommentedView(APIView):
         """
         try:
             # check if author_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_serial):
-                author_serial = urllib.parse.unquote(author_serial)
-                if not author_serial.endswith("/"):
-                    author_serial += "/"
-                author_serial = Author.objects.get(url=author_serial).id
+            author_serial = resolve_fqid(Author, author_serial)
         except:
             return Response({"error": "CommentedView - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -960,11 +915,7 @@ class CommentView(APIView):
         """
         try:
             # check if comment_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(comment_serial):
-                comment_serial = urllib.parse.unquote(comment_serial)
-                if not comment_serial.endswith("/"):
-                    comment_serial += "/"
-                comment_serial = Comment.objects.get(url=comment_serial).id
+            comment_serial = resolve_fqid(Comment, comment_serial)
         except:
             return Response({"error": "CommentView - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -982,11 +933,7 @@ class CommentsView(APIView):
         """
         try:
             # check if post_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(post_serial):
-                post_serial = urllib.parse.unquote(post_serial)
-                if not post_serial.endswith("/"):
-                    post_serial += "/"
-                post_serial = Post.objects.get(url=post_serial).id
+            post_serial = resolve_fqid(Post, post_serial)
         except:
             return Response({"error": "CommentsView - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -1006,8 +953,8 @@ class CommentsView(APIView):
             "page": f"{host}/authors/{post_author_id}/posts/{post_serial}",
             "id": f"{host}/authors/{post_author_id}/posts/{post_serial}/comments",
             "page_number": 1,
-            "size": post.comments.count(),
-            "count": post.comments.count(),
+            "size": post.comments_count,
+            "count": post.comments_count,
             "src": serializer.data  
         }
 
@@ -1045,8 +992,8 @@ class CommentsByFQIDView(APIView):
             "page": f"{host}/authors/{post_author_id}/posts/{post_serial}",
             "id": f"{host}/authors/{post_author_id}/posts/{post_serial}/comments",
             "page_number": 1,
-            "size": post.comments.count(),
-            "count": post.comments.count(),
+            "size": post.comments_count,
+            "count": post.comments_count,
             "src": serializer.data  
         }
 
@@ -1108,11 +1055,7 @@ class LikedView(APIView):
     def post(self, request, author_serial):
         try:
             # check if author_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_serial):
-                author_serial = urllib.parse.unquote(author_serial)
-                if not author_serial.endswith("/"):
-                    author_serial += "/"
-                author_serial = Author.objects.get(url=author_serial).id
+            author_serial = resolve_fqid(Author, author_serial)
         except:
             return Response({"error": "LikedView - POST - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -1195,11 +1138,7 @@ class LikedView(APIView):
         """
         try:
             # check if author_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_serial):
-                author_serial = urllib.parse.unquote(author_serial)
-                if not author_serial.endswith("/"):
-                    author_serial += "/"
-                author_serial = Author.objects.get(url=author_serial).id
+            author_serial = resolve_fqid(Author, author_serial)
         except:
             return Response({"error": "LikedView - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -1235,11 +1174,7 @@ class LikeView(APIView):
         """
         try:
             # check if like_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(like_serial):
-                like_serial = urllib.parse.unquote(like_serial)
-                if not like_serial.endswith("/"):
-                    like_serial += "/"
-                like_serial = Like.objects.get(url=like_serial).id
+            like_serial = resolve_fqid(Like, like_serial)
         except:
             return Response({"error": "LikeView - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -1258,16 +1193,8 @@ class LikesView(APIView):
         try:
             # check if post_id is a URL (FQID) or a uuid (SERIAL)
             # check if author_serial is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_serial):
-                author_serial = urllib.parse.unquote(author_serial)
-                if not author_serial.endswith("/"):
-                    author_serial += "/"
-                author_serial = Author.objects.get(url=author_serial).id
-            if is_fqid(post_id):
-                post_id = urllib.parse.unquote(post_id)
-                if not post_id.endswith("/"):
-                    post_id += "/"
-                post_id = Post.objects.get(url=post_id).id
+            author_serial = resolve_fqid(Author, author_serial)
+            post_id = resolve_fqid(Post, post_id)
         except:
             return Response({"error": "LikesView - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -1288,7 +1215,7 @@ class LikesView(APIView):
             "id": f"http://{host}/authors/{author_serial}/posts/{post_id}/likes",
             "page_number": paginator.page.number,
             "size": paginator.get_page_size(request),
-            "count": post.likes.count(),
+            "count": post.likes_count,
             "src": serializer.data  # List of serialized like data
         }
 
@@ -1306,21 +1233,9 @@ class LikedCommentsView(APIView):
             # check if author_id is a URL (FQID) or a uuid (SERIAL)
             # check if post_id is a URL (FQID) or a uuid (SERIAL)
             # check if comment_id is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_id):
-                author_id = urllib.parse.unquote(author_id)
-                if not author_id.endswith("/"):
-                    author_id += "/"
-                author_id = Author.objects.get(url=author_id).id
-            if is_fqid(post_id):
-                post_id = urllib.parse.unquote(post_id)
-                if not post_id.endswith("/"):
-                    post_id += "/"
-                post_id = Post.objects.get(url=post_id).id
-            if is_fqid(comment_id):
-                comment_id = urllib.parse.unquote(comment_id)
-                if not comment_id.endswith("/"):
-                    comment_id += "/"
-                comment_id = Comment.objects.get(url=comment_id).id
+            author_id = resolve_fqid(Author, author_id)
+            post_id = resolve_fqid(Post, post_id)
+            comment_id = resolve_fqid(Comment, comment_id)
         except:
             return Response({"error": "LikedCommentsView - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -1342,7 +1257,7 @@ class LikedCommentsView(APIView):
             "id": f"http://{host}/authors/{author_id}/commented/{comment_id}/likes",
             "page_number": paginator.page.number,
             "size": paginator.get_page_size(request),
-            "count": comment.likes.count(),
+            "count": comment.likes_count,
             "src": serializer.data  
         }
 
@@ -1386,7 +1301,7 @@ class LikesViewByFQIDView(APIView):
             "id": f"http://{host}/authors/{author_id}/posts/{post_id}/likes",
             "page_number": paginator.page.number,
             "size": paginator.get_page_size(request),
-            "count": post.likes.count(),
+            "count": post.likes_count,
             "src": serializer.data  # List of serialized like data
         }
 
@@ -2,4 +2,7 @@ from django.contrib import admin
 from .models import Inbox
 
 # Register your models here.
-admin.site.register(Inbox)
+@admin.register(Inbox)
+class InboxAdmin(admin.ModelAdmin):
+    list_display = ('type', 'author', 'node', 'status', 'attempts', 'created_at', 'processed_at', 'last_error')
+    list_filter = ('status', 'type', 'node')
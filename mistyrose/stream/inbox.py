@@ -0,0 +1,277 @@
+import hashlib
+import json
+import uuid
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from users.models import Author
+from users.utils import resolve_fqid
+from .models import Inbox
+from .utils import handle_follow_request, handle_post_inbox, handle_comment_inbox, handle_like_inbox
+
+INBOX_TYPES = ('follow', 'post', 'comment', 'like')
+# activities the shared inbox takes, a follow is for one author and goes to their own inbox
+SHARED_INBOX_TYPES = ('post', 'comment', 'like')
+# activities that are safe to drop when they come again with the same content
+# - follows aren't, a follow sent again after an unfollow must be applied again
+DEDUPLICATED_TYPES = ('post', 'comment', 'like')
+
+
+def get_activity_object_key(author_id, activity):
+    """
+    Stable id of the object an activity delivered to an author's inbox is about: its url and type.
+    """
+    object_type = activity.get('type')
+    object_url = activity.get('id') or activity.get('object') or ''
+    return hashlib.sha256(f"{author_id}|{object_type}|{object_url}".encode()).hexdigest()
+
+def get_activity_key(author_id, activity):
+    """
+    Stable id of an activity delivered to an author's inbox: its object url, type and a hash of its content.
+    """
+    content = json.dumps(activity, sort_keys=True, separators=(',', ':'), default=str)
+    content_hash = hashlib.sha256(content.encode()).hexdigest()
+    return hashlib.sha256(f"{get_activity_object_key(author_id, activity)}|{content_hash}".encode()).hexdigest()
+
+def get_activity_seen_cache_key(activity_key):
+    return f"inbox_seen:{activity_key}"
+
+def get_activity_latest_cache_key(object_key):
+    return f"inbox_latest:{object_key}"
+
+def is_activity_seen(activity_key):
+    return cache.get(get_activity_seen_cache_key(activity_key)) is not None
+
+def is_duplicate_activity(activity_key, object_key, object_type, latest_keys=None):
+    """
+    True if the activity was applied already.
+    latest_keys maps the object keys applied (or queued) earlier in the batch to the key of their last activity.
+    A post can be edited back to an earlier version (A→B→A), so only the version applied last is a duplicate.
+    """
+    if latest_keys and object_key in latest_keys:
+        return latest_keys[object_key] == activity_key
+    if object_type == 'post':
+        return cache.get(get_activity_latest_cache_key(object_key)) == activity_key
+    return is_activity_seen(activity_key)
+
+def mark_activity_seen(activity_key, object_key='', object_type=None):
+    """
+    Remember an activity that was applied, for INBOX_SEEN_TIMEOUT seconds, and for posts which version was applied last.
+    Only call it once the activity was applied, so a failed one is retried when the peer sends it again.
+    """
+    cache.set(get_activity_seen_cache_key(activity_key), 1, settings.INBOX_SEEN_TIMEOUT)
+    if object_type == 'post':
+        cache.set(get_activity_latest_cache_key(object_key), activity_key, settings.INBOX_SEEN_TIMEOUT)
+
+def apply_activity(request, author, object_type):
+    """
+    Apply an activity sent to author's inbox with the handler of its type, returns the handler's Response.
+    """
+    if object_type == "follow":
+        return handle_follow_request(request, author)
+    elif object_type == "post":
+        return handle_post_inbox(request, author, author.id)
+    elif object_type == "comment":
+        return handle_comment_inbox(request, author, author.id)
+    elif object_type == "like":
+        return handle_like_inbox(request, author, author.id)
+    raise ValueError(f"unknown activity type {object_type}")
+
+def apply_shared_activity(request, authors, object_type):
+    """
+    Apply an activity sent to the shared inbox for many authors once, returns the handler's Response.
+    A post is stored once and fan_out_post links it to the stream of every local author allowed to see it,
+    comments and likes go to their post whoever they were sent to. The first author the handler accepts it for is enough.
+    """
+    response = Response({"error": "None of the recipients are here, babe."}, status=status.HTTP_404_NOT_FOUND)
+    for author in authors:
+        response = apply_activity(request, author, object_type)
+        if status.is_success(response.status_code):
+            break
+    return response
+
+class QueuedRequest:
+    """
+    The parts of a request the handlers read, rebuilt from a queued Inbox row.
+    """
+    def __init__(self, activity):
+        self.data = activity.body
+        self.user = activity.node
+        self.url = activity.request_url
+
+    def get_host(self):
+        return urlparse(self.url).netloc
+
+    def build_absolute_uri(self):
+        return self.url
+
+def build_queued_activity(request, author, activity, object_type, activity_key='', recipients=None):
+    """
+    Unsaved Inbox row for an activity a node posted to author's inbox,
+    or to the shared inbox (author None) for the authors in recipients.
+    """
+    return Inbox(
+        type=object_type,
+        author=author,
+        recipients=[str(recipient.id) for recipient in recipients or []],
+        node=request.user,
+        body=activity,
+        request_url=request.build_absolute_uri(),
+        activity_key=activity_key or '',
+    )
+
+def enqueue_activity(request, author, object_type, activity_key=''):
+    """
+    Store an activity posted to author's inbox, to be applied by `python manage.py process_inbox`.
+    """
+    activity = build_queued_activity(request, author, request.data, object_type, activity_key)
+    activity.save()
+    return activity
+
+def resolve_recipient(value):
+    """
+    Id of the author identified by value (FQID or SERIAL), None if it's an FQID we don't know.
+    Raises ValueError if value is neither.
+    """
+    try:
+        return uuid.UUID(str(resolve_fqid(Author, value)))
+    except Author.DoesNotExist:
+        return None
+
+def queue_activities(request, items):
+    """
+    Queue the activities of a batch a node posted, in one transaction. Returns a result per item, in order.
+    An item is {"recipient": <author FQID or SERIAL>, "activity": {...}} for the inbox of one author,
+    or {"recipients": [...], "activity": {...}} for the shared inbox, stored once for all of them (INBOX_MAX_RECIPIENTS at most).
+    """
+    results = [None] * len(items)
+    pending = []  # (index, recipient ids, shared, activity, object_type, activity_key)
+    batch_keys = {}  # object key -> key of its last activity in the batch
+    for index, item in enumerate(items):
+        try:
+            activity = item["activity"]
+            object_type = activity.get("type")
+            shared = "recipients" in item
+            recipients = item["recipients"] if shared else [item["recipient"]]
+            if not isinstance(recipients, list) or not recipients:
+                raise ValueError("no recipients")
+            if len(recipients) > settings.INBOX_MAX_RECIPIENTS:
+                results[index] = {"status": status.HTTP_400_BAD_REQUEST, "error": f"That's too many recipients, babe. {settings.INBOX_MAX_RECIPIENTS} at most."}
+                continue
+            author_ids = [resolve_recipient(recipient) for recipient in recipients]
+        except (KeyError, TypeError, AttributeError, ValueError):
+            results[index] = {"status": status.HTTP_400_BAD_REQUEST, "error": "You didn't give me a valid recipient and activity, babe."}
+            continue
+        if object_type not in (SHARED_INBOX_TYPES if shared else INBOX_TYPES):
+            results[index] = {"status": status.HTTP_400_BAD_REQUEST, "error": f"What is a(n) {object_type}? I don't f with that here, babe."}
+            continue
+
+        activity_key = ''
+        if object_type in DEDUPLICATED_TYPES:
+            # a shared activity is applied once whoever it was sent to
+            recipient = 'shared' if shared else author_ids[0]
+            activity_key = get_activity_key(recipient, activity)
+            object_key = get_activity_object_key(recipient, activity)
+            if is_duplicate_activity(activity_key, object_key, object_type, batch_keys):
+                results[index] = {"status": status.HTTP_200_OK, "message": "Already got this one, babe."}
+                continue
+            batch_keys[object_key] = activity_key
+        pending.append((index, author_ids, shared, activity, object_type, activity_key))
+
+    # one query for all the recipients
+    authors = Author.objects.in_bulk({author_id for _, author_ids, _, _, _, _ in pending for author_id in author_ids if author_id})
+
+    queued = []
+    for index, author_ids, shared, activity, object_type, activity_key in pending:
+        recipients = [authors[author_id] for author_id in author_ids if author_id in authors]
+        if not recipients:
+            results[index] = {"status": status.HTTP_404_NOT_FOUND, "error": "No Author matches the given query."}
+            continue
+        if shared:
+            queued.append((index, build_queued_activity(request, None, activity, object_type, activity_key, recipients)))
+        else:
+            queued.append((index, build_queued_activity(request, recipients[0], activity, object_type, activity_key)))
+
+    with transaction.atomic():
+        Inbox.objects.bulk_create([activity for _, activity in queued])
+    for index, activity in queued:
+        results[index] = {"status": status.HTTP_202_ACCEPTED, "id": str(activity.inbox_id)}
+    return results
+
+def claim_inbox_activities(batch_size):
+    """
+    Mark up to batch_size pending activities that are due as PROCESSING and return them, oldest first.
+    Activities stuck in PROCESSING for longer than INBOX_CLAIM_TIMEOUT (crashed worker) are picked up again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.INBOX_CLAIM_TIMEOUT)
+
+    with transaction.atomic():
+        # skip_locked lets several workers claim from the table at the same time (no-op on sqlite)
+        ids = list(
+            Inbox.objects.select_for_update(skip_locked=True)
+            .filter(Q(status='PENDING', next_attempt_at__lte=now) | Q(status='PROCESSING', claimed_at__lt=stale))
+            .order_by('created_at')
+            .values_list('inbox_id', flat=True)[:batch_size]
+        )
+        Inbox.objects.filter(inbox_id__in=ids).update(status='PROCESSING', claimed_at=now)
+
+    return list(Inbox.objects.filter(inbox_id__in=ids).select_related('author', 'node').order_by('created_at'))
+
+def process_inbox_activity(activity, applied_keys):
+    """
+    Apply one queued activity and record the result. Returns True if it was applied.
+    applied_keys maps the objects applied earlier in the batch to their last activity key, not in the cache until the batch commits.
+    """
+    now = timezone.now()
+    object_key = get_activity_object_key(activity.author_id or 'shared', activity.body)
+    # the same activity queued twice before the first one was applied
+    if activity.activity_key and is_duplicate_activity(activity.activity_key, object_key, activity.type, applied_keys):
+        Inbox.objects.filter(inbox_id=activity.inbox_id).update(status='DONE', processed_at=now, last_error='')
+        return True
+
+    try:
+        # savepoint, a failing activity doesn't undo the rest of the batch
+        with transaction.atomic():
+            if activity.author is None:
+                authors = list(Author.objects.filter(id__in=activity.recipients))
+                response = apply_shared_activity(QueuedRequest(activity), authors, activity.type)
+            else:
+                response = apply_activity(QueuedRequest(activity), activity.author, activity.type)
+        error = '' if status.is_success(response.status_code) else f"HTTP {response.status_code}: {response.data}"
+    except Exception as e:  # 404s, malformed activities, ... must not stop the queue
+        error = f"{type(e).__name__}: {e}"
+
+    if not error:
+        Inbox.objects.filter(inbox_id=activity.inbox_id).update(status='DONE', processed_at=now, last_error='')
+        if activity.activity_key:
+            applied_keys[object_key] = activity.activity_key
+            transaction.on_commit(lambda: mark_activity_seen(activity.activity_key, object_key, activity.type))
+        return True
+
+    print(f"Could not apply {activity.type} to {activity.author_id or 'shared'} inbox: {error}")
+    attempts = activity.attempts + 1
+    if attempts >= settings.INBOX_MAX_ATTEMPTS:
+        Inbox.objects.filter(inbox_id=activity.inbox_id).update(status='FAILED', attempts=attempts, processed_at=now, last_error=error)
+    else:
+        # e.g. a comment that came before its post, try again later
+        retry_at = now + timedelta(seconds=settings.INBOX_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+        Inbox.objects.filter(inbox_id=activity.inbox_id).update(status='PENDING', attempts=attempts, next_attempt_at=retry_at, last_error=error)
+    return False
+
+def process_inbox_activities(activities):
+    """
+    Apply claimed activities in order, in one transaction so the whole batch costs a single commit.
+    Returns the number of applied activities.
+    """
+    applied_keys = {}
+    with transaction.atomic():
+        return sum(process_inbox_activity(activity, applied_keys) for activity in activities)
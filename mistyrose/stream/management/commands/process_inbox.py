@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from stream.inbox import claim_inbox_activities, process_inbox_activities
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the activities other nodes queued in our authors' inboxes, a batch per transaction. "
+        "Runs forever unless --once is given, start several to process the queue in parallel."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Apply what is queued right now and exit")
+        parser.add_argument('--batch-size', type=int, default=100, help="Activities claimed and committed together")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            activities = claim_inbox_activities(options['batch_size'])
+            if activities:
+                applied = process_inbox_activities(activities)
+                self.stdout.write(f"Applied {applied}/{len(activities)} inbox activities")
+
+            if options['once'] and len(activities) < options['batch_size']:
+                break
+            if not activities:
+                time.sleep(options['poll_interval'])
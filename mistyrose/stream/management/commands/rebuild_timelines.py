@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from users.models import Author
+from stream.timeline import rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized home streams of local authors (e.g. after enabling the stream table on an existing node)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('author_ids', nargs='*', help="Only rebuild the streams of these author ids")
+
+    def handle(self, *args, **options):
+        authors = Author.objects.filter(user__isnull=False)
+        if options['author_ids']:
+            authors = authors.filter(id__in=options['author_ids'])
+
+        count = 0
+        for author in authors.iterator():
+            rebuild_timeline(author)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} stream(s)"))
@@ -1,12 +1,11 @@
 from django.db import models
 import uuid
-from datetime import datetime
-from django.contrib.contenttypes.models import ContentType
-from django.contrib.contenttypes.fields import GenericForeignKey
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 
-# Inbox model is designed to have foreign key to an author, and generic foreign key to the object from the Inbox request (follow, post, like, comment)
-#TODO: remove
+# Inbox is the queue of activities (follow, post, comment, like) remote nodes post to our authors' inboxes.
+# InboxView stores the raw activity and answers 202, `python manage.py process_inbox` applies them in batches (see stream/inbox.py)
 class Inbox(models.Model):
     OBJECT_CHOICES = [
       ('follow', 'Follow request'),
@@ -14,20 +13,60 @@ class Inbox(models.Model):
       ('comment', 'Comment'),
       ('post', 'Post'),
     ]
+    STATUS_CHOICES = [
+      ('PENDING', 'Pending'),
+      ('PROCESSING', 'Processing'),
+      ('DONE', 'Done'),
+      ('FAILED', 'Failed'),
+    ]
           
     inbox_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
     type = models.CharField(max_length=100, choices=OBJECT_CHOICES)
-    author = models.ForeignKey('users.Author', on_delete=models.CASCADE, related_name='author') #TODO: replace 'users.Author' with path to author
-    created_at = models.DateTimeField("date requested", default=datetime.now)
+    author = models.ForeignKey('users.Author', on_delete=models.CASCADE, null=True, blank=True, related_name='author') # author whose inbox it was sent to, None for the shared inbox
+    recipients = models.JSONField(default=list, blank=True) # ids of the local authors it was sent to through the shared inbox
+    node = models.ForeignKey('node.Node', on_delete=models.SET_NULL, null=True, blank=True, related_name='inbox_activities') # node that sent it
+    body = models.JSONField(encoder=DjangoJSONEncoder) # the activity as it was posted
+    request_url = models.URLField(max_length=2000) # url it was posted to, the handlers read our host from it
+    activity_key = models.CharField(max_length=64, blank=True, default='') # see stream.inbox.get_activity_key, empty if it isn't deduplicated
+    created_at = models.DateTimeField("date requested", default=timezone.now)
 
-    # using generic foreign key so we can have "polymorphic" relationships between the tables (Like, Comment, Follow, Post)
-    # https://docs.djangoproject.com/en/5.1/ref/contrib/contenttypes/#generic-relations for setting up generic foreign key 2024-10-14
-    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE) 
-    object_id = models.UUIDField(max_length=200) # TODO: changed it to UUID, fix errors..... for storing primary key value of the model itll be relating to 
-    content_object = GenericForeignKey('content_type', 'object_id') # foreign key to Like or Comment, or Follow or Post
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    claimed_at = models.DateTimeField(null=True, blank=True) # when a worker started applying it, used to recover from crashed workers
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # failed activities go back to PENDING with a backed off next_attempt_at, and to FAILED after INBOX_MAX_ATTEMPTS
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
 
     def __str__(self):
-      return f'{self.author} inbox'
+      if self.author is None:
+        return f'{self.status} {self.type} to the shared inbox of {len(self.recipients)} authors'
+      return f'{self.status} {self.type} to {self.author} inbox'
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='inbox_status_next_idx'),
+        ]
+
 
 
+# TimelineEntry is the materialized home stream: one row per (reader, post) pair the reader is allowed to see.
+# Rows are written when a post is created/updated or a follow changes, so reading the stream is a single index range scan.
+class TimelineEntry(models.Model):
+    author = models.ForeignKey('users.Author', on_delete=models.CASCADE, related_name='timeline_entries') # local author whose stream this row belongs to
+    post = models.ForeignKey('posts.Post', on_delete=models.CASCADE, related_name='timeline_entries')
+    published = models.DateTimeField() # copy of post.published so the stream can be ordered without joining posts
+
+    def __str__(self):
+      return f'{self.post} in {self.author} stream'
+
+    class Meta:
+        ordering = ['-published']
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['author', '-published', '-post'], name='timeline_author_published_idx'),
+        ]
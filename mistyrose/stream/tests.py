@@ -10,6 +10,15 @@ from posts.models import Post, Comment, Like
 from django.contrib.contenttypes.models import ContentType
 import base64
 from node.models import Node
+from stream.models import TimelineEntry
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from io import StringIO
+from unittest.mock import patch
+from stream.models import Inbox
+from stream.utils import handle_post_inbox
 
 # Create your tests here.
 class InboxViewTest(TestCase):
@@ -264,4 +273,256 @@ class CommentedViewTestCase(TestCase):
 
     #     self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
     #     self.assertEqual(response.data['comment'], 'This is a test comment.')
-    #     self.assertEqual(Comment.objects.count(), 1)
\ No newline at end of file
+    #     self.assertEqual(Comment.objects.count(), 1)
+class TimelineTest(TestCase):
+    def setUp(self):
+        # Create two local authors and log in as the reader
+        self.user = User.objects.create_user(username='reader', password='testpass')
+        self.reader = Author.objects.create(user=self.user, host='http://testserver/', display_name='Reader')
+
+        self.poster_user = User.objects.create_user(username='poster', password='testpass')
+        self.poster = Author.objects.create(user=self.poster_user, host='http://testserver/', display_name='Poster')
+
+        refresh = RefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(refresh.access_token))
+
+        # Poster posts through the API so the post is fanned out to streams
+        poster_refresh = RefreshToken.for_user(self.poster_user)
+        self.poster_client = APIClient()
+        self.poster_client.credentials(HTTP_AUTHORIZATION='Bearer ' + str(poster_refresh.access_token))
+
+    def create_post(self, visibility):
+        response = self.poster_client.post(
+            reverse('author-posts', args=[self.poster.id]),
+            {'type': 'post', 'title': f'{visibility} post', 'contentType': 'text/plain', 'content': 'hi', 'visibility': visibility},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return Post.objects.get(title=f'{visibility} post')
+
+    def get_stream_titles(self):
+        response = self.client.get('/api/posts/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post['title'] for post in response.data['posts']]
+
+    def test_public_post_written_to_local_streams(self):
+        post = self.create_post('PUBLIC')
+        self.assertTrue(TimelineEntry.objects.filter(author=self.reader, post=post).exists())
+        self.assertTrue(TimelineEntry.objects.filter(author=self.poster, post=post).exists())
+        self.assertEqual(self.get_stream_titles(), ['PUBLIC post'])
+
+    def test_friends_post_only_for_friends(self):
+        self.create_post('FRIENDS')
+        self.assertEqual(self.get_stream_titles(), [])
+
+        # becoming friends backfills the stream
+        Follows.objects.create(local_follower_id=self.poster, followed_id=self.reader, status='ACCEPTED')
+        follow = Follows.objects.create(local_follower_id=self.reader, followed_id=self.poster, status='PENDING')
+        self.client.put(f'/api/authors/{self.poster.id}/followers/{self.reader.id}/')
+        self.assertEqual(self.get_stream_titles(), ['FRIENDS post'])
+
+        # unfollowing removes it again
+        self.client.delete(f'/api/authors/{self.poster.id}/followers/{self.reader.id}/unfollow/')
+        self.assertFalse(Follows.objects.filter(id=follow.id).exists())
+        self.assertEqual(self.get_stream_titles(), [])
+
+    def test_deleted_post_removed_from_stream(self):
+        post = self.create_post('PUBLIC')
+        response = self.poster_client.put(
+            reverse('post-detail', args=[self.poster.id, post.id]),
+            {'title': post.title, 'content': post.content, 'visibility': 'DELETED'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+
+class InboxIngestTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.node = Node.objects.create(
+            remote_node_url="http://peer-node.com", local_username="peer", local_password="peer-secret", is_whitelisted=True,
+        )
+        credentials = base64.b64encode(b"peer:peer-secret").decode()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Basic {credentials}")
+
+        self.user = User.objects.create_user(username='reader', password='testpass')
+        self.reader = Author.objects.create(user=self.user, host='http://testserver/api/', display_name='Reader')
+
+        remote_author_id = uuid.uuid4()
+        self.post_id = uuid.uuid4()
+        self.activity = {
+            "type": "post",
+            "id": f"http://peer-node.com/api/authors/{remote_author_id}/posts/{self.post_id}",
+            "title": "Remote post",
+            "description": "",
+            "contentType": "text/plain",
+            "content": "hello",
+            "visibility": "PUBLIC",
+            "author": {
+                "type": "author",
+                "id": f"http://peer-node.com/api/authors/{remote_author_id}",
+                "host": "http://peer-node.com/api/",
+                "displayName": "Remote",
+                "page": f"http://peer-node.com/authors/{remote_author_id}",
+            },
+        }
+        self.url = reverse('inbox', args=[self.reader.id])
+
+    def process_inbox(self):
+        # the worker commits every batch, run what waits for the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('process_inbox', '--once', stdout=StringIO())
+
+    def test_node_activity_is_queued(self):
+        response = self.client.post(self.url, self.activity, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(Post.objects.filter(id=self.post_id).exists())
+        activity = Inbox.objects.get()
+        self.assertEqual((activity.type, activity.author, activity.node, activity.status), ('post', self.reader, self.node, 'PENDING'))
+
+        self.process_inbox()
+        self.assertEqual(Post.objects.get(id=self.post_id).title, "Remote post")
+        self.assertEqual(Inbox.objects.get().status, 'DONE')
+
+    def test_same_activity_is_applied_once(self):
+        self.client.post(self.url, self.activity, format='json')
+        self.process_inbox()
+
+        # node credentials are cached too, the replay doesn't touch the database at all
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, self.activity, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Inbox.objects.count(), 1)
+
+    def test_duplicate_queued_before_processing_is_skipped(self):
+        self.client.post(self.url, self.activity, format='json')
+        self.client.post(self.url, self.activity, format='json')
+        self.assertEqual(Inbox.objects.count(), 2)
+
+        with patch('stream.inbox.handle_post_inbox', wraps=handle_post_inbox) as handler:
+            self.process_inbox()
+        self.assertEqual(handler.call_count, 1)
+        self.assertEqual(Inbox.objects.filter(status='DONE').count(), 2)
+
+        self.client.post(self.url, self.activity, format='json')
+        self.assertEqual(Inbox.objects.count(), 2)
+
+    def test_changed_activity_is_applied(self):
+        self.client.post(self.url, self.activity, format='json')
+        self.client.post(self.url, {**self.activity, "content": "edited"}, format='json')
+        self.process_inbox()
+        self.assertEqual(Post.objects.get(id=self.post_id).content, "edited")
+
+    def test_edit_back_to_an_earlier_version_is_applied(self):
+        edited = {**self.activity, "content": "edited"}
+        for activity in (self.activity, edited):
+            self.client.post(self.url, activity, format='json')
+            self.process_inbox()
+
+        # A -> B -> A, the last one was seen before but B was applied after it
+        response = self.client.post(self.url, self.activity, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.process_inbox()
+        self.assertEqual(Post.objects.get(id=self.post_id).content, self.activity["content"])
+
+        # sent again, now it is a duplicate
+        self.client.post(self.url, self.activity, format='json')
+        self.assertEqual(Inbox.objects.count(), 3)
+
+    def test_failed_activity_is_retried(self):
+        activity = {**self.activity, "visibility": "FRIENDS"}
+        self.client.post(self.url, activity, format='json')
+        self.process_inbox()
+
+        queued = Inbox.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ('PENDING', 1))
+        self.assertIn("HTTP 404", queued.last_error)
+        self.assertGreater(queued.next_attempt_at, timezone.now())
+
+        # it isn't remembered as seen, the peer sending it again queues it again
+        response = self.client.post(self.url, activity, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+    @override_settings(INBOX_MAX_ATTEMPTS=1)
+    def test_activity_fails_after_max_attempts(self):
+        self.client.post(self.url, {**self.activity, "visibility": "FRIENDS"}, format='json')
+        self.process_inbox()
+        self.assertEqual(Inbox.objects.get().status, 'FAILED')
+
+    def test_local_user_activity_is_applied_right_away(self):
+        refresh = RefreshToken.for_user(self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        response = client.post(self.url, self.activity, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(Inbox.objects.exists())
+
+    def test_batch_is_queued_in_one_request(self):
+        other_user = User.objects.create_user(username='other', password='testpass')
+        other = Author.objects.create(user=other_user, host='http://testserver/api/', display_name='Other')
+        batch = [
+            {"recipient": str(self.reader.id), "activity": self.activity},
+            {"recipient": other.url, "activity": self.activity},
+            {"recipient": str(self.reader.id), "activity": self.activity},  # same one twice
+            {"recipient": str(uuid.uuid4()), "activity": self.activity},
+            {"recipient": str(self.reader.id), "activity": {"type": "poke"}},
+            {"activity": self.activity},
+        ]
+        response = self.client.post(reverse('inbox-batch'), batch, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual([result["status"] for result in response.data["results"]], [202, 202, 200, 404, 400, 400])
+        self.assertEqual(set(Inbox.objects.values_list('author_id', flat=True)), {self.reader.id, other.id})
+
+        self.process_inbox()
+        self.assertEqual(Inbox.objects.filter(status='DONE').count(), 2)
+        self.assertTrue(Post.objects.filter(id=self.post_id).exists())
+
+    def test_batch_is_only_for_nodes(self):
+        refresh = RefreshToken.for_user(self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+        response = client.post(reverse('inbox-batch'), [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_shared_inbox_stores_post_once_for_all_recipients(self):
+        other_user = User.objects.create_user(username='other', password='testpass')
+        other = Author.objects.create(user=other_user, host='http://testserver/api/', display_name='Other')
+        remote_author = Author.objects.create(
+            id=self.activity["author"]["id"].split("/authors/")[-1], host="http://peer-node.com/api/", display_name="Remote",
+        )
+        for reader in (self.reader, other):
+            Follows.objects.create(local_follower_id=reader, followed_id=remote_author, status='ACCEPTED')
+
+        shared = {"recipients": [self.reader.url, str(other.id)], "activity": self.activity}
+        response = self.client.post(reverse('shared-inbox'), shared, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        queued = Inbox.objects.get()
+        self.assertIsNone(queued.author)
+        self.assertEqual(sorted(queued.recipients), sorted([str(self.reader.id), str(other.id)]))
+
+        with patch('stream.inbox.handle_post_inbox', wraps=handle_post_inbox) as handler:
+            self.process_inbox()
+        handler.assert_called_once()
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(post_id=self.post_id).values_list('author_id', flat=True)), {self.reader.id, other.id}
+        )
+
+        # sent again, dropped
+        response = self.client.post(reverse('shared-inbox'), shared, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(INBOX_MAX_RECIPIENTS=2)
+    def test_shared_inbox_rejects_too_many_recipients(self):
+        recipients = [str(self.reader.id)] + [str(uuid.uuid4()) for _ in range(2)]
+        response = self.client.post(reverse('shared-inbox'), {"recipients": recipients, "activity": self.activity}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Inbox.objects.exists())
+
+    def test_shared_inbox_rejects_follows(self):
+        response = self.client.post(
+            reverse('shared-inbox'), {"recipients": [str(self.reader.id)], "activity": {"type": "follow"}}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Inbox.objects.exists())
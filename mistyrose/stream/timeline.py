@@ -0,0 +1,104 @@
+from users.models import Author, Follows
+from posts.models import Post
+from .models import TimelineEntry
+
+
+def get_post_readers(post):
+    """
+    Get the ids of the local authors allowed to see a post in their stream.
+    """
+    author = post.author_id
+    is_local_author = author.user_id is not None
+
+    if post.visibility == 'DELETED':
+        return set()
+
+    if post.visibility == 'PUBLIC' and is_local_author:
+        # public posts made on this node show up for every local author
+        return set(Author.objects.filter(user__isnull=False).values_list('id', flat=True))
+
+    # only local authors have a stream, remote followers get the post through their own node
+    followers_ids = set(
+        Follows.objects.filter(
+            followed_id=author, status='ACCEPTED', local_follower_id__user__isnull=False
+        ).values_list('local_follower_id', flat=True)
+    )
+
+    if post.visibility == 'FRIENDS':
+        following_ids = set(
+            Follows.objects.filter(local_follower_id=author, status='ACCEPTED').values_list('followed_id', flat=True)
+        )
+        readers = followers_ids.intersection(following_ids)
+    else:
+        # remote PUBLIC, UNLISTED and SHARED posts go to the author's followers
+        readers = followers_ids
+
+    # authors always see their own posts
+    if is_local_author:
+        readers.add(author.id)
+
+    return readers
+
+def fan_out_post(post):
+    """
+    Write (or remove) the stream rows of a post so that exactly the authors allowed to see it have it in their stream.
+    Called whenever a post is created or updated, locally or through the inbox.
+    """
+    readers = get_post_readers(post)
+
+    # remove the post from streams that are no longer allowed to see it (visibility changed or post deleted)
+    TimelineEntry.objects.filter(post=post).exclude(author_id__in=readers).delete()
+
+    # published is auto_now, keep existing rows in sync so edited posts move to the top of the stream
+    TimelineEntry.objects.filter(post=post).update(published=post.published)
+
+    existing_readers = set(TimelineEntry.objects.filter(post=post).values_list('author_id', flat=True))
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(author_id=reader_id, post=post, published=post.published)
+            for reader_id in readers - existing_readers
+        ],
+        ignore_conflicts=True,
+    )
+
+def sync_timeline(reader, author):
+    """
+    Bring reader's stream in line with the posts of author they are currently allowed to see.
+    """
+    # remote authors don't have a stream on this node
+    if reader.user_id is None:
+        return
+
+    visible_posts = Post.objects.filter(author_id=author).in_stream_of(reader).exclude(visibility='DELETED')
+
+    TimelineEntry.objects.filter(author=reader, post__author_id=author).exclude(post__in=visible_posts).delete()
+
+    posts = visible_posts.exclude(timeline_entries__author=reader)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(author=reader, post=post, published=post.published) for post in posts],
+        ignore_conflicts=True,
+    )
+
+def sync_follow_timelines(follower, followed):
+    """
+    Update the streams of both authors after a follow between them was accepted or removed.
+    """
+    # follows from remote authors we don't have locally only store remote_follower_url
+    if follower is None or followed is None:
+        return
+
+    # follower gains/loses followed's posts, and FRIENDS posts depend on the follow in both directions
+    sync_timeline(follower, followed)
+    sync_timeline(followed, follower)
+
+def rebuild_timeline(reader):
+    """
+    Rebuild the whole stream of a local author from scratch.
+    """
+    TimelineEntry.objects.filter(author=reader).delete()
+
+    posts = Post.objects.in_stream_of(reader).exclude(visibility='DELETED').only('id', 'published')
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(author=reader, post=post, published=post.published) for post in posts.iterator()],
+        batch_size=1000,
+    )
@@ -8,8 +8,10 @@ from django.contrib.contenttypes.models import ContentType
 
 from users.models import Author, Follows
 from node.models import Node
+from node.client import node_post
 from posts.models import Post, Comment, Like
 from .serializers import FollowSerializer
+from .timeline import fan_out_post, sync_follow_timelines
 from posts.serializers import PostSerializer, CommentSerializer, LikeSerializer
 
 def handle_follow_request(request, author):
@@ -77,8 +79,6 @@ def handle_follow_request(request, author):
       print(f"THIS IS THE REMOTE INBOX URL {remote_inbox_url}")
       parsed_url = urlparse(request.build_absolute_uri())
       host_with_scheme = f"{parsed_url.scheme}://{parsed_url.netloc}"
-      credentials = f"{node.remote_username}:{node.remote_password}"
-      base64_credentials = base64.b64encode(credentials.encode()).decode("utf-8")
       # 1. Send follow request to the remote node's inbox
       
       follow_request_payload = {
@@ -93,15 +93,15 @@ def handle_follow_request(request, author):
       print(f"REQUEST remote_inbox_url: {remote_inbox_url} host_with_scheme: {host_with_scheme} FUCK YOU: {follow_request_payload}")
       try:
           # Send POST request to the remote node
-          response = requests.post(
+          response = node_post(
+              node,
               remote_inbox_url,
             #   params={"host": host_with_scheme},
-              headers={"Authorization": f"Basic {base64_credentials}"},
               json=follow_request_payload,
           )
 
           print(f"THIS IS THE RESPONSE FROM THEIR INBOX {response}")
-          if response.status_code not in [200, 201]:
+          if response.status_code not in [200, 201, 202]:
               return Response({"error": f"Failed to send follow request to remote node {response}"}, status=status.HTTP_400_BAD_REQUEST)
       except requests.RequestException as e:
           return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -115,6 +115,7 @@ def handle_follow_request(request, author):
           status="ACCEPTED",
           is_remote=True  # Mark as a remote follow request
       )
+      sync_follow_timelines(local_follower, author)
 
       return Response({"message": "Follow request sent to remote node and accepted locally."}, status=status.HTTP_201_CREATED)
 
@@ -232,6 +233,7 @@ def handle_post_inbox(request, post_author, author_id):
       post.content_type = request.data.get("contentType")
       post.visibility = request.data.get("visibility")
       post.save()
+      fan_out_post(post)
       
       # Post already exists, return a message or existing post data
       return Response(
@@ -248,6 +250,7 @@ def handle_post_inbox(request, post_author, author_id):
           content_type=request.data.get("contentType"),
           visibility=request.data.get("visibility"),
       )
+      fan_out_post(post)
       serializer = PostSerializer(post)
       return Response(serializer.data, status=status.HTTP_201_CREATED)
 
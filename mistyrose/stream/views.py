@@ -6,8 +6,11 @@ from .serializers import FollowSerializer
 from users.models import Author, Follows
 from django.shortcuts import get_object_or_404
 from rest_framework import status  
-from .utils import handle_follow_request, handle_post_inbox, handle_comment_inbox, handle_like_inbox
-from users.utils import is_fqid
+from users.utils import resolve_fqid
+from node.models import Node
+from django.conf import settings
+from node.authentication import NodeAuthentication
+from .inbox import INBOX_TYPES, DEDUPLICATED_TYPES, apply_activity, enqueue_activity, get_activity_key, get_activity_object_key, is_duplicate_activity, queue_activities
 
 class InboxView(APIView):
     """
@@ -18,36 +21,62 @@ class InboxView(APIView):
         print("InboxView - POST - request.data: ", request.data, "author_id: ", author_id)
         try:
             # check if author_id is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_id):
-                author_id = urllib.parse.unquote(author_id)
-                if not author_id.endswith('/'):
-                    author_id += '/'
-                author_id = Author.objects.get(url=author_id).id
-                print("Author:",author_id)
+            author_id = resolve_fqid(Author, author_id)
+            print("Author:",author_id)
         except:
             return Response({"error": "InboxView - POST - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         
         object_type = request.data.get('type')
+        if object_type not in INBOX_TYPES:
+            return Response({"Error": f"What is a(n) {object_type}? I don't f with that, babe."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # peers send the same activity again (retries, replays), drop it before touching any model
+        activity_key = None
+        if isinstance(request.user, Node) and object_type in DEDUPLICATED_TYPES:
+            activity_key = get_activity_key(author_id, request.data)
+            if is_duplicate_activity(activity_key, get_activity_object_key(author_id, request.data), object_type):
+                return Response({"message": "Already got this one, babe."}, status=status.HTTP_200_OK)
+
         author = get_object_or_404(Author, id=author_id)
 
-        if object_type == "follow":
-            response = handle_follow_request(request, author)
-            return response
+        # other nodes don't wait for us to apply it, `python manage.py process_inbox` does it in the background
+        if isinstance(request.user, Node):
+            activity = enqueue_activity(request, author, object_type, activity_key)
+            return Response({"message": "Got it, babe. I'll get to it.", "id": str(activity.inbox_id)}, status=status.HTTP_202_ACCEPTED)
 
-        elif object_type == "post":
-            response = handle_post_inbox(request, author, author_id)
-            return response
-            
-        elif object_type == "comment":
-            response = handle_comment_inbox(request, author, author_id)
-        
-        elif object_type == "like":
-            response = handle_like_inbox(request, author, author_id)
-        
-        else:
-            return Response({"Error": f"What is a(n) {object_type}? I don't f with that, babe."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        return response
+        # our own users (follow requests from the frontend) get the result right away
+        return apply_activity(request, author, object_type)
+
+class InboxBatchView(APIView):
+    """
+    Many activities for our authors' inboxes in one request, for nodes fanning out to several of them:
+    [{"recipient": <author FQID or SERIAL>, "activity": {...}}, ...], an item can also be a shared inbox delivery ({"recipients": [...], ...}).
+    They are queued like activities sent one by one, all in one transaction. The response has a result per activity, in order.
+    """
+    authentication_classes = [NodeAuthentication]
+
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({"error": "InboxBatchView - POST - Send me a list of {recipient, activity}, babe."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.INBOX_BATCH_MAX_SIZE:
+            return Response({"error": f"InboxBatchView - POST - That's too many, babe. {settings.INBOX_BATCH_MAX_SIZE} at most."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({"results": queue_activities(request, items)}, status=status.HTTP_202_ACCEPTED)
+
+class SharedInboxView(APIView):
+    """
+    Node level inbox, one activity for many of our authors: {"recipients": [<author FQID or SERIAL>, ...], "activity": {...}}
+    It's stored and applied once (a post is linked to the stream of every author allowed to see it), instead of once per author.
+    """
+    authentication_classes = [NodeAuthentication]
+
+    def post(self, request):
+        if not isinstance(request.data, dict) or "recipients" not in request.data:
+            return Response({"error": "SharedInboxView - POST - Send me {recipients, activity}, babe."}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = queue_activities(request, [request.data])[0]
+        return Response(result, status=result["status"])
 
 class FollowRequests(APIView):
     """
@@ -56,11 +85,7 @@ class FollowRequests(APIView):
     def get(self, request, author_id):
         try:
             # check if author_id is a URL (FQID) or a uuid (SERIAL)
-            if is_fqid(author_id):
-                author_id = urllib.parse.unquote(author_id)
-                if not author_id.endswith('/'):
-                    author_id += '/'
-                author_id = Author.objects.get(url=author_id).id
+            author_id = resolve_fqid(Author, author_id)
         except:
             return Response({"error": "FollowRequests - GET - You didn't give me a valid FQID or SERIAL, babe."}, status=status.HTTP_400_BAD_REQUEST)
         author = get_object_or_404(Author, id=author_id)
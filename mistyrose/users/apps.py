@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from .utils import forget_fqid
+        from .authentication import forget_user_author
+        post_delete.connect(forget_fqid, sender=self.get_model('Author'), dispatch_uid='forget_author_fqid')
+        post_save.connect(forget_user_author, sender=self.get_model('Author'), dispatch_uid='forget_user_author_on_save')
+        post_delete.connect(forget_user_author, sender=self.get_model('Author'), dispatch_uid='forget_user_author_on_delete')
@@ -0,0 +1,80 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import Author
+
+
+class AuthorJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that loads the user and its Author in one query and attaches the author as request.author.
+    """
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is None:
+            return None
+
+        user = result[0]
+        # joined by get_user, reading it doesn't query (and a user without an author raises without querying)
+        try:
+            request.author = user.author
+        except Author.DoesNotExist:
+            request.author = None
+        return result
+
+    def get_user(self, validated_token):
+        # same checks as JWTAuthentication.get_user, with the author joined in
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = self.user_model.objects.select_related('author').get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+def get_request_author(request):
+    """
+    Author of the local user making the request, None for nodes, anonymous users and users without an author.
+    Free after AuthorJWTAuthentication, one query (once per request) for any other authentication.
+    """
+    user = request.user  # authenticates the request if it wasn't yet
+    if not hasattr(request, 'author'):
+        request.author = Author.objects.filter(user=user).first() if isinstance(user, User) else None
+    return request.author
+
+def get_user_author_cache_key(user_id):
+    return f"user_author:{user_id}"
+
+def get_user_author_id(user):
+    """
+    Id of the Author of a user, cached until the author is saved or deleted.
+    """
+    cache_key = get_user_author_cache_key(user.pk)
+    author_id = cache.get(cache_key)
+    if author_id is None:
+        author_id = Author.objects.filter(user=user).values_list('id', flat=True).first()
+        if author_id is not None:
+            cache.set(cache_key, author_id, None)
+    return author_id
+
+def forget_user_author(instance, **kwargs):
+    """
+    post_save/post_delete receiver for Author, drops its user's cached author id.
+    """
+    if instance.user_id is not None:
+        cache.delete(get_user_author_cache_key(instance.user_id))
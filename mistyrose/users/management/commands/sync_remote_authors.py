@@ -0,0 +1,34 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from node.models import Node
+from users.utils import sync_nodes_authors
+
+
+class Command(BaseCommand):
+    help = "Sync the authors of whitelisted remote nodes into the local Author table, writing only new or changed authors."
+
+    def add_arguments(self, parser):
+        parser.add_argument('nodes', nargs='*', help="Only sync these remote_node_urls")
+        parser.add_argument('--page-size', type=int, default=100, help="Authors requested per page")
+        parser.add_argument('--workers', type=int, default=settings.REMOTE_AUTHORS_SYNC_WORKERS, help="Nodes synced at the same time")
+        parser.add_argument('--loop', type=float, default=0, help="Keep running, syncing every LOOP seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            nodes = Node.objects.filter(is_whitelisted=True)
+            if options['nodes']:
+                nodes = nodes.filter(remote_node_url__in=[url.rstrip('/') for url in options['nodes']])
+
+            for node, result in sync_nodes_authors(nodes, options['workers'], page_size=options['page_size']):
+                if isinstance(result, Exception):
+                    self.stderr.write(f"Could not sync authors of {node.remote_node_url}: {result}")
+                    continue
+                created, updated, unchanged = result
+                self.stdout.write(f"{node.remote_node_url}: {created} new, {updated} changed, {unchanged} unchanged")
+
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -4,7 +4,7 @@ from django.db import models
 import uuid
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from users.utils import upload_to_imgur
+from users.utils import upload_to_imgur, normalize_host
 
 class Author(models.Model):
     # Each author will have a unique identifier (UUID).
@@ -20,11 +20,18 @@ class Author(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)  # Timestamp for when the author was created
     updated_at = models.DateTimeField(auto_now=True)  # Timestamp for when the author was last updated
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='author', null=True, blank=True)  # User object for the author
+    remote_hash = models.CharField(max_length=64, blank=True, default='')  # hash of the remote node's data for this author, set by sync_remote_authors
 
     def save(self, *args, **kwargs):
+        self.normalize()
+        super().save(*args, **kwargs)
+
+    def normalize(self):
+        """
+        Fill in and normalize the fields derived from host, also used for authors written in bulk (which skips save()).
+        """
         # normalize the host field
-        parsed_host = urlparse(self.host)
-        self.host = f"{parsed_host.scheme}://{parsed_host.netloc}/api/"
+        self.host = normalize_host(self.host)
         
         # if url is not provided, construct it from host and id (assume author is local)
         if not self.url:
@@ -42,9 +49,6 @@ class Author(models.Model):
         # add github link if not provided
         if not self.github:
             self.github = "https://github.com/"
-            
-        
-        super().save(*args, **kwargs)
         
     # @staticmethod
     # def is_valid_base64(value):
@@ -87,3 +91,10 @@ class Follows(models.Model):
 
     def __str__(self):
       return f'{self.local_follower_id} is following or has requested to follow {self.followed_id}'
+
+    class Meta:
+        indexes = [
+            # who an author follows / who follows an author, always filtered by status
+            models.Index(fields=['local_follower_id', 'status'], name='follows_follower_status_idx'),
+            models.Index(fields=['followed_id', 'status'], name='follows_followed_status_idx'),
+        ]
@@ -4,14 +4,28 @@ from rest_framework.test import APIClient
 from rest_framework import status
 from .models import Author, Follows
 from rest_framework.test import APITestCase
-from stream.models import Inbox  
 import uuid
+import requests
+import time
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import Author, Follows
 from posts.models import Post
+from node.models import Node
+from django.test import override_settings
+from unittest.mock import patch
+from io import StringIO
+from django.core.management import call_command
+from users.utils import save_remote_authors, resolve_fqid, _fqid_cache
+from django.core.cache import cache
+from posts.models import Comment
+import urllib.parse
+import base64
+import tempfile
+from io import BytesIO
+from PIL import Image
 
 class LoginViewTest(APITestCase):
     def setUp(self):
@@ -26,6 +40,17 @@ class LoginViewTest(APITestCase):
         self.assertIn('access_token', response.data)
         self.assertIn('refresh_token', response.data)
 
+    def test_login_author_id_is_cached(self):
+        cache.clear()
+        data = {"username": "testuser", "password": "testpass"}
+        self.client.post(self.url, data)
+        self.assertEqual(cache.get(f"user_author:{self.user.id}"), self.author.id)
+        # saving the author drops it
+        self.author.save()
+        self.assertIsNone(cache.get(f"user_author:{self.user.id}"))
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.data['author_id'], self.author.id)
+
     def test_login_invalid_credentials(self):
         data = {"username": "wronguser", "password": "wrongpass"}
         response = self.client.post(self.url, data)
@@ -48,6 +73,23 @@ class SignUpViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['displayName'], 'New User')
 
+    def test_signup_fills_the_stream_with_existing_public_posts(self):
+        old_user = User.objects.create_user(username='olduser', password='testpass')
+        old_author = Author.objects.create(user=old_user, display_name='Old User')
+        post = Post.objects.create(author_id=old_author, title='Before you came', content='hi', visibility='PUBLIC')
+        Post.objects.create(author_id=old_author, title='Friends only', content='hi', visibility='FRIENDS')
+
+        data = {
+            "username": "newuser",
+            "email": "newuser@example.com",
+            "password": "newpassword",
+            "displayName": "New User",
+        }
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        new_author = Author.objects.get(user__username='newuser')
+        self.assertEqual(list(new_author.timeline_entries.values_list('post_id', flat=True)), [post.id])
+
     def test_signup_username_exists(self):
         User.objects.create_user(username='newuser', password='testpass')
         data = {
@@ -98,6 +140,18 @@ class VerifyTokenViewTest(APITestCase):
         self.client.credentials(HTTP_AUTHORIZATION='Bearer invalidtoken')
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_author_is_loaded_with_the_user(self):
+        # the user and its author come back in the same query
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['authorId'], str(self.author.id))
+
+    def test_user_without_author(self):
+        user = User.objects.create_user(username='noauthor', password='testpass')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         
 class AuthorDetailViewTest(APITestCase):
     def setUp(self):
@@ -164,6 +218,28 @@ class AuthorProfileViewTest(APITestCase):
         self.assertEqual(len(response.data['friends_posts']), 1)
         self.assertEqual(len(response.data['unlisted_posts']), 1)
 
+    def test_author_profile_hides_friends_posts_from_strangers(self):
+        stranger_user = User.objects.create_user(username='stranger', password='testpass')
+        Author.objects.create(user=stranger_user, display_name='Stranger')
+        refresh = RefreshToken.for_user(stranger_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['public_posts']), 1)
+        self.assertEqual(len(response.data['friends_posts']), 0)
+        self.assertEqual(len(response.data['unlisted_posts']), 0)
+
+    def test_author_profile_shows_remote_public_posts_to_anyone(self):
+        remote_author = Author.objects.create(display_name='Remote', host='http://remote-node.com/api/')
+        Post.objects.create(author_id=remote_author, title='Remote public', content='hi', visibility='PUBLIC')
+        Post.objects.create(author_id=remote_author, title='Remote friends', content='hi', visibility='FRIENDS')
+
+        response = self.client.get(reverse('author-profile', kwargs={'pk': remote_author.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([post['title'] for post in response.data['public_posts']], ['Remote public'])
+        self.assertEqual(len(response.data['friends_posts']), 0)
+
     def test_author_profile_not_found(self):
         non_existing_uuid = uuid.uuid4()
         url = reverse('author-profile', kwargs={'pk': non_existing_uuid})
@@ -273,14 +349,6 @@ class FollowRequestTestCase(TestCase):
             status='PENDING'
         )
 
-        # Create Inbox entry
-        content_type = ContentType.objects.get_for_model(Follows)
-        self.inbox_entry = Inbox.objects.create(
-            author=self.author2,
-            content_type=content_type,
-            object_id=self.follow_request.id,
-            content_object=self.follow_request
-        )
 
         # Set the URL with author1.id as follower_id
         self.url = reverse('manage_follow_request', kwargs={
@@ -504,3 +572,195 @@ class AdminManagementTests(APITestCase):
         response = self.client.get("/api/authors/00000000-0000-0000-0000-000000000000/")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.data["detail"], "No Author matches the given query.")
+
+
+class GetRemoteAuthorsViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='testpass')
+        self.author = Author.objects.create(user=self.user, display_name='Viewer')
+        refresh = RefreshToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {refresh.access_token}')
+
+        self.fast_node = Node.objects.create(remote_node_url='http://fast-node.com', is_whitelisted=True)
+        self.fast_author_id = uuid.uuid4()
+
+    def test_view_serves_local_authors_without_calling_nodes(self):
+        Author.objects.create(id=self.fast_author_id, display_name='Fast Author', host='http://fast-node.com')
+
+        with patch('users.utils.fetch_node_authors_page') as mock_fetch:
+            response = self.client.get(reverse('all-authors'))
+
+        mock_fetch.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Fast Author', [author['displayName'] for author in response.data])
+
+
+class SyncRemoteAuthorsTest(TestCase):
+    def setUp(self):
+        self.node = Node.objects.create(remote_node_url='http://remote-node.com', is_whitelisted=True)
+        self.ids = [uuid.uuid4() for i in range(5)]
+        self.names = {author_id: f'Remote {i}' for i, author_id in enumerate(self.ids)}
+
+    def fake_pages(self, node, page=None, size=1000):
+        authors = [{
+            'type': 'author',
+            'id': f'http://remote-node.com/api/authors/{author_id}',
+            'host': 'http://remote-node.com/api/',
+            'displayName': self.names[author_id],
+            'page': f'http://remote-node.com/authors/{author_id}',
+            'github': '',
+            'profileImage': '',
+        } for author_id in self.ids]
+        # an author from another node that this node knows about
+        authors.append({'id': f'http://other-node.com/api/authors/{uuid.uuid4()}', 'host': 'http://other-node.com/api/', 'displayName': 'Other'})
+        start = (page - 1) * size
+        return authors[start:start + size] or None
+
+    def sync(self):
+        out = StringIO()
+        with patch('users.utils.fetch_node_authors_page', side_effect=self.fake_pages):
+            call_command('sync_remote_authors', '--page-size', '2', stdout=out)
+        return out.getvalue()
+
+    def test_sync_only_writes_new_or_changed_authors(self):
+        self.assertIn('5 new, 0 changed, 0 unchanged', self.sync())
+        self.assertEqual(Author.objects.filter(host='http://remote-node.com/api/').count(), 5)
+        self.assertFalse(Author.objects.filter(display_name='Other').exists())
+        author = Author.objects.get(id=self.ids[0])
+        self.assertEqual(author.url, f'http://remote-node.com/api/authors/{self.ids[0]}')
+        self.node.refresh_from_db()
+        self.assertIsNotNone(self.node.authors_synced_at)
+
+        self.names[self.ids[0]] = 'Renamed'
+        self.assertIn('0 new, 1 changed, 4 unchanged', self.sync())
+        self.assertEqual(Author.objects.get(id=self.ids[0]).display_name, 'Renamed')
+
+    def test_nodes_are_synced_at_the_same_time(self):
+        slow_node = Node.objects.create(remote_node_url='http://slow-node.com', is_whitelisted=True)
+        broken_node = Node.objects.create(remote_node_url='http://broken-node.com', is_whitelisted=True)
+
+        def slow_sync(node, page_size):
+            time.sleep(0.5)
+            if node == broken_node:
+                raise requests.ConnectionError('refused')
+            return 1, 0, 0
+
+        out, err = StringIO(), StringIO()
+        start = time.monotonic()
+        with patch('users.utils.sync_node_authors', side_effect=slow_sync):
+            call_command('sync_remote_authors', '--workers', '3', stdout=out, stderr=err)
+        self.assertLess(time.monotonic() - start, 1.0)
+
+        self.assertIn(f'{self.node.remote_node_url}: 1 new', out.getvalue())
+        self.assertIn(f'{slow_node.remote_node_url}: 1 new', out.getvalue())
+        self.assertIn(f'Could not sync authors of {broken_node.remote_node_url}', err.getvalue())
+
+    def test_bulk_upsert_in_chunks(self):
+        existing = Author.objects.create(id=uuid.uuid4(), display_name='Old name', host='http://remote-node.com')
+        authors_data = [{
+            'id': f'http://remote-node.com/api/authors/{author_id}',
+            'host': 'http://remote-node.com',
+            'displayName': f'Author {i}',
+        } for i, author_id in enumerate([existing.id] + [uuid.uuid4() for i in range(149)])]
+
+        # one upsert per chunk, no per-author queries
+        with self.assertNumQueries(3):
+            save_remote_authors(authors_data, chunk_size=50)
+
+        self.assertEqual(Author.objects.count(), 150)
+        existing.refresh_from_db()
+        self.assertEqual(existing.display_name, 'Author 0')
+        self.assertEqual(existing.host, 'http://remote-node.com/api/')
+        self.assertEqual(existing.page, f'http://remote-node.com/api/profile/{existing.id}/')
+
+    def test_bulk_upsert_saves_repeated_authors_once(self):
+        author_id = uuid.uuid4()
+        authors_data = [{
+            'id': f'http://remote-node.com/api/authors/{author_id}{slash}',
+            'host': 'http://remote-node.com',
+            'displayName': name,
+        } for name, slash in (('First copy', ''), ('Last copy', '/'))]
+
+        saved = save_remote_authors(authors_data)
+        self.assertEqual(len(saved), 1)
+        self.assertEqual(Author.objects.get(id=author_id).display_name, 'Last copy')
+
+@override_settings(IMAGE_DERIVATIVE_DIR=tempfile.mkdtemp())
+class AuthorProfileImageViewTest(APITestCase):
+    def setUp(self):
+        output = BytesIO()
+        Image.new('RGB', (400, 400), (10, 120, 200)).save(output, 'PNG')
+        data_url = f"data:image/png;base64,{base64.b64encode(output.getvalue()).decode()}"
+        self.author = Author.objects.create(display_name='Pictured', host='http://localhost:8000/api/', profile_image=data_url)
+
+    def test_base64_profile_image_is_resized(self):
+        response = self.client.get(f'/api/authors/{self.author.id}/profile/image/', {'w': 64, 'fmt': 'webp'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        with Image.open(BytesIO(b''.join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (64, 64))
+
+        # the variant is served from the cache, revalidated with its ETag
+        response = self.client.get(
+            f'/api/authors/{self.author.id}/profile/image/', {'w': 64, 'fmt': 'webp'}, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_url_profile_image_is_redirected(self):
+        self.author.profile_image = 'https://i.imgur.com/abc.png'
+        self.author.save()
+
+        response = self.client.get(f'/api/authors/{self.author.id}/profile/image/')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], 'https://i.imgur.com/abc.png')
+
+    def test_profile_image_on_unknown_host_is_not_redirected(self):
+        for profile_image in ('https://evil.example.com/abc.png', 'javascript:alert(1)', '//evil.example.com/abc.png'):
+            self.author.profile_image = profile_image
+            self.author.save()
+            response = self.client.get(f'/api/authors/{self.author.id}/profile/image/')
+            self.assertEqual(response.status_code, 404)
+
+        Node.objects.create(remote_node_url='https://evil.example.com')
+        self.author.profile_image = 'https://evil.example.com/abc.png'
+        self.author.save()
+        response = self.client.get(f'/api/authors/{self.author.id}/profile/image/')
+        self.assertEqual(response.status_code, 302)
+
+class ResolveFqidTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        _fqid_cache.clear()
+        self.author = Author.objects.create(display_name='Resolved', host='http://localhost:8000/api/')
+        self.post = Post.objects.create(author_id=self.author, title='Resolved post', content='hi')
+
+    def test_fqid_costs_no_query_after_first_lookup(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_fqid(Post, self.post.url), self.post.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_fqid(Post, self.post.url), self.post.id)
+            # same FQID quoted and without the trailing slash
+            self.assertEqual(resolve_fqid(Post, urllib.parse.quote(self.post.url.rstrip('/'), safe=':/')), self.post.id)
+
+    def test_shared_cache_is_used_by_other_processes(self):
+        resolve_fqid(Author, self.author.url)
+        # another process starts with an empty in-process cache
+        _fqid_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_fqid(Author, self.author.url), self.author.id)
+
+    def test_serial_is_returned_as_it_is(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_fqid(Author, str(self.author.id)), str(self.author.id))
+
+    def test_delete_invalidates(self):
+        comment = Comment.objects.create(author_id=self.author, post_id=self.post, comment='bye')
+        self.assertEqual(resolve_fqid(Comment, comment.url), comment.id)
+        resolve_fqid(Post, self.post.url)
+
+        # deleting the post cascades to the comment, both are forgotten
+        self.post.delete()
+        with self.assertRaises(Post.DoesNotExist):
+            resolve_fqid(Post, self.post.url)
+        with self.assertRaises(Comment.DoesNotExist):
+            resolve_fqid(Comment, comment.url)
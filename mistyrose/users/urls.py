@@ -12,7 +12,8 @@ from .views import (
     FollowersDetailView,
     FriendsView,
     FollowingDetailView,
-    GetRemoteAuthorsView
+    GetRemoteAuthorsView,
+    AuthorProfileImageView
 )
 
 urlpatterns = [
@@ -26,6 +27,7 @@ urlpatterns = [
     path('authors/<str:username>/upload_image/', ProfileImageUploadView.as_view(), name='upload-profile-image'),
    
     path('api/authors/<uuid:pk>/profile/edit/', AuthorEditProfileView.as_view(), name='author-edit-profile'),  # Edit author profile
+    path('api/authors/<uuid:pk>/profile/image/', AuthorProfileImageView.as_view(), name='author-profile-image'),  # Resized profile image
     path('api/authors/<uuid:pk>/profile/', AuthorProfileView.as_view(), name='author-profile'),  # Author profile view
     path('api/authors/<uuid:pk>/followers/', FollowersDetailView.as_view(), name='author-followers'),  # Followers endpoint
     path('api/authors/<uuid:pk>/friends/', FriendsView.as_view(), name='author-friends'),  # Friends endpoint
@@ -3,140 +3,193 @@ import uuid
 import requests
 import base64
 from node.models import Node
+from node.client import node_get
 from django.conf import settings
+from django.utils import timezone
+import hashlib
+from functools import lru_cache
+import json
+from collections import OrderedDict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import connection
+from urllib.parse import unquote
+from django.core.cache import cache
 
-def get_remote_authors(request):
+def fetch_node_authors_page(node, page=None, size=1000):
     """
-    Get authors from remote nodes and save them to the local database if not already created.
+    Get one page of a remote node's /api/authors/ listing, as returned by the node.
+    Returns None past the last page.
+    """
+    # endpoint to get authors from remote node    
+    authors_remote_endpoint = f"{node.remote_node_url.rstrip('/')}/api/authors/"
+    params = {"size": size}
+    if page is not None:
+        params["page"] = page
+
+    # pooled session with the node's credentials, see node/client.py
+    response = node_get(node, authors_remote_endpoint, params=params)
+    if response.status_code == 404 and page and page > 1:
+        # DRF page number pagination answers 404 past the last page
+        return None
+    if response.status_code != 200:
+        raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+    return response.json()["authors"]
+
+def is_node_author(node, author_data):
+    # get host from author id
+    # for example: https://cmput404-group-project.herokuapp.com/authors/1
+    # host = https://cmput404-group-project.herokuapp.com
+    return author_data['id'].rstrip('/').split("/api/authors")[0] == node.remote_node_url.rstrip('/')
+
+# fields of an Author that come from its remote node, the rest (user, created_at) is ours
+REMOTE_AUTHOR_FIELDS = ['url', 'host', 'display_name', 'github', 'profile_image', 'page', 'remote_hash', 'updated_at']
+
+@lru_cache(maxsize=1024)
+def normalize_host(host):
+    """
+    Normalize a host to <scheme>://<netloc>/api/ (cached, a sync sees the same few hosts thousands of times).
+    """
+    parsed_host = urlparse(host)
+    return f"{parsed_host.scheme}://{parsed_host.netloc}/api/"
+
+def get_author_id(author_data):
+    """
+    Get the uuid from an author FQID, assuming the id is in the format <host>/authors/<id>. None if it isn't a uuid.
+    """
+    author_id = author_data['id'].rstrip('/').split("/authors/")[-1]
+    return uuid.UUID(author_id) if is_valid_uuid(author_id) else None
+
+def build_remote_author(author_data):
+    """
+    Build (without saving) the local copy of a remote author.
     """
-  
     from users.models import Author
-    
-    remote_authors = []
-    failed_nodes_urls = []
-    
+
+    author = Author(
+        id=get_author_id(author_data),
+        url=author_data['id'],
+        host=author_data['host'],
+        display_name=author_data['displayName'],
+        github=author_data.get('github', ''),
+        profile_image=author_data.get('profileImage', ''),
+        page=author_data.get('page', ''),
+        remote_hash=get_author_data_hash(author_data),
+        updated_at=timezone.now(),
+    )
+    author.normalize()
+    return author
+
+def save_remote_authors(authors_data, chunk_size=500):
+    """
+    Create or update the local copies of remote authors, as one INSERT ... ON CONFLICT DO UPDATE per chunk.
+    An author listed more than once is saved once, from its last copy (Postgres refuses to update a row twice in one upsert).
+    """
+    from users.models import Author
+
+    remote_authors = {}
+    for author_data in authors_data:
+        if get_author_id(author_data):
+            author = build_remote_author(author_data)
+            remote_authors[author.id] = author
+    remote_authors = list(remote_authors.values())
+    for i in range(0, len(remote_authors), chunk_size):
+        Author.objects.bulk_create(
+            remote_authors[i:i + chunk_size],
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=REMOTE_AUTHOR_FIELDS,
+        )
+    return remote_authors
+
+def get_author_data_hash(author_data):
+    """
+    Hash of the fields we keep from a remote author, to tell whether anything changed since the last sync.
+    """
+    fields = [author_data['id'], author_data.get('host'), author_data.get('displayName'),
+              author_data.get('github'), author_data.get('profileImage'), author_data.get('page')]
+    return hashlib.sha256(json.dumps(fields).encode()).hexdigest()
+
+def sync_node_authors(node, page_size=100):
+    """
+    Page through a node's author listing and write only the authors that are new or changed since the last sync.
+    Returns (created, updated, unchanged) counts.
+    """
+    from users.models import Author
+
+    created = updated = unchanged = 0
+    seen_ids = set()
+    page = 1
+    while True:
+        page_data = fetch_node_authors_page(node, page=page, size=page_size)
+        if not page_data:
+            break
+
+        page_authors = {}
+        for author_data in page_data:
+            author_id = get_author_id(author_data)
+            if author_id:
+                page_authors[author_id] = author_data
+
+        # some nodes ignore ?page= and send the same list every time
+        if page_authors and page_authors.keys() <= seen_ids:
+            break
+        seen_ids.update(page_authors)
+        authors = {
+            author_id: author_data for author_id, author_data in page_authors.items() if is_node_author(node, author_data)
+        }
+
+        existing_hashes = dict(Author.objects.filter(id__in=authors).values_list('id', 'remote_hash'))
+        changed = [
+            author_data for author_id, author_data in authors.items()
+            if existing_hashes.get(author_id) != get_author_data_hash(author_data)
+        ]
+        save_remote_authors(changed)
+
+        new_authors = sum(1 for author_data in changed if get_author_id(author_data) not in existing_hashes)
+        created += new_authors
+        updated += len(changed) - new_authors
+        unchanged += len(authors) - len(changed)
+
+        if len(page_data) < page_size:
+            break
+        page += 1
+
+    node.authors_synced_at = timezone.now()
+    node.save(update_fields=['authors_synced_at'])
+    return created, updated, unchanged
+
+def try_sync_node_authors(node, page_size):
+    """
+    sync_node_authors, returning the error (a node that is down, or answers garbage) instead of raising it.
+    """
     try:
-        # get authors for each remote node
-        for node in Node.objects.filter(is_whitelisted=True):
-            
-            # endpoint to get authors from remote node    
-            authors_remote_endpoint = f"{node.remote_node_url.rstrip('/')}/api/authors/"
-            # authors_remote_endpoint = f"{node.remote_node_url.rstrip('/')}/api/authors/all"
-            print(f"INSIDE GET_REMOTE_AUTHORS: {authors_remote_endpoint}")
-            
-            # my local node's host with scheme
-            parsed_url = urlparse(request.build_absolute_uri())
-            print(f"INSIDE GET_REMOTE_AUTHORS PARSED URL: {parsed_url}")
-            host_with_scheme = f"{parsed_url.scheme}://{parsed_url.netloc}"
-            
-            # credentials to access remote node (encoded in base64)
-            credentials = f"{node.remote_username}:{node.remote_password}"
-            base64_credentials = base64.b64encode(credentials.encode()).decode("utf-8")
-            
-            # make the request
-            response = requests.get(
-                authors_remote_endpoint,
-                # params={"host": host_with_scheme},
-                headers={"Authorization": f"Basic {base64_credentials}"},
-                params={"size": 1000}
-            )
-            
-            
-            print(f"GET REMOTE AUTHORS RESPONSE {response}")
-            
-            # if response.status_code == 200:                
-            #     authors_data = response.json()
-                
-            #     # get usernames from authors_data
-            #     displayNames = [author['displayName'] for author in authors_data]
-            #     print(f"THE DISPLAY NAMES IN GET REMOTE AUTHORS ALL IS {displayNames}")
-                
-            #     for author_data in authors_data:
-            #         # get host from author id
-            #         # for example: https://cmput404-group-project.herokuapp.com/authors/1
-            #         # host = https://cmput404-group-project.herokuapp.com
-            #         host = author_data['id'].rstrip('/').split("/api/authors")[0] + "/api"
-            #         print(f"host: {host.strip('/api')}, node.remote_node_url: {node.remote_node_url.rstrip('/')}")
-            #         if author_data['id'].rstrip('/').split("/api/authors")[0] != node.remote_node_url.rstrip('/'):
-            #             # skip if author is not from the this node
-            #             continue
-                    
-            #         # get author id
-            #         # - assuming the id is in the format: <host>/authors/<id>
-            #         author_id = author_data['id'].rstrip('/').split("/authors/")[-1]
-            #         print(f"author_data['id']: {author_data['id']}")
-            #         print(f"GET REMOTE AUTHORS AUTHOR ID {author_id}")
-                    
-                    
-            #         # get remote author
-            #         # - if author doesn't exist, create it
-            #         # - if author does exist, update it
-            #         if author_id and is_valid_uuid(author_id):
-            #             author, created = Author.objects.get_or_create(id=author_id)
-            #             print(f"THE AUTHOR OBJECT IN GET REMOTE AUTHORS IS {author}")
-            #             author.url = author_data['id']
-            #             author.host = author_data['host']
-            #             author.display_name = author_data['displayName']
-            #             author.github = author_data.get('github', '')
-            #             author.profile_image = author_data.get('profileImage', '')
-            #             author.page = author_data['page']
-            #             author.save()
-
-            #             remote_authors.append(author)
-            
-
-            if response.status_code == 200:
-                print(f"THE AUTHOR DATA IN GET REMOTE AUTHORS IS {response.json()}")
-                authors_erm = response.json()["authors"]
-                print(f"THE AUTHOR DATA JUST AUTHORS IN GET REMOTE AUTHORS IS {authors_erm}")
-                    
-                authors_data = response.json()["authors"]
-                
-                for author_data in authors_data:
-                    # get host from author id
-                    # for example: https://cmput404-group-project.herokuapp.com/authors/1
-                    # host = https://cmput404-group-project.herokuapp.com
-                    host = author_data['id'].rstrip('/').split("/api/authors")[0] + "/api"
-                    print(f"host: {host.strip('/api')}, node.remote_node_url: {node.remote_node_url.rstrip('/')}")
-                    if author_data['id'].rstrip('/').split("/api/authors")[0] != node.remote_node_url.rstrip('/'):
-                        # skip if author is not from the this node
-                        continue
-                    
-                    # get author id
-                    # - assuming the id is in the format: <host>/authors/<id>
-                    author_id = author_data['id'].rstrip('/').split("/authors/")[-1]
-                    print(f"author_data['id']: {author_data['id']}")
-                    print(f"GET REMOTE AUTHORS AUTHOR ID {author_id}")
-                    
-                    
-                    # get remote author
-                    # - if author doesn't exist, create it
-                    # - if author does exist, update it
-                    if author_id and is_valid_uuid(author_id):
-                        author, created = Author.objects.get_or_create(id=author_id)
-                        print(f"THE AUTHOR OBJECT IN GET REMOTE AUTHORS IS {author}")
-                        author.url = author_data['id']
-                        author.host = author_data['host']
-                        author.display_name = author_data['displayName']
-                        author.github = author_data.get('github', '')
-                        author.profile_image = author_data.get('profileImage', '')
-                        author.page = author_data['page']
-                        author.save()
-
-                        remote_authors.append(author)
-            else:
-                failed_nodes_urls.append([node.remote_node_url, response.status_code])
-                continue
-            
-        # show failed nodes
-        if failed_nodes_urls:
-            print(f"Could not get remote author(s) from these nodes: {failed_nodes_urls}")
-        
-        print(f"Got remote authors successfully: {remote_authors}")
-        return remote_authors   
-    except Exception as e:
-        print(f"Could not get remote authors due to error: {e}")
-        raise e
+        return sync_node_authors(node, page_size=page_size)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        return e
+
+def try_sync_node_authors_in_thread(node, page_size):
+    try:
+        return try_sync_node_authors(node, page_size)
+    finally:
+        connection.close()
+
+def sync_nodes_authors(nodes, workers, page_size=100):
+    """
+    Sync the authors of many nodes, up to workers nodes at a time so one slow node doesn't hold up the others.
+    Yields (node, (created, updated, unchanged) or the error that stopped its sync) as each node finishes.
+    """
+    nodes = list(nodes)
+    if workers <= 1 or len(nodes) <= 1:
+        for node in nodes:
+            yield node, try_sync_node_authors(node, page_size)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(nodes)), thread_name_prefix='author-sync') as executor:
+        futures = {executor.submit(try_sync_node_authors_in_thread, node, page_size): node for node in nodes}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
 
 def is_fqid(value):
     """
@@ -154,6 +207,61 @@ def is_fqid(value):
     except ValueError as e:
         print(f"error: {e}")
         return False
+
+# FQID -> primary key, most recently used last: cache key -> (pk, expires at)
+# - in front of the shared Django cache, entries expire quickly so deletes made by other processes are seen
+_fqid_cache = OrderedDict()
+_fqid_cache_lock = threading.Lock()
+
+def get_fqid_cache_key(model, url):
+    return f"fqid:{model._meta.label_lower}:{hashlib.sha1(url.encode()).hexdigest()}"
+
+def normalize_fqid(value):
+    url = unquote(str(value))
+    if not url.endswith('/'):
+        url += '/'
+    return url
+
+def resolve_fqid(model, value):
+    """
+    Primary key of the object of model (Author, Post, Comment, Like) identified by value, which is either its FQID
+    (url, quoted or not, with or without the trailing /) or already its SERIAL, returned as it is.
+    Raises model.DoesNotExist for an unknown FQID. After the first lookup an FQID costs no query.
+    """
+    if not is_fqid(value):
+        return value
+
+    url = normalize_fqid(value)
+    key = get_fqid_cache_key(model, url)
+    now = time.monotonic()
+    with _fqid_cache_lock:
+        cached = _fqid_cache.get(key)
+        if cached is not None and cached[1] > now:
+            _fqid_cache.move_to_end(key)
+            return cached[0]
+
+    pk = cache.get(key)
+    if pk is None:
+        pk = model.objects.values_list('pk', flat=True).get(url=url)
+        cache.set(key, pk, settings.FQID_CACHE_TIMEOUT)
+
+    with _fqid_cache_lock:
+        _fqid_cache[key] = (pk, now + settings.FQID_LOCAL_CACHE_TIMEOUT)
+        _fqid_cache.move_to_end(key)
+        while len(_fqid_cache) > settings.FQID_LOCAL_CACHE_SIZE:
+            _fqid_cache.popitem(last=False)
+    return pk
+
+def forget_fqid(sender, instance, **kwargs):
+    """
+    post_delete receiver dropping the cached primary key of a deleted object (connected in the apps' ready()).
+    """
+    if not instance.url:
+        return
+    key = get_fqid_cache_key(sender, normalize_fqid(instance.url))
+    cache.delete(key)
+    with _fqid_cache_lock:
+        _fqid_cache.pop(key, None)
     
 def upload_to_imgur(image_data):
     """
@@ -2,6 +2,7 @@ from urllib.parse import urlparse
 from django.shortcuts import render
 import os
 from node.authentication import NodeAuthentication
+from node.models import Node
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status, generics
@@ -12,7 +13,6 @@ from rest_framework.views import APIView
 from rest_framework.generics import ListAPIView  
 from rest_framework.permissions import IsAuthenticated, AllowAny  
 from rest_framework_simplejwt.tokens import RefreshToken  
-from rest_framework_simplejwt.authentication import JWTAuthentication  
 from django.contrib.auth.models import User  
 from django.db import transaction  
 from rest_framework.reverse import reverse 
@@ -23,16 +23,21 @@ import uuid
 from posts.models import Post  
 from django.middleware.csrf import get_token  
 from django.contrib.auth import authenticate  
-from django.http import HttpRequest
+from django.http import HttpRequest, HttpResponseRedirect
+from django.utils.http import url_has_allowed_host_and_scheme
+import hashlib
+from posts.blobs import decode_base64_image
+from posts.images import derivative_response
 from .pagination import AuthorsPagination  
-from posts.serializers import PostSerializer  
+from posts.serializers import PostSerializer, PostListSerializer  
 from uuid import UUID 
-from users.utils import get_remote_authors
+from stream.timeline import sync_follow_timelines, rebuild_timeline
 from urllib.parse import urlparse
 from rest_framework.exceptions import NotFound
 import urllib.parse
 
 from .utils import is_fqid, upload_to_imgur
+from .authentication import AuthorJWTAuthentication, get_request_author, get_user_author_id
 
 # Default profile picture URL to be used when no image is provided
 DEFAULT_PROFILE_PIC = "https://cdn.pixabay.com/photo/2015/10/05/22/37/blank-profile-picture-973460_960_720.png"
@@ -76,7 +81,7 @@ class LoginView(APIView):
         if not user.is_active:  # Check if the user is active
             return Response({"error": "User account is not activated. Please contact an admin."}, status=status.HTTP_403_FORBIDDEN)
         
-        author_id = Author.objects.get(user=user).id  # Fetch the associated Author ID
+        author_id = get_user_author_id(user)  # Fetch the associated Author ID (cached)
         refresh = RefreshToken.for_user(user)  # Generate JWT refresh token for the user
         access_token = str(refresh.access_token)  # Get the access token from the refresh token
         
@@ -162,6 +167,8 @@ class SignUpView(APIView):
                     "github": github,
                 }
                 author = create_author(author_data, request, user)  # Call create_author to create the author
+                # fill the new author's stream with the local public posts made before they joined
+                rebuild_timeline(author)
                 
                 # Serialize the author data to return it in the response
                 serializer = AuthorSerializer(author, context={"request": request})
@@ -188,16 +195,15 @@ class LogoutView(APIView):
 
 # View for verifying if a JWT token is still valid
 class VerifyTokenView(APIView):
-    authentication_classes = [JWTAuthentication]  # Use JWT for authentication
+    authentication_classes = [AuthorJWTAuthentication]  # Use JWT for authentication, loads the author with the user
     permission_classes = [IsAuthenticated]  # User must be authenticated
 
     def get(self, request):
-        try:
-            # Get the Author object associated with the user
-            author = Author.objects.get(user=request.user)
-            return Response({'authorId': str(author.id)}, status=200)  # Return the author's ID if found
-        except Author.DoesNotExist:  # Return error if the author does not exist
+        # Get the Author object associated with the user
+        author = get_request_author(request)
+        if author is None:  # Return error if the author does not exist
             return Response({'error': 'Author not found'}, status=404)
+        return Response({'authorId': str(author.id)}, status=200)  # Return the author's ID if found
 
 # View to retrieve a specific author's details using the author ID (primary key)
 class AuthorDetailView(generics.RetrieveAPIView):
@@ -303,11 +309,12 @@ class AuthorProfileView(APIView):
         """Retrieve the count of authors that the user is following with accepted follow requests."""
         return Follows.objects.filter(local_follower_id=author, status='ACCEPTED').count()
 
-    def get_author_posts(self, author, visibility):
-        """Retrieve posts by visibility and serialize them."""
-        return PostSerializer(
-            Post.objects.filter(author_id=author, visibility=visibility).order_by('-published'), many=True
-        ).data
+    def get_author_posts(self, author, visibility, viewer=None):
+        """Retrieve posts by visibility that the viewer is allowed to see and serialize them."""
+        posts = Post.objects.filter(author_id=author, visibility=visibility)
+        if viewer is not None:
+            posts = posts.visible_to(viewer)
+        return PostListSerializer(posts.with_related().order_by('-published'), many=True).data
 
     def get(self, request, pk):
         pk = str(pk)
@@ -326,14 +333,17 @@ class AuthorProfileView(APIView):
         # Serialize author data
         author_data = AuthorSerializer(author).data
         
+        # local authors only get the posts they are allowed to see, remote nodes filter on their side
+        viewer = get_request_author(request)
+
         # Gather counts and categorized posts
         friends_count = self.get_friends_count(request, pk=pk)
         followers_count = self.get_follower_count(author)
         following_count = self.get_following_count(author)
-        public_posts = self.get_author_posts(author, 'PUBLIC')
-        friends_posts = self.get_author_posts(author, 'FRIENDS')
-        unlisted_posts = self.get_author_posts(author, 'UNLISTED')
-        shared_posts = self.get_author_posts(author, 'SHARED')
+        public_posts = self.get_author_posts(author, 'PUBLIC', viewer)
+        friends_posts = self.get_author_posts(author, 'FRIENDS', viewer)
+        unlisted_posts = self.get_author_posts(author, 'UNLISTED', viewer)
+        shared_posts = self.get_author_posts(author, 'SHARED', viewer)
         
         # Prepare the response data
         data = {
@@ -396,7 +406,7 @@ class AuthorEditProfileView(APIView):
 
 
 class AuthorsView(ListAPIView): #used ListAPIView because this is used to handle a collection of model instances AND comes with pagination
-    authentication_classes = [NodeAuthentication, JWTAuthentication]
+    authentication_classes = [NodeAuthentication, AuthorJWTAuthentication]
     #asked chatGPT how to get the authors using ListAPIView 2024-10-18
     # variables that ListAPIView needs
     # only get authors on our own node
@@ -429,10 +439,7 @@ class GetRemoteAuthorsView(APIView):
     #authentication_classes = [NodeAuthentication, JWTAuthentication]
     def get(self, request): 
         try:
-            # Retrieve all profiles on the node (paginated)
-            get_remote_response = get_remote_authors(request)  # This saves them to the database
-            print(f"GET REMOVE AUTHORS RESPONSE {get_remote_response}")
-            
+            # remote authors are kept up to date by `manage.py sync_remote_authors`, no calls to other nodes here
             # Fetch all authors from the database
             all_authors = Author.objects.all()
             print(f"ALL AUTHORS {all_authors}")
@@ -491,6 +498,7 @@ class FollowerView(APIView):
         # update status to "ACCEPTED"
         follow_request.status = 'ACCEPTED'
         follow_request.save()
+        sync_follow_timelines(follow_request.local_follower_id, follow_request.followed_id)
         
         return Response({"status": "Follow request accepted"}, status=status.HTTP_200_OK)
 
@@ -507,6 +515,7 @@ class FollowerView(APIView):
         
         # delete follow_request
         follow_request.delete()
+        sync_follow_timelines(follow_request.local_follower_id, follow_request.followed_id)
 
         # second confirm whether the request has been deleted
         if Follows.objects.filter(id=follow_request.id).exists():
@@ -534,6 +543,7 @@ class UnfollowView(APIView):
             
             # delete follow relationship
             follow.delete()
+            sync_follow_timelines(follow.local_follower_id, follow.followed_id)
             return Response({'message': 'Successfully unfollowed the author.'}, status=200)
         
         except Follows.DoesNotExist:
@@ -619,7 +629,9 @@ class FriendsView(APIView):
 
     def get(self, request, pk=None):
         # Get the current logged-in user (Author instance)
-        current_user = get_object_or_404(Author, user=request.user)
+        current_user = get_request_author(request)
+        if current_user is None:
+            raise NotFound("No Author matches the given query.")
 
         # Check if an author_id is provided, else use the current logged-in user as the viewed author
         if pk:
@@ -725,4 +737,39 @@ class ProfileImageUploadView(APIView):
     #     """
     #     protocol = 'https' if request.is_secure() else 'http'
     #     host = request.get_host()  # This gives the hostname and port (if not default)
-    #     return f'{protocol}://{host}'
\ No newline at end of file
+    #     return f'{protocol}://{host}'
+
+class AuthorProfileImageView(APIView):
+    """
+    Profile image of an author, resized with ?w=<width>&fmt=<webp|jpeg|png> (see posts/images.py).
+    Base64 profile images are decoded once and their variants cached, profile images that are urls are redirected to
+    if they're http(s) on a host we know (ours, our nodes' or PROFILE_IMAGE_HOSTS).
+    """
+    permission_classes = [AllowAny]
+
+    def get_allowed_hosts(self, request):
+        hosts = {request.get_host(), *settings.PROFILE_IMAGE_HOSTS}
+        hosts.update(urlparse(url).netloc for url in Node.objects.values_list('remote_node_url', flat=True))
+        return hosts
+
+    def get(self, request, pk):
+        author = get_object_or_404(Author, pk=pk)
+        profile_image = author.profile_image or ''
+
+        if not profile_image.startswith('data:image/'):
+            if not profile_image:
+                return Response({'detail': 'This author has no profile image'}, status=status.HTTP_404_NOT_FOUND)
+            # not an open redirect to wherever an author's profile says
+            if not url_has_allowed_host_and_scheme(profile_image, self.get_allowed_hosts(request)):
+                return Response({'detail': "I don't redirect there, babe."}, status=status.HTTP_404_NOT_FOUND)
+            return HttpResponseRedirect(profile_image)
+
+        # variants are keyed by the hash of the base64 text, so they're found again without decoding it
+        key = hashlib.sha256(profile_image.encode()).hexdigest()
+        content_type = profile_image[len('data:'):].split(';')[0].split(',')[0]
+        try:
+            return derivative_response(
+                request, key, lambda: decode_base64_image(profile_image), content_type, 'public, no-cache'
+            )
+        except ValueError as e:
+            return Response({"error": f"AuthorProfileImageView - GET - {e}, babe."}, status=status.HTTP_400_BAD_REQUEST)